@@ -25,7 +25,7 @@ class AlgorithmIGt:
     def IGt(self):
         objective = self.datasetmatrix.get_variable('Y', self.objective_index)
 
-        (sample_count, feature_count) = self.datasetmatrix.X.get_shape()
+        (sample_count, feature_count) = self.datasetmatrix.X.shape
         IG_per_feature = []
 
         for feature_index in range(feature_count):
@@ -43,7 +43,7 @@ class AlgorithmIGt:
 
 
 def algorithm_IGt__binary(datasetmatrix, parameters):
-    (sample_count, feature_count) = datasetmatrix.X.get_shape()
+    (sample_count, feature_count) = datasetmatrix.X.shape
     Q = parameters['Q']
     objective_vector = datasetmatrix.get_column_Y(parameters['objective_index'])
     IG_per_feature = []
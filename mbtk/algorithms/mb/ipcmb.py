@@ -28,7 +28,7 @@ class AlgorithmIPCMB:
         try:
             self.U = set(self.parameters['all_variables'])
         except KeyError:
-            self.U = set(range(self.datasetmatrix.X.get_shape()[1]))
+            self.U = set(range(self.datasetmatrix.X.shape[1]))
 
         # self.CITest is the test of conditional independence. It must have a
         # method called `conditionally_independent` that receives three
@@ -72,15 +72,15 @@ class BinaryExperimentalDataset(ModelBuildingExperimentalDataset):
 
     def thresholded_columns_to_remove(self, datasetmatrix, matrix_label, thresholds):
         (pmin, pmax) = thresholds
-        (row_count, column_count) = datasetmatrix.get_matrix(matrix_label).get_shape()
+        matrix = datasetmatrix.get_matrix(matrix_label)
+        row_count = matrix.shape[0]
         column_labels = datasetmatrix.get_column_labels(matrix_label)
-        columns_to_remove = {}
-        for c in range(column_count):
-            column = datasetmatrix.get_column(matrix_label, c)
-            p = numpy.sum(column) / row_count
-            if p < pmin or p > pmax:
-                columns_to_remove[c] = column_labels[c]
-
-        return columns_to_remove
+
+        # The probability of 1 in each column, from the sums of all the
+        # columns at once.
+        p = numpy.asarray(matrix.sum(axis=0, dtype=numpy.float64)).ravel() / row_count
+        columns_to_remove = numpy.flatnonzero((p < pmin) | (p > pmax))
+
+        return {c: column_labels[c] for c in columns_to_remove.tolist()}
 
 
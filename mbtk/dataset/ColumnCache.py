@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+
+class ColumnCache:
+    """
+    A bounded cache of dense columns, retrieved from the sparse matrices of a
+    :py:class:`DatasetMatrix`. The columns are keyed by the label of their
+    matrix and their index, and the least recently used columns are evicted
+    once the total size of the cached columns exceeds ``max_size`` bytes. A
+    ``max_size`` of 0 disables the cache.
+
+    The cached columns are returned as read-only arrays, because the same
+    array is shared by every caller which requests the column.
+
+    :var hits: The number of requests served from the cache.
+    :var misses: The number of requests for columns not found in the cache.
+    :var evictions: The number of columns evicted to respect ``max_size``.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.columns = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def __len__(self):
+        return len(self.columns)
+
+
+    def __contains__(self, key):
+        return key in self.columns
+
+
+    def get(self, key, densify):
+        """
+        Return the cached column for ``key``, or call ``densify()`` to create
+        it, then cache it if it fits.
+        """
+        try:
+            column = self.columns[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self.columns.move_to_end(key)
+            return column
+
+        self.misses += 1
+        column = densify()
+        if column.nbytes <= self.max_size:
+            column.flags.writeable = False
+            self.columns[key] = column
+            self.size += column.nbytes
+            self.evict(self.max_size)
+        return column
+
+
+    def evict(self, max_size):
+        while self.size > max_size:
+            (_, column) = self.columns.popitem(last=False)
+            self.size -= column.nbytes
+            self.evictions += 1
+
+
+    def resize(self, max_size):
+        self.max_size = max_size
+        self.evict(max_size)
+
+
+    def clear(self):
+        self.columns.clear()
+        self.size = 0
+
+
+    def statistics(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'columns': len(self.columns),
+            'size': self.size,
+            'max_size': self.max_size,
+        }
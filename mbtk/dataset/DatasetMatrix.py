@@ -1,8 +1,11 @@
+import itertools
+
 import numpy
 import scipy
 import scipy.io
 import mbtk.utilities.functions as util
 from mbtk.math.Variable import Variable, JointVariables
+from mbtk.dataset.ColumnCache import ColumnCache
 from mbtk.dataset.Exceptions import DatasetMatrixNotFinalizedError, DatasetMatrixFinalizedError
 
 
@@ -23,11 +26,13 @@ class DatasetMatrix:
     :var X: A ``scipy.sparse`` matrix where the rows represent samples and the
         columns represent the feature variables. Can be either a
         ``scipy.sparse.csr_matrix`` instance or a ``scipy.sparse.csc_matrix``
-        instance.
+        instance. After finalizing, it may also be a dense ``numpy.ndarray``
+        (see ``storage``).
     :var Y: A ``scipy.sparse`` matrix where the rows represent samples and the
         columns represent the objective variables. Can be either a
         ``scipy.sparse.csr_matrix`` instance or a ``scipy.sparse.csc_matrix``
-        instance.
+        instance. After finalizing, it may also be a dense ``numpy.ndarray``
+        (see ``storage``).
     :var row_labels: A list of strings where each element is the label of a
         corresponding sample in ``X`` and ``Y``. Has exactly as many elements
         as ``X`` and ``Y`` have rows.
@@ -42,10 +47,31 @@ class DatasetMatrix:
         will set this to ``True``. Saving is possible only after finalizing. A
         loaded :py:class:`DatasetMatrix` is always finalized.
     :var metadata: A dictionary which holds miscellaneous information
-        pertaining to this :py:class`DatasetMatrix` instance.
+        pertaining to this :py:class`DatasetMatrix` instance. After
+        finalizing, it also holds the values of each column, under the key
+        ``"values_per_column"`` (see :py:meth:`get_values_per_column`).
+    :var column_cache: A :py:class:`ColumnCache` holding the dense columns
+        most recently retrieved from ``X`` and ``Y``, along with its hit and
+        miss counters. Columns are cached only after finalizing, and its size
+        is limited to ``column_cache_size`` bytes (see
+        :py:meth:`set_column_cache_size`).
+    :var storage: How :py:meth:`finalize` stores ``X`` and ``Y``: either
+        ``"sparse"`` (CSC matrices), ``"dense"`` (Fortran-ordered
+        ``numpy.ndarray`` instances, using the smallest of the ``uint8``,
+        ``int8`` and ``int16`` dtypes which fits the values, if any), or
+        ``"auto"`` (the default), which stores each matrix densely only if
+        its values are integers fitting one of these dtypes and the dense
+        matrix would not take more memory than the sparse one. Dense storage
+        suits samples of Bayesian networks, which have few zeros.
     """
 
-    def __init__(self, label):
+    default_column_cache_size = 256 * 1024 * 1024
+    compact_dtypes = [numpy.uint8, numpy.int8, numpy.int16]
+
+    def __init__(self, label, column_cache_size=None, storage='auto'):
+        if storage not in ('auto', 'sparse', 'dense'):
+            raise ValueError('Unknown storage. Only auto, sparse and dense are allowed.')
+
         self.label = label
         self.X = None
         self.Y = None
@@ -54,6 +80,12 @@ class DatasetMatrix:
         self.column_labels_Y = []
         self.final = False
         self.metadata = {}
+        self.storage = storage
+
+        if column_cache_size is None:
+            column_cache_size = DatasetMatrix.default_column_cache_size
+        self.column_cache = ColumnCache(column_cache_size)
+        self.derived_matrices = (None, None)
 
 
     def info(self):
@@ -66,7 +98,7 @@ class DatasetMatrix:
     def get_info_per_matrix(self, matrix):
         if matrix is None:
             return 'n/a'
-        shape = matrix.get_shape()
+        shape = matrix.shape
         return 'rows x columns: {rows} x {columns}'.format(
             rows=shape[0],
             columns=shape[1])
@@ -93,12 +125,12 @@ class DatasetMatrix:
 
     def get_row_count(self, matrix_label):
         matrix = self.get_matrix(matrix_label)
-        return matrix.get_shape()[0]
+        return matrix.shape[0]
 
 
     def get_column_count(self, matrix_label):
         matrix = self.get_matrix(matrix_label)
-        return matrix.get_shape()[1]
+        return matrix.shape[1]
 
 
     def get_column(self, matrix_label, column):
@@ -162,11 +194,14 @@ class DatasetMatrix:
         finalizing will convert ``X`` to a CSC matrix, which is optimized for
         column slicing and retrieval.
 
+        Once finalized, the columns are cached (see ``column_cache``) and
+        returned as read-only arrays.
+
         :param int column: 0-based integer index of the column to retrieve from ``X``.
         :return: The requested column of ``X`` as a 1-dimensional Numpy array.
         :rtype: ``numpy.array`` of size ``(1, row_count)``.
         """
-        return self.X.getcol(column).transpose().toarray().ravel()
+        return self.get_cached_column('X', self.X, column)
 
 
     def get_column_Y(self, column):
@@ -176,11 +211,55 @@ class DatasetMatrix:
         because finalizing will convert ``Y`` to a CSC matrix which is
         optimized for column slicing and retrieval.
 
+        Once finalized, the columns are cached (see ``column_cache``) and
+        returned as read-only arrays.
+
         :param int column: 0-based integer index of the column to retrieve from ``Y``.
         :return: The requested column of ``Y`` as a 1-dimensional Numpy array.
         :rtype: ``numpy.array`` of size ``(1, row_count)``.
         """
-        return self.Y.getcol(column).transpose().toarray().ravel()
+        return self.get_cached_column('Y', self.Y, column)
+
+
+    def get_cached_column(self, matrix_label, matrix, column):
+        def densify():
+            return util.matrix_column(matrix, column)
+
+        # Columns of dense matrices are views, which need no caching.
+        if isinstance(matrix, numpy.ndarray):
+            return matrix[:, column]
+
+        # Before finalizing, the matrices may still change in place.
+        if not self.final:
+            return densify()
+
+        self.discard_derived_data()
+        return self.column_cache.get((matrix_label, column), densify)
+
+
+    def discard_derived_data(self, force=False):
+        """
+        Clear the column cache and forget the values per column, if ``X`` or
+        ``Y`` have been replaced since they were derived from them, or if
+        ``force`` is ``True``.
+        """
+        (derived_X, derived_Y) = self.derived_matrices
+        if force or derived_X is not self.X or derived_Y is not self.Y:
+            self.column_cache.clear()
+            self.metadata.pop('values_per_column', None)
+            self.derived_matrices = (self.X, self.Y)
+
+
+    def set_column_cache_size(self, column_cache_size):
+        """
+        Change the maximum size of the column cache, in bytes, evicting the
+        least recently used columns if needed. A size of 0 disables the
+        cache.
+
+        :param int column_cache_size: The new maximum size in bytes.
+        :return: Nothing
+        """
+        self.column_cache.resize(column_cache_size)
 
 
     def get_variable(self, matrix_label, column):
@@ -241,25 +320,43 @@ class DatasetMatrix:
 
 
     def get_values_per_column(self, matrix_label):
-        matrix = None
-        if matrix_label == 'X':
-            matrix = self.X
-            column_getter = self.get_column_X
-        elif matrix_label == 'Y':
-            matrix = self.Y
-            column_getter = self.get_column_Y
-        else:
-            raise ValueError('Unknown matrix label. Only X and Y are allowed.')
+        """
+        Return the list of the sorted distinct values of each column of
+        either matrix ``X`` or ``Y``, including the implicit zeros of sparse
+        matrices.
 
-        column_count = matrix.get_shape()[1]
+        The values of all the columns are found in a single vectorized pass
+        over the matrix (see :py:meth:`find_values_per_column`). After
+        finalizing, they are stored in ``self.metadata`` and saved along with
+        the matrices, so the matrix is scanned at most once.
 
-        values_per_column = []
-        for c in range(column_count):
-            column = column_getter(c)
-            values = list(numpy.unique(column))
-            values_per_column.append(values)
+        :param str matrix_label: The matrix, either ``"X"`` or ``"Y"``.
+        :return: A list with a list of values for each column.
+        :rtype: list
+        """
+        (values, indptr) = self.get_values_per_column_arrays(matrix_label)
+        bounds = indptr.tolist()
+        values = values.tolist()
+        return [values[start:end] for (start, end) in zip(bounds[:-1], bounds[1:])]
 
-        return values_per_column
+
+    def get_values_per_column_arrays(self, matrix_label):
+        """
+        Return the values of each column of either matrix ``X`` or ``Y`` as
+        a pair of arrays ``(values, indptr)``: the sorted values of the
+        column ``c`` are ``values[indptr[c]:indptr[c + 1]]``.
+        """
+        matrix = self.get_matrix(matrix_label)
+
+        # Before finalizing, the matrices may still change in place.
+        if not self.final:
+            return DatasetMatrix.find_values_per_column(matrix)
+
+        self.discard_derived_data()
+        values_per_column = self.metadata.setdefault('values_per_column', {})
+        if matrix_label not in values_per_column:
+            values_per_column[matrix_label] = DatasetMatrix.find_values_per_column(matrix)
+        return values_per_column[matrix_label]
 
 
     def delete_row(self, r):
@@ -301,8 +398,7 @@ class DatasetMatrix:
         if len(rows_to_keep) == 0:
             raise ValueError("Argument 'rows_to_keep' must be a non-empty list")
 
-        all_rows = range(self.X.get_shape()[0])
-        rows_to_delete = list(set(all_rows) - set(rows_to_keep))
+        rows_to_delete = numpy.flatnonzero(~DatasetMatrix.index_mask(self.X.shape[0], rows_to_keep))
         self.X = self.delete_rows_cols('X', row_indices=rows_to_delete).tocsr()
         self.Y = self.delete_rows_cols('Y', row_indices=rows_to_delete).tocsr()
 
@@ -334,7 +430,7 @@ class DatasetMatrix:
         if new_label == "":
             new_label = self.label
 
-        new_dataset_matrix = DatasetMatrix(new_label)
+        new_dataset_matrix = DatasetMatrix(new_label, self.column_cache.max_size, self.storage)
 
         new_dataset_matrix.X = self.X[rows_to_keep, ]
         new_dataset_matrix.Y = self.Y[rows_to_keep, ]
@@ -372,7 +468,7 @@ class DatasetMatrix:
         if new_label == "":
             new_label = self.label
 
-        new_dataset_matrix = DatasetMatrix(new_label)
+        new_dataset_matrix = DatasetMatrix(new_label, self.column_cache.max_size, self.storage)
 
         new_dataset_matrix.X = self.X[:, columns_to_keep]
         new_dataset_matrix.Y = self.Y.copy()
@@ -399,7 +495,7 @@ class DatasetMatrix:
             raise DatasetMatrixFinalizedError(self, "Cannot delete any X column.")
         columns_to_delete = sorted(columns_to_delete)
         self.X = self.delete_rows_cols('X', col_indices=columns_to_delete).tocsr()
-        self.column_labels_X = [self.column_labels_X[c] for c in range(len(self.column_labels_X)) if c not in columns_to_delete]
+        self.column_labels_X = DatasetMatrix.delete_labels(self.column_labels_X, columns_to_delete)
 
 
     def delete_columns_Y(self, columns_to_delete):
@@ -418,7 +514,7 @@ class DatasetMatrix:
             raise DatasetMatrixFinalizedError(self, "Cannot delete any Y column.")
         columns_to_delete = sorted(columns_to_delete)
         self.Y = self.delete_rows_cols('Y', col_indices=columns_to_delete).tocsr()
-        self.column_labels_Y = [self.column_labels_Y[c] for c in range(len(self.column_labels_Y)) if c not in columns_to_delete]
+        self.column_labels_Y = DatasetMatrix.delete_labels(self.column_labels_Y, columns_to_delete)
 
 
     def delete_column_X(self, c):
@@ -467,6 +563,11 @@ class DatasetMatrix:
         If the folder ``[path]/[self.label]`` does not exist, it will be
         created.
 
+        The matrices are saved in binary form, as described by
+        :py:func:`mbtk.utilities.functions.save_matrix`: sparse matrices as
+        ``.npz`` archives of their CSC components and dense matrices as
+        ``.npy`` arrays.
+
         :param str path: The Path object representing the root folder in which
             to create the subfolder named ``[self.label]`` in which to save.
         :return: Nothing
@@ -480,6 +581,11 @@ class DatasetMatrix:
         util.save_matrix(matrix_path, "X", self.X)
         util.save_matrix(matrix_path, "Y", self.Y)
 
+        for matrix_label in ['X', 'Y']:
+            (values, indptr) = self.get_values_per_column_arrays(matrix_label)
+            values_file = matrix_path / 'values_per_column_{}.npz'.format(matrix_label)
+            numpy.savez(values_file, values=values, indptr=indptr)
+
         row_labels_file = matrix_path / 'row_labels.txt'
         row_labels_file.write_text('\n'.join(self.row_labels))
 
@@ -490,22 +596,33 @@ class DatasetMatrix:
         column_labels_Y_file.write_text('\n'.join(self.column_labels_Y))
 
 
-    def load(self, path):
+    def load(self, path, mmap=False):
         """
         Load ``X``, ``Y``, ``self.row_labels``, ``self.column_labels_X`` and
         ``self.column_labels_Y`` from files in the subfolder
         ``[path]/[self.label]``. To save them, use :py:meth:`save`.
 
-        The folder ``[path]/[self.label]`` must exist.
+        The folder ``[path]/[self.label]`` must exist. The format of each
+        matrix is detected from its file, so folders saved with the older
+        Matrix Market ``.mtx`` files can still be loaded.
+
+        If ``mmap`` is ``True``, the arrays of ``X`` and ``Y`` (including the
+        ``data``, ``indices`` and ``indptr`` arrays of sparse matrices) are
+        mapped read-only from their files instead of being copied into
+        memory. Processes which load the same DatasetMatrix this way share a
+        single physical copy of it through the page cache. The mapped
+        matrices are kept as they were saved, regardless of
+        ``self.storage``, because converting them would copy them.
 
         :param str path: The Path object representing the root folder in which
             to find the subfolder ``[self.label]`` from which to load.
+        :param bool mmap: Whether to map the matrices instead of reading them.
         :return: Nothing
         """
         matrix_path = path / self.label
 
-        self.X = util.load_matrix(matrix_path, "X")
-        self.Y = util.load_matrix(matrix_path, "Y")
+        self.X = util.load_matrix(matrix_path, "X", mmap)
+        self.Y = util.load_matrix(matrix_path, "Y", mmap)
 
         with (matrix_path / 'row_labels.txt').open(mode='rt') as f:
             self.row_labels = list(map(str.strip, list(f)))
@@ -517,28 +634,36 @@ class DatasetMatrix:
             self.column_labels_Y = list(map(str.strip, list(f)))
 
         self.finalize()
+        self.discard_derived_data(force=True)
+
+        # Folders saved before the values per column were saved with the
+        # matrices lack these files, so the values will be found on demand.
+        values_per_column = {}
+        for matrix_label in ['X', 'Y']:
+            values_file = matrix_path / 'values_per_column_{}.npz'.format(matrix_label)
+            if values_file.exists():
+                with numpy.load(values_file) as values:
+                    values_per_column[matrix_label] = (values['values'], values['indptr'])
+        self.metadata['values_per_column'] = values_per_column
 
 
     def finalize(self):
         """
         Make final adjustments to the ``X`` and ``Y`` matrices. Calls
         ``.eliminate_zeros()``, ``.check_format()`` and ``.tocsc()`` on both
-        matrices, then set the ``self.final`` flag to ``True``.
+        matrices, then converts each of them to a compact dense matrix if
+        ``self.storage`` requires it, and finally sets the ``self.final`` flag
+        to ``True``.
 
         :return: Nothing
         """
         if self.final:
             return
 
-        self.X.eliminate_zeros()
-        self.Y.eliminate_zeros()
-
-        self.X.check_format()
-        self.Y.check_format()
-
-        self.X = self.X.tocsc()
-        self.Y = self.Y.tocsc()
+        self.X = self.finalize_matrix(self.X)
+        self.Y = self.finalize_matrix(self.Y)
 
+        self.discard_derived_data(force=True)
         self.final = True
 
 
@@ -550,12 +675,46 @@ class DatasetMatrix:
 
         :return: Nothing
         """
-        self.X = self.X.tocsr()
-        self.Y = self.Y.tocsr()
+        self.X = scipy.sparse.csr_matrix(self.X)
+        self.Y = scipy.sparse.csr_matrix(self.Y)
 
+        self.discard_derived_data(force=True)
         self.final = False
 
 
+    def finalize_matrix(self, matrix):
+        if util.is_memory_mapped(matrix):
+            # Mapped matrices were finalized before being saved.
+            return matrix
+
+        if scipy.sparse.issparse(matrix):
+            matrix.eliminate_zeros()
+            matrix.check_format()
+            matrix = matrix.tocsc()
+        else:
+            matrix = numpy.asarray(matrix)
+
+        if self.storage == 'sparse':
+            return scipy.sparse.csc_matrix(matrix)
+
+        dtype = DatasetMatrix.compact_dtype(matrix)
+        if self.storage == 'auto':
+            if dtype is None or not DatasetMatrix.dense_is_smaller(matrix, dtype):
+                return scipy.sparse.csc_matrix(matrix)
+
+        if dtype is None:
+            dtype = matrix.dtype
+        if scipy.sparse.issparse(matrix):
+            matrix = matrix.toarray(order='F').astype(dtype, order='F', copy=False)
+        else:
+            matrix = numpy.array(matrix, dtype=dtype, order='F')
+
+        # Like the cached columns of sparse matrices, the columns of dense
+        # matrices are shared by every caller, so they must remain unchanged.
+        matrix.flags.writeable = False
+        return matrix
+
+
     def __eq__(self, other):
         """
         Enable equality testing with the ``==`` operator.
@@ -605,6 +764,7 @@ class DatasetMatrix:
     def sparse_equal(m1, m2):
         """
         Test for the equality of two sparse matrices, by comparing their shape and their content.
+        Either matrix may also be dense.
 
         :param scipy.sparse m1: A sparse matrix.
         :param scipy.sparse m2: Another sparse matrix.
@@ -612,13 +772,113 @@ class DatasetMatrix:
             identical, False otherwise.
         :rtype: `bool`
         """
-        if m1.get_shape() != m2.get_shape():
+        if m1.shape != m2.shape:
             return False
+        if not scipy.sparse.issparse(m1) or not scipy.sparse.issparse(m2):
+            return bool(numpy.array_equal(util.dense_matrix(m1), util.dense_matrix(m2)))
         if (m1 != m2).nnz != 0:
             return False
         return True
 
 
+    def compact_dtype(matrix):
+        """
+        Return the first of the dtypes in ``DatasetMatrix.compact_dtypes``
+        which can hold all the values of the matrix, or ``None`` if the values
+        are not integers or do not fit any of them.
+        """
+        values = matrix.data if scipy.sparse.issparse(matrix) else matrix
+        if values.dtype.kind not in 'biuf':
+            return None
+        if values.size == 0:
+            return DatasetMatrix.compact_dtypes[0]
+        if values.dtype.kind == 'f' and not numpy.all(numpy.mod(values, 1) == 0):
+            return None
+
+        (vmin, vmax) = (values.min(), values.max())
+        if scipy.sparse.issparse(matrix) and matrix.nnz < matrix.shape[0] * matrix.shape[1]:
+            (vmin, vmax) = (min(vmin, 0), max(vmax, 0))
+
+        for dtype in DatasetMatrix.compact_dtypes:
+            info = numpy.iinfo(dtype)
+            if info.min <= vmin and vmax <= info.max:
+                return dtype
+        return None
+
+
+    def find_values_per_column(matrix):
+        """
+        Find the sorted distinct values of each column of a dense or sparse
+        matrix in a single vectorized pass, returned as the pair of arrays
+        ``(values, indptr)`` described in
+        :py:meth:`get_values_per_column_arrays`. The columns of a sparse
+        matrix are found from its ``data`` and ``indptr`` arrays in CSC
+        format, and contain 0 if they have fewer stored elements than rows.
+        """
+        (rows, columns) = matrix.shape
+        if scipy.sparse.issparse(matrix):
+            matrix = scipy.sparse.csc_matrix(matrix)
+            stored_counts = numpy.diff(matrix.indptr)
+            has_zero = numpy.flatnonzero(stored_counts < rows)
+            column_indices = numpy.concatenate([numpy.repeat(numpy.arange(columns), stored_counts), has_zero])
+            values = numpy.concatenate([matrix.data, numpy.zeros(len(has_zero), dtype=matrix.dtype)])
+            order = numpy.lexsort((values, column_indices))
+            (column_indices, values) = (column_indices[order], values[order])
+
+            distinct = numpy.ones(len(values), dtype=bool)
+            distinct[1:] = (values[1:] != values[:-1]) | (column_indices[1:] != column_indices[:-1])
+            distinct_counts = numpy.bincount(column_indices[distinct], minlength=columns)
+            values = values[distinct]
+        else:
+            # The stable sort is a radix sort for the compact dtypes. Sorting
+            # a Fortran-ordered matrix and transposing it leaves each column
+            # contiguous, and masking it lists the values column by column,
+            # as in the CSC format.
+            sorted_columns = numpy.sort(numpy.asarray(matrix), axis=0, kind='stable').T
+            distinct = numpy.empty(sorted_columns.shape, dtype=bool)
+            distinct[:, :1] = True
+            numpy.not_equal(sorted_columns[:, 1:], sorted_columns[:, :-1], out=distinct[:, 1:])
+            distinct_counts = numpy.count_nonzero(distinct, axis=1)
+            values = sorted_columns[distinct]
+
+        indptr = numpy.zeros(columns + 1, dtype=numpy.int64)
+        numpy.cumsum(distinct_counts, out=indptr[1:])
+        return (values, indptr)
+
+
+    def index_mask(length, indices):
+        """
+        Return a boolean mask of the given length, which is ``True`` only at
+        the given indices.
+        """
+        if not isinstance(indices, numpy.ndarray):
+            indices = numpy.fromiter(indices, dtype=numpy.intp, count=len(indices))
+        mask = numpy.zeros(length, dtype=bool)
+        mask[indices] = True
+        return mask
+
+
+    def delete_labels(labels, indices):
+        """
+        Return a copy of the list of labels, without those at the given
+        indices.
+        """
+        keep = ~DatasetMatrix.index_mask(len(labels), indices)
+        return list(itertools.compress(labels, keep.tolist()))
+
+
+    def dense_is_smaller(matrix, dtype):
+        """
+        Whether the matrix would take less memory (or the same) stored
+        densely with the given dtype than stored as a CSC matrix.
+        """
+        (rows, columns) = matrix.shape
+        dense_size = rows * columns * numpy.dtype(dtype).itemsize
+        sparse_matrix = scipy.sparse.csc_matrix(matrix)
+        sparse_size = sparse_matrix.data.nbytes + sparse_matrix.indices.nbytes + sparse_matrix.indptr.nbytes
+        return dense_size <= sparse_size
+
+
     def delete_rows_cols(self, matrix_label, row_indices=None, col_indices=None):
         """
         Remove multiple rows and columns simultaneously from the requested CSR
@@ -647,29 +907,23 @@ class DatasetMatrix:
 
         # Taken from https://stackoverflow.com/a/45486349/583574
         matrix = self.get_matrix(matrix_label)
+        if isinstance(matrix, numpy.ndarray):
+            matrix = scipy.sparse.csr_matrix(matrix)
         if not isinstance(matrix, scipy.sparse.csr_matrix):
             raise ValueError("works only for CSR format -- use .tocsr() first")
 
-        rows = []
-        cols = []
-        if row_indices:
-            rows = list(row_indices)
-        if col_indices:
-            cols = list(col_indices)
-
-        if len(rows) > 0 and len(cols) > 0:
-            row_mask = numpy.ones(matrix.shape[0], dtype=bool)
-            row_mask[rows] = False
-            col_mask = numpy.ones(matrix.shape[1], dtype=bool)
-            col_mask[cols] = False
+        rows = len(row_indices)
+        cols = len(col_indices)
+
+        if rows > 0 and cols > 0:
+            row_mask = ~DatasetMatrix.index_mask(matrix.shape[0], row_indices)
+            col_mask = ~DatasetMatrix.index_mask(matrix.shape[1], col_indices)
             return matrix[row_mask][:, col_mask]
-        elif len(rows) > 0:
-            mask = numpy.ones(matrix.shape[0], dtype=bool)
-            mask[rows] = False
+        elif rows > 0:
+            mask = ~DatasetMatrix.index_mask(matrix.shape[0], row_indices)
             return matrix[mask]
-        elif len(cols) > 0:
-            mask = numpy.ones(matrix.shape[1], dtype=bool)
-            mask[cols] = False
+        elif cols > 0:
+            mask = ~DatasetMatrix.index_mask(matrix.shape[1], col_indices)
             return matrix[:, mask]
         else:
             return matrix
@@ -64,7 +64,7 @@ class ExperimentalDataset():
         datasetsource = datasetsource_class(self.definition.source_configuration)
         self.matrix = datasetsource.create_dataset_matrix("dataset")
 
-        self.total_row_count = self.matrix.X.get_shape()[0]
+        self.total_row_count = self.matrix.X.shape[0]
 
         if finalize_and_save is None:
             finalize_and_save = self.definition.after_build__finalize_and_save
@@ -116,11 +116,19 @@ class ExperimentalDataset():
         case either of these three is ``None``, they are set to new
         :py:class:`DatasetMatrix <mbtk.dataset.DatasetMatrix.DatasetMatrix>` instances.
 
+        If ``self.definition.options['mmap']`` is ``True``, the matrices are
+        mapped read-only from their files, so that experiments running in
+        parallel on the same ExDs share their memory.
+
         :return: Nothing
         """
         if self.matrix is None:
             self.matrix = DatasetMatrix("dataset")
-        self.matrix.load(self.definition.path)
+        self.matrix.load(self.definition.path, self.load_mmap())
+
+
+    def load_mmap(self):
+        return self.definition.options.get('mmap', False)
 
 
     def info(self):
@@ -106,11 +106,11 @@ class ModelBuildingExperimentalDataset(ExperimentalDataset):
         super().load()
         if self.matrix_train is None:
             self.matrix_train = DatasetMatrix("dataset_train")
-        self.matrix_train.load(self.definition.path)
+        self.matrix_train.load(self.definition.path, self.load_mmap())
 
         if self.matrix_test is None:
             self.matrix_test = DatasetMatrix("dataset_test")
-        self.matrix_test.load(self.definition.path)
+        self.matrix_test.load(self.definition.path, self.load_mmap())
 
 
     def perform_random_dataset_split(self):
@@ -1,5 +1,9 @@
+from array import array
+from collections import Counter
+
 import numpy
 import scipy
+import scipy.sparse
 
 from mbtk.dataset.sources.DatasetSource import DatasetSource
 from mbtk.dataset.DatasetMatrix import DatasetMatrix
@@ -83,15 +87,12 @@ class RCV1v2DatasetSource(DatasetSource):
         if feature_type == '':
             feature_type = self.configuration.get('feature_type', 'wordcount')
 
-        documents = self.read_documents(documentIDs)
-        words = self.gather_complete_word_list(documents)
-        topics = self.gather_complete_topic_list(documents)
-
-        dok_matrix_words, dok_matrix_topics = self.create_dok_matrices(documents, documentIDs, words, topics, feature_type)
+        (matrix_words, words) = self.read_document_term_matrix(documentIDs, feature_type)
+        (matrix_topics, topics) = self.read_document_topic_matrix(documentIDs)
 
         datasetmatrix = DatasetMatrix(label)
-        datasetmatrix.X = dok_matrix_words.tocsr()
-        datasetmatrix.Y = dok_matrix_topics.tocsr()
+        datasetmatrix.X = matrix_words
+        datasetmatrix.Y = matrix_topics
         datasetmatrix.row_labels = list(map(str, documentIDs))
         datasetmatrix.column_labels_X = words
         datasetmatrix.column_labels_Y = topics
@@ -128,6 +129,91 @@ class RCV1v2DatasetSource(DatasetSource):
         return sorted(documentIDs)
 
 
+    def read_document_term_matrix(self, documentIDs, feature_type):
+        """
+        Read the document-term matrix of the documents specified by
+        ``documentIDs`` in a single pass over the token file, without
+        instantiating :class:`RCV1v2Document` objects. The words receive
+        column indices in the order in which they are encountered, and the
+        rows are appended directly to the ``indptr``, ``indices`` and
+        ``data`` arrays of a CSR matrix. At the end, the columns are sorted
+        by word and the rows by their position in ``documentIDs``.
+
+        :param list(int) documentIDs: The list of document IDs which should be represented as rows of the matrix.
+        :param str feature_type: The type of values to generate for the document-term matrix (``'wordcount'`` or ``'binary'``).
+        :return: A tuple containing the document-term matrix and the sorted list of the words represented by its columns.
+        :rtype: tuple(scipy.sparse.csr_matrix, list)
+        """
+        row_of_document = {documentID: row for (row, documentID) in enumerate(documentIDs)}
+
+        vocabulary = dict()
+        rows = array('q')
+        indptr = array('q', [0])
+        indices = array('q')
+        data = array('i')
+
+        for (documentID, word_frequencies) in self.iterate_documents(row_of_document):
+            rows.append(row_of_document[documentID])
+            indices.extend([vocabulary.setdefault(word, len(vocabulary)) for word in word_frequencies])
+            if feature_type == 'wordcount':
+                data.extend(word_frequencies.values())
+            if feature_type == 'binary':
+                data.extend([1] * len(word_frequencies))
+            indptr.append(len(indices))
+
+        rows = numpy.frombuffer(rows, dtype=numpy.int64)
+        order_of_rows = numpy.argsort(rows, kind='stable')
+        if not numpy.array_equal(rows[order_of_rows], numpy.arange(len(documentIDs))):
+            raise ValueError("The RCV1v2 token file must contain each requested document exactly once.")
+
+        # Renumber the columns in the order of the sorted words.
+        words = sorted(vocabulary.keys())
+        column_of_word = numpy.empty(len(words), dtype=numpy.int64)
+        column_of_word[[vocabulary[word] for word in words]] = numpy.arange(len(words))
+
+        matrix = scipy.sparse.csr_matrix(
+            (numpy.frombuffer(data, dtype=numpy.int32),
+             column_of_word[numpy.frombuffer(indices, dtype=numpy.int64)],
+             numpy.frombuffer(indptr, dtype=numpy.int64)),
+            shape=(len(rows), len(words)))
+
+        # Place the rows in the order of documentIDs, and sort the indices of
+        # each row after the renumbering.
+        matrix = matrix[order_of_rows]
+        matrix.sort_indices()
+        return (matrix, words)
+
+
+    def read_document_topic_matrix(self, documentIDs):
+        """
+        Read the class-assignment matrix (class = RCV1v2 topic) of the
+        documents specified by ``documentIDs``, in a single pass over the
+        topic assignments file.
+
+        :param list(int) documentIDs: The list of document IDs which should be represented as rows of the matrix.
+        :return: A tuple containing the class-assignment matrix and the sorted list of the topics represented by its columns.
+        :rtype: tuple(scipy.sparse.csr_matrix, list)
+        """
+        row_of_document = {documentID: row for (row, documentID) in enumerate(documentIDs)}
+
+        assignments = set()
+        with self.sourcefile_topic_assignments.open(mode='rt') as sourcefile:
+            for line in sourcefile:
+                assignment = line.split()
+                row = row_of_document.get(int(assignment[1]))
+                if row is not None:
+                    assignments.add((row, assignment[0]))
+
+        topics = sorted(set(topic for (_, topic) in assignments))
+        topics_index = util.create_index(topics)
+        rows = [row for (row, _) in assignments]
+        columns = [topics_index[topic] for (_, topic) in assignments]
+        matrix = scipy.sparse.csr_matrix(
+            (numpy.ones(len(assignments), dtype=numpy.int32), (rows, columns)),
+            shape=(len(documentIDs), len(topics)))
+        return (matrix, topics)
+
+
     def gather_complete_word_list(self, documents):
         """
         Retrieve the entire vocabulary used by the ``documents`` received as
@@ -206,58 +292,60 @@ class RCV1v2DatasetSource(DatasetSource):
             return {}
 
         documents = {}
-        sourcefile_tokens = self.sourcefile_document_tokens.open(mode='rt')
-
-        document = None
-        for line in sourcefile_tokens.readlines():
-            line = line.strip()
-
-            # A line of the form '.I 000' marks the beginning of a new document
-            # in the file, with the ID '000'.  If a previous document was being
-            # read, it means we have reached its end, so we must save it to the
-            # ``documents`` dictionary and start reading a new document.
-            if line[0:3] == '.I ':
-                # If a previous document was being read, save it to ``documents``.
-                if document is not None:
-                    documents[document.did] = document
-
-                # Read the document ID from '.I 000' (extract the 000) and see
-                # if we are interested in it (i.e. is it in the argument
-                # ``requested_documentIDs``). If we are interested in this new document ID,
-                # then instantiate a new RCV1v2Document and set it to receive
-                # the upcoming lines.
-                documentID = int(line[3:].strip())
-                if documentID in requested_documentIDs:
-                    document = RCV1v2Document()
-                    document.did = documentID
-                    document.source = self
-                else:
-                    document = None
-            # A line of the form '.W' does not interest us and is skipped.
-            # Empty lines are also skipped.
-            elif line[0:2] == '.W':
-                continue
-            elif line == '':
-                continue
-            # If the current line in the token file is neither of the form '.I 000',
-            # nor '.W', nor an empty line, then it contains the actual
-            # tokenized words of the current document. Feed this line to the
-            # current document.
-            else:
-                if document is not None:
-                    document.read_line_with_tokens(line)
-
-        # At the end of the file, add the last document to ``documents``.
-        if document is not None:
-            documents[document.did] = document
-
-        sourcefile_tokens.close()
+        for (documentID, word_frequencies) in self.iterate_documents(set(requested_documentIDs)):
+            document = RCV1v2Document()
+            document.did = documentID
+            document.source = self
+            document.word_frequencies = dict(word_frequencies)
+            document.words = list(document.word_frequencies.keys())
+            documents[documentID] = document
 
         self.assign_topics_to_documents(documents)
 
         return documents
 
 
+    def iterate_documents(self, requested_documentIDs):
+        """
+        Read the token file of the RCV1v2 dataset line by line, and yield the
+        ID and the word frequencies of each document whose ID is in
+        ``requested_documentIDs``, in the order in which the documents appear
+        in the file.
+
+        :param requested_documentIDs: A set (or any container with fast membership tests) of document IDs.
+        :return: A generator of tuples containing a document ID and a ``Counter`` of words.
+        """
+        with self.sourcefile_document_tokens.open(mode='rt') as sourcefile_tokens:
+            documentID = None
+            word_frequencies = None
+            for line in sourcefile_tokens:
+                # A line of the form '.I 000' marks the beginning of a new
+                # document in the file, with the ID '000', and therefore the
+                # end of the previous document, if one was being read. Only
+                # the requested documents are read.
+                if line[0:3] == '.I ':
+                    if word_frequencies is not None:
+                        yield (documentID, word_frequencies)
+
+                    documentID = int(line[3:].strip())
+                    if documentID in requested_documentIDs:
+                        word_frequencies = Counter()
+                    else:
+                        word_frequencies = None
+                # Lines of the form '.W' and empty lines are skipped; split()
+                # finds no words in them.
+                elif line[0:2] == '.W':
+                    continue
+                # Any other line contains the tokenized words of the current
+                # document.
+                elif word_frequencies is not None:
+                    word_frequencies.update(line.split())
+
+            # At the end of the file, yield the last document.
+            if word_frequencies is not None:
+                yield (documentID, word_frequencies)
+
+
     def assign_topics_to_documents(self, documents):
         """
         Read the files of the RCV1v2 dataset to discover to what topics do the
@@ -2,6 +2,9 @@ import numpy
 import scipy
 import random
 
+from pathlib import Path
+
+import mbtk.utilities.functions as util
 from mbtk.structures.BayesianNetwork import BayesianNetwork
 from mbtk.dataset.sources.DatasetSource import DatasetSource
 from mbtk.dataset.DatasetMatrix import DatasetMatrix
@@ -11,6 +14,24 @@ class SampledBayesianNetworkDatasetSource(DatasetSource):
     """
     A dataset source which loads a specified Bayesian Network from a BIF file,
     then samples it a specified number of times.
+
+    The ``method`` in the configuration decides how the instances are
+    generated:
+
+    * ``'random'`` (the default) samples the Bayesian Network after seeding
+      Python's global ``random`` module with ``random_seed``.
+    * ``'random_blocks'`` samples blocks of ``sampling_block_size`` rows
+      (65536 by default) in a pool of ``sampling_workers`` processes (1 by
+      default), each block from its own stream derived from ``random_seed``.
+      The instances do not depend on the number of workers.
+    * ``'exact'`` creates instances which follow the joint probability
+      distribution of the Bayesian Network exactly.
+
+    If the configuration contains a ``stream_folder``, the instances are
+    sampled with the ``'random_blocks'`` method and written block by block
+    into a DatasetMatrix saved in ``[stream_folder]/[label]``, which is then
+    loaded memory-mapped (see :py:meth:`stream_dataset_matrix`). This
+    allows generating datasets larger than the available memory.
     """
 
     def __init__(self, configuration, finalize_bn=True):
@@ -23,30 +44,22 @@ class SampledBayesianNetworkDatasetSource(DatasetSource):
 
 
     def create_dataset_matrix(self, label='bayesian_network', other_random_seed=-1):
+        if self.configuration.get('stream_folder', None) is not None:
+            return self.stream_dataset_matrix(label, other_random_seed)
+
         method = self.configuration.get('method', 'random')
         if method == 'random':
             instances_matrix = self.create_random_instances(label, other_random_seed)
+        elif method == 'random_blocks':
+            instances_matrix = self.create_random_instances_in_blocks(label, other_random_seed)
         elif method == 'exact':
             instances_matrix = self.create_exact_instances(self, label)
 
         sample_count = self.configuration['sample_count']
-        numpy_datatype = self.configuration.get('numpy_datatype', numpy.int8)
-
-        X = numpy.empty((sample_count, 0), dtype=numpy_datatype)
-        Y = numpy.empty((sample_count, 0), dtype=numpy_datatype)
-
-        objective_names = sorted(self.configuration.get('objectives', []))
-        feature_names = list(sorted(list(set(self.bayesian_network.variable_node_names()) - set(objective_names))))
-
-        for varname in feature_names:
-            varindex = self.bayesian_network.variable_nodes_index(varname)
-            feature = instances_matrix[:, varindex][numpy.newaxis].T
-            X = numpy.hstack((X, feature))
+        (feature_names, objective_names) = self.get_feature_and_objective_names()
 
-        for varname in objective_names:
-            varindex = self.bayesian_network.variable_nodes_index(varname)
-            objective = instances_matrix[:, varindex][numpy.newaxis].T
-            Y = numpy.hstack((Y, objective))
+        X = instances_matrix[:, self.get_column_indices(feature_names)]
+        Y = instances_matrix[:, self.get_column_indices(objective_names)]
 
         datasetmatrix = DatasetMatrix(label)
         datasetmatrix.X = scipy.sparse.csr_matrix(X)
@@ -59,6 +72,91 @@ class SampledBayesianNetworkDatasetSource(DatasetSource):
         return datasetmatrix
 
 
+    def stream_dataset_matrix(self, label='bayesian_network', other_random_seed=-1):
+        """
+        Sample the Bayesian Network in blocks, as the ``'random_blocks'``
+        method does, and write each block directly into the Fortran-ordered
+        ``X.npy`` and ``Y.npy`` files of a DatasetMatrix saved in
+        ``[stream_folder]/[label]``, along with its labels and the values of
+        each column. Only a few blocks are held in memory at any time.
+
+        :return: The DatasetMatrix, loaded with its matrices mapped read-only
+            from the files, without copying them into memory.
+        """
+        method = self.configuration.get('method', 'random')
+        if method != 'random_blocks':
+            raise ValueError('Streaming requires the random_blocks method, not {}.'.format(method))
+
+        if other_random_seed == -1:
+            random_seed = self.configuration['random_seed']
+        else:
+            random_seed = other_random_seed
+
+        sample_count = self.configuration['sample_count']
+        numpy_datatype = self.configuration.get('numpy_datatype', numpy.int8)
+        block_size = self.configuration.get('sampling_block_size', None)
+        workers = self.configuration.get('sampling_workers', 1)
+
+        folder = Path(self.configuration['stream_folder'])
+        matrix_path = folder / label
+        util.ensure_folder(matrix_path)
+
+        (feature_names, objective_names) = self.get_feature_and_objective_names()
+        column_names = {'X': feature_names, 'Y': objective_names}
+        column_indices = {}
+        matrices = {}
+        values_seen = {}
+        for matrix_label, names in column_names.items():
+            column_indices[matrix_label] = self.get_column_indices(names)
+            shape = (sample_count, len(names))
+            matrices[matrix_label] = util.create_mapped_matrix(matrix_path, matrix_label, shape, numpy_datatype)
+            max_value_count = max([len(self.bayesian_network.variable_nodes[name].values) for name in names], default=0)
+            values_seen[matrix_label] = numpy.zeros((len(names), max_value_count), dtype=bool)
+
+        blocks = self.bayesian_network.sample_blocks(sample_count, random_seed, block_size, workers, dtype=numpy_datatype)
+        with (matrix_path / 'row_labels.txt').open(mode='wt') as row_labels_file:
+            for start, block in blocks:
+                end = start + block.shape[0]
+                for matrix_label, indices in column_indices.items():
+                    columns = block[:, indices]
+                    matrices[matrix_label][start:end] = columns
+                    values_seen[matrix_label][numpy.arange(len(indices)), columns] = True
+                row_labels_file.write(''.join(['row{}\n'.format(i) for i in range(start, end)]))
+
+        for matrix_label, names in column_names.items():
+            matrices[matrix_label].flush()
+            (column_index, values) = numpy.nonzero(values_seen[matrix_label])
+            indptr = numpy.zeros(len(names) + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(column_index, minlength=len(names)), out=indptr[1:])
+            values_file = matrix_path / 'values_per_column_{}.npz'.format(matrix_label)
+            numpy.savez(values_file, values=values.astype(numpy_datatype), indptr=indptr)
+
+            column_labels_file = matrix_path / 'column_labels_{}.txt'.format(matrix_label)
+            column_labels_file.write_text('\n'.join(names))
+        del matrices
+
+        datasetmatrix = DatasetMatrix(label)
+        datasetmatrix.load(folder, mmap=True)
+        datasetmatrix.metadata['source'] = self
+
+        return datasetmatrix
+
+
+    def get_feature_and_objective_names(self):
+        objective_names = sorted(self.configuration.get('objectives', []))
+        feature_names = list(sorted(list(set(self.bayesian_network.variable_node_names()) - set(objective_names))))
+        return (feature_names, objective_names)
+
+
+    def get_column_indices(self, varnames):
+        """
+        Return the columns of the variables named ``varnames`` in the matrices
+        of samples of the Bayesian Network.
+        """
+        indices = [self.bayesian_network.variable_nodes_index(varname) for varname in varnames]
+        return numpy.array(indices, dtype=numpy.intp)
+
+
     def create_exact_instances(self, label='bayesian_network', other_random_seed=-1):
         sample_count = self.configuration['sample_count']
         numpy_datatype = self.configuration.get('numpy_datatype', numpy.int8)
@@ -84,3 +182,18 @@ class SampledBayesianNetworkDatasetSource(DatasetSource):
         instances_matrix = self.bayesian_network.sample_matrix(sample_count, dtype=numpy_datatype)
 
         return instances_matrix
+
+
+    def create_random_instances_in_blocks(self, label='bayesian_network', other_random_seed=-1):
+        if other_random_seed == -1:
+            random_seed = self.configuration['random_seed']
+        else:
+            random_seed = other_random_seed
+
+        sample_count = self.configuration['sample_count']
+        numpy_datatype = self.configuration.get('numpy_datatype', numpy.int8)
+        block_size = self.configuration.get('sampling_block_size', None)
+        workers = self.configuration.get('sampling_workers', 1)
+        instances_matrix = self.bayesian_network.sample_matrix_in_blocks(sample_count, random_seed, block_size, workers, dtype=numpy_datatype)
+
+        return instances_matrix
@@ -1,5 +1,7 @@
 import time
 
+from scipy.stats import chi2
+
 import mbtk.utilities.colors as col
 from mbtk.math.Variable import Variable, JointVariables, Omega
 
@@ -12,7 +14,6 @@ class CITestResult:
     Z: list[int]
     statistic: str
     statistic_value: float
-    p_value: float
 
     def __init__(self):
         self.index = -1
@@ -40,6 +41,48 @@ class CITestResult:
         self.duration = 0.0
 
 
+    @property
+    def p_value(self):
+        """
+        The p-value of the statistic, as a float. When the result only
+        records the statistic and its distribution, the p-value is computed
+        on first access (see resolve_p_value()).
+        """
+        if self.p_value__pending:
+            self.resolve_p_value()
+        return self.p_value__exact
+
+
+    @p_value.setter
+    def p_value(self, p_value):
+        self.p_value__exact = p_value
+        self.p_value__pending = False
+
+
+    def resolve_p_value(self):
+        p_value = None
+        if self.test_distribution == 'chi2':
+            p_value = chi2.cdf(self.statistic_value, self.test_distribution_parameters['DoF'])
+        self.p_value = p_value
+
+
+    def __getstate__(self):
+        # A pending p-value is resolved before pickling, so that saved results
+        # always contain the exact p-value.
+        if self.p_value__pending:
+            self.resolve_p_value()
+        return self.__dict__.copy()
+
+
+    def __setstate__(self, state):
+        # Results pickled before p-values could be computed lazily store the
+        # p-value directly, under its own name.
+        if 'p_value' in state:
+            state['p_value__exact'] = state.pop('p_value')
+            state['p_value__pending'] = False
+        self.__dict__.update(state)
+
+
     def __eq__(self, other):
         return (
             self.independent == other.independent and
@@ -181,6 +224,18 @@ class CITestResult:
         self.test_distribution_parameters = params
 
 
+    def set_distribution__lazy_p_value(self, name, params):
+        """
+        Set the test distribution without computing the p-value. The exact
+        p-value will be computed from the statistic value the first time it is
+        needed, i.e. when the result is compared, printed or pickled.
+        """
+        self.test_distribution = name
+        self.p_value__exact = None
+        self.p_value__pending = True
+        self.test_distribution_parameters = params
+
+
     def accurate(self):
         if self.computed_d_separation is not None:
             return self.independent == self.computed_d_separation
@@ -205,6 +260,7 @@ class CITestResult:
     def render__sufficient_samples(self):
         view = dict()
         view.update(self.__dict__)
+        view['p_value'] = self.p_value
         view['startcode'] = ''
         view['endcode'] = ''
 
@@ -243,6 +299,7 @@ class CITestResult:
     def render__insufficient_samples(self):
         view = dict()
         view.update(self.__dict__)
+        view['p_value'] = self.p_value
         view['startcode'] = ''
         view['endcode'] = ''
         view['i_or_d'] = 'INSUFFICIENT SAMPLES'
@@ -18,7 +18,7 @@ class CMICalculator:
             self.datasetmatrix = datasetmatrix
             self.matrix = self.datasetmatrix.X
             self.column_values = self.datasetmatrix.get_values_per_column('X')
-            self.N = self.matrix.get_shape()[0]
+            self.N = self.matrix.shape[0]
         self.omega = self.parameters.get('omega', None)
         self.source_bn = self.parameters.get('source_bayesian_network', None)
         self.pmf_source = self.parameters.get('heuristic_pmf_source', 'datasetmatrix')
@@ -24,6 +24,9 @@ class DSeparationCITest:
     def conditionally_independent_result(self, X, Y, Z):
         result = CITestResult()
         result.start_timing()
+        # The source Bayesian network answers from the cached set of all
+        # variables d-separated from X (or Y) given Z, so testing many
+        # variables against the same target and Z costs a single pass.
         independent = self.source_bn.conditionally_independent(X, Y, Z)
         result.end_timing()
 
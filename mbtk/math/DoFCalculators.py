@@ -1,12 +1,169 @@
-import collections
+import math
 import pickle
 
+import numpy
+
+from mbtk.math.PMF import ArrayPMF
+from mbtk.math.Variable import fits_mixed_radix_codes
+
+
+
+def encode_columns(matrix):
+    """
+    Replace the values in each column of the matrix with integer codes,
+    such that equal values in a column receive equal codes.
+    """
+    (rows, columns) = matrix.shape
+    key_matrix = numpy.zeros((rows, columns), dtype=numpy.int64)
+    for i in range(columns):
+        (_, codes) = numpy.unique(matrix[:, i], return_inverse=True)
+        key_matrix[:, i] = codes.reshape(-1)
+    return key_matrix
+
+
+
+def make_key_matrix(pmf, keysize):
+    """
+    Build a matrix with a row for each key of the PMF and a column for each
+    of its variables, in which the values of each variable are replaced by
+    integer codes.
+    """
+    if isinstance(pmf, ArrayPMF):
+        # The keys of an ArrayPMF are already encoded.
+        return numpy.column_stack(numpy.unravel_index(pmf.codes, pmf.shape))
+
+    keys = list(pmf.keys())
+    key_matrix = numpy.zeros((len(keys), keysize), dtype=numpy.int64)
+    for i in range(keysize):
+        column = numpy.array([key[i] for key in keys])
+        (_, codes) = numpy.unique(column, return_inverse=True)
+        key_matrix[:, i] = codes.reshape(-1)
+    return key_matrix
+
+
+
+def group_rows(matrix):
+    """
+    Return the index of the distinct row to which each row of the matrix
+    belongs.
+    """
+    (rows, columns) = matrix.shape
+    if columns == 0:
+        return numpy.zeros(rows, dtype=numpy.int64)
+    (_, groups) = numpy.unique(matrix, axis=0, return_inverse=True)
+    return groups.reshape(-1)
+
+
+
+def count_distinct_values_per_group(values, groups, group_count):
+    pairs = numpy.unique(numpy.column_stack((groups, values)), axis=0)
+    return numpy.bincount(pairs[:, 0], minlength=group_count)
+
+
+
+def count_distinct_values_per_z(key_matrix, ix, iy):
+    """
+    Count the distinct values in the columns ix and iy of the key matrix, for
+    each distinct combination z of the values in the rest of its columns. The
+    rows of the key matrix may be either samples or the keys of a PMF, and its
+    values must be integer codes (see encode_columns() and make_key_matrix()).
+
+    Returns a tuple of two arrays (X_val, Y_val), with an element for each z.
+    """
+    keysize = key_matrix.shape[1]
+    z_columns = [iz for iz in range(keysize) if iz != ix and iz != iy]
+    z_groups = group_rows(key_matrix[:, z_columns])
+    z_count = z_groups.max() + 1 if len(z_groups) > 0 else 0
+
+    X_val = count_distinct_values_per_group(key_matrix[:, ix], z_groups, z_count)
+    Y_val = count_distinct_values_per_group(key_matrix[:, iy], z_groups, z_count)
+    return (X_val, Y_val)
+
+
+
+def structural_DoF(X_val, Y_val):
+    # Each z has at least one value of X and one of Y, therefore the terms
+    # summed below are never negative.
+    DoF = int(numpy.sum((X_val - 1) * (Y_val - 1)))
+    if DoF == 0:
+        DoF = 1
+    return DoF
+
+
+def pairwise_structural_DoFs(key_matrix):
+    """
+    Calculate the structural DoF for every pair of columns (ix, iy) of the
+    key matrix, conditioned on the rest of its columns, in a single pass over
+    all the pairs. The rows of the key matrix are encoded as mixed-radix
+    codes, from which the code of z is obtained for each pair by subtracting
+    the terms of ix and iy. The distinct values of X and Y are then counted
+    per (pair, z), for all the pairs at once.
+
+    Returns a symmetric matrix of shape (keysize, keysize), or None if the
+    rows of the key matrix cannot be encoded as mixed-radix codes.
+    """
+    (rows, keysize) = key_matrix.shape
+    if rows == 0:
+        return None
+    shape = tuple(int(m) + 1 for m in key_matrix.max(axis=0))
+    (ixs, iys) = numpy.triu_indices(keysize, 1)
+    # The pair is also encoded into the codes of z.
+    if not fits_mixed_radix_codes((len(ixs),) + shape):
+        return None
+
+    weights = numpy.ones(keysize, dtype=numpy.int64)
+    for i in reversed(range(keysize - 1)):
+        weights[i] = weights[i + 1] * shape[i + 1]
+    codes = key_matrix @ weights
+
+    # One row for each pair of columns, one column for each row of the key
+    # matrix.
+    x_values = key_matrix[:, ixs].T
+    y_values = key_matrix[:, iys].T
+    pairs = numpy.arange(len(ixs))[:, None]
+    z_codes = pairs * math.prod(shape) + codes - x_values * weights[ixs, None] - y_values * weights[iys, None]
+
+    (pair_z_codes, z_groups) = numpy.unique(z_codes.reshape(-1), return_inverse=True)
+    z_groups = z_groups.reshape(-1)
+    z_count = len(pair_z_codes)
+    value_count = max(shape)
+
+    X_val = numpy.bincount(numpy.unique(z_groups * value_count + x_values.reshape(-1)) // value_count, minlength=z_count)
+    Y_val = numpy.bincount(numpy.unique(z_groups * value_count + y_values.reshape(-1)) // value_count, minlength=z_count)
+
+    pair_of_z_group = pair_z_codes // math.prod(shape)
+    DoFs = numpy.bincount(pair_of_z_group, weights=(X_val - 1) * (Y_val - 1), minlength=len(ixs))
+    DoFs = DoFs.astype(numpy.int64)
+    DoFs[DoFs == 0] = 1
+
+    pairwise_dofs = numpy.zeros((keysize, keysize), dtype=numpy.int64)
+    pairwise_dofs[ixs, iys] = DoFs
+    pairwise_dofs[iys, ixs] = DoFs
+    return pairwise_dofs
+
+
 
 class UnadjustedDoF:
+    """
+    Calculates the DoF of a G-test from the number of values of X, Y and Z.
+
+    All the DoF calculators follow the same protocol: before calculating the
+    DoF of a CI test, the G-test calls required_context(X, Y, Z) to find out
+    what the calculator needs for that test, and then provides only that:
+
+    * 'pmfs': the joint PMFs, via set_context_pmfs()
+    * 'cpmfs': the CPMFs, via set_context_cpmfs()
+    * 'distinct_values': the number of distinct values of X and of Y for each
+      z, via set_context_distinct_values()
+
+    The attributes requires_pmfs, requires_cpmfs and requires_distinct_values
+    declare what a calculator might require in general.
+    """
 
     def __init__(self, G_test):
-        self.requires_pmfs = True
+        self.requires_pmfs = False
         self.requires_cpmfs = False
+        self.requires_distinct_values = False
 
         self.G_test = G_test
         self.debug = 3
@@ -40,6 +197,21 @@ class UnadjustedDoF:
         return DoF
 
 
+    def required_context(self, X, Y, Z):
+        context = set()
+        if self.requires_pmfs:
+            context.add('pmfs')
+        if self.requires_cpmfs:
+            context.add('cpmfs')
+        if self.requires_distinct_values:
+            context.add('distinct_values')
+        return context
+
+
+    def requires_pmf_for(self, variableIDs):
+        return False
+
+
     def reset(self):
         self.PrXYcZ = None
         self.PrXcZ = None
@@ -49,6 +221,8 @@ class UnadjustedDoF:
         self.PrXZ = None
         self.PrYZ = None
         self.PrZ = None
+        self.X_val = None
+        self.Y_val = None
         self.X = None
         self.Y = None
         self.Z = None
@@ -74,6 +248,11 @@ class UnadjustedDoF:
         self.PrZ = PrZ
 
 
+    def set_context_distinct_values(self, X_val, Y_val):
+        self.X_val = X_val
+        self.Y_val = Y_val
+
+
     def end(self):
         pass
 
@@ -83,18 +262,23 @@ class StructuralDoF(UnadjustedDoF):
 
     def __init__(self, G_test):
         super().__init__(G_test)
-        self.requires_pmfs = True
-        self.requires_cpmfs = True
+        self.requires_distinct_values = True
 
 
     def calculate_DoF(self, X, Y, Z):
+        if self.X_val is None:
+            return self.calculate_DoF_from_cpmfs(X, Y, Z)
+        return structural_DoF(self.X_val, self.Y_val)
+
+
+    def calculate_DoF_from_cpmfs(self, X, Y, Z):
         DoF = 0
         for (z, pz) in self.PrZ.items():
             if pz == 0:
                 continue
 
-            PrX = self.PrXcZ.given(z)
-            PrY = self.PrYcZ.given(z)
+            PrX = self.PrXcZ.given_key(z)
+            PrY = self.PrYcZ.given_key(z)
 
             PrX.remove_zeros()
             PrY.remove_zeros()
@@ -126,6 +310,7 @@ class CachedStructuralDoF(UnadjustedDoF):
         if self.load_path is not None and self.load_path.exists():
             with self.load_path.open('rb') as f:
                 self.DoF_cache = pickle.load(f)
+            self.convert_DoF_cache_entries()
             if self.debug > 1:
                 print('DoF cache loaded from {} and contains {} entries'.format(self.load_path, len(self.DoF_cache)))
 
@@ -139,11 +324,25 @@ class CachedStructuralDoF(UnadjustedDoF):
         ix = variables.index(X)
         iy = variables.index(Y)
 
-        DoF = pairwise_dofs[(ix, iy)]
+        DoF = int(pairwise_dofs[ix, iy])
 
         return DoF
 
 
+    def required_context(self, X, Y, Z):
+        key = {X, Y}
+        key.update(Z)
+        if frozenset(key) in self.DoF_cache:
+            return set()
+        return {'pmfs'}
+
+
+    def requires_pmf_for(self, variableIDs):
+        if len(variableIDs) <= 1:
+            return False
+        return frozenset(variableIDs) not in self.DoF_cache
+
+
     def set_context_pmfs(self, PrXYZ, PrXZ, PrYZ, PrZ):
         # All PMFs received as arguments are expected to be PMFs of
         # JointVariables. If PrZ is the PMF of a single variable, it is skipped
@@ -182,35 +381,45 @@ class CachedStructuralDoF(UnadjustedDoF):
 
 
     def calculate_pairwise_DoFs(self, pmf, keysize):
-        pairwise_dofs = dict()
+        """
+        Calculate the structural DoF for every pair of variables in the joint
+        PMF, conditioned on the rest of its variables. The result is a
+        symmetric matrix of shape (keysize, keysize), in which the element (ix,
+        iy) is the DoF of the pair formed by the ix-th and iy-th variables of
+        the PMF.
+        """
+        key_matrix = make_key_matrix(pmf, keysize)
+        pairwise_dofs = pairwise_structural_DoFs(key_matrix)
+        if pairwise_dofs is not None:
+            return pairwise_dofs
+
+        # The keys are too wide to be encoded as mixed-radix codes, so each
+        # pair is counted separately.
+        pairwise_dofs = numpy.zeros((keysize, keysize), dtype=numpy.int64)
 
         for ix in range(keysize):
             for iy in range(ix + 1, keysize):
-
-                x_values_per_z = collections.defaultdict(set)
-                y_values_per_z = collections.defaultdict(set)
-                zs = set()
-                for key in pmf.keys():
-                    x = key[ix]
-                    y = key[iy]
-                    z = tuple(key[iz] for iz in range(keysize) if iz != ix and iz != iy)
-                    x_values_per_z[z].add(x)
-                    y_values_per_z[z].add(y)
-                    zs.add(z)
-
-                DoF = 0
-                for z in zs:
-                    X_val = len(x_values_per_z[z])
-                    Y_val = len(y_values_per_z[z])
-                    DoF += (X_val - 1) * (Y_val - 1)
-
-                if DoF == 0:
-                    DoF = 1
-                pairwise_dofs[(ix, iy)] = pairwise_dofs[(iy, ix)] = DoF
+                (X_val, Y_val) = count_distinct_values_per_z(key_matrix, ix, iy)
+                DoF = structural_DoF(X_val, Y_val)
+                pairwise_dofs[ix, iy] = pairwise_dofs[iy, ix] = DoF
 
         return pairwise_dofs
 
 
+    def convert_DoF_cache_entries(self):
+        """
+        Convert the entries of a DoF cache saved in the older format, which
+        stored the pairwise DoFs as a dictionary keyed by (ix, iy) tuples.
+        """
+        for (key, (variables, pairwise_dofs)) in self.DoF_cache.items():
+            if isinstance(pairwise_dofs, dict):
+                keysize = len(variables)
+                matrix = numpy.zeros((keysize, keysize), dtype=numpy.int64)
+                for ((ix, iy), DoF) in pairwise_dofs.items():
+                    matrix[ix, iy] = DoF
+                self.DoF_cache[key] = (variables, matrix)
+
+
     def end(self):
         super().end()
         if self.save_path is not None:
@@ -6,10 +6,12 @@ from mbtk.math.CITestResult import CITestResult
 from mbtk.math.PMF import PMF, CPMF, OmegaPMF, OmegaCPMF
 
 import mbtk.math.infotheory as infotheory
+import mbtk.math.DoFCalculators as DoFCalculators
 from mbtk.math.Variable import JointVariables
 from mbtk.math.Exceptions import InsufficientSamplesForCITest
 
 from scipy.stats import chi2
+import numpy
 import gc
 
 
@@ -29,11 +31,14 @@ class G_test:
             self.datasetmatrix = datasetmatrix
             self.matrix = self.datasetmatrix.X
             self.column_values = self.datasetmatrix.get_values_per_column('X')
-            self.N = self.matrix.get_shape()[0]
+            self.N = self.matrix.shape[0]
         self.omega = self.parameters.get('omega', None)
         self.source_bn = self.parameters.get('source_bayesian_network', None)
 
         self.significance = self.parameters.get('ci_test_significance', 0)
+        self.decision_mode = self.parameters.get('ci_test_decision_mode', 'p_value')
+        self.PMF_class = self.parameters.get('ci_test_pmf_class', PMF)
+        self.critical_G_values: dict[int, float] = dict()
         DoF_calculator_class = self.parameters['ci_test_dof_calculator_class']
         self.DoF_calculator = DoF_calculator_class(self)
 
@@ -41,6 +46,10 @@ class G_test:
         self.ci_test_results = []
         self.gc_collect_rate = self.parameters.get('ci_test_gc_collect_rate', 0)
 
+        # Whether count_distinct_values_per_z() counts the distinct values
+        # among the keys of the joint PMF, which is then built before the DoF.
+        self.distinct_values_from_joint_pmf = False
+
 
     def conditionally_independent(self, X: int, Y: int, Z: Union[set[int], list[int]]) -> bool:
         self.DoF_calculator.reset()
@@ -68,74 +77,164 @@ class G_test:
         result = CITestResult()
         result.start_timing()
 
+        # G only requires the joint PMF of X, Y and Z. The other PMFs and the
+        # CPMFs are built only if the DoF calculator requires them, and the
+        # joint PMF is built before calculating the DoF only in that case, or
+        # if the distinct values per z are counted among its keys. Otherwise,
+        # it is built only after the DoF has confirmed that there are
+        # sufficient samples for the test.
+        joint = None
+        pmfs = None
+        self.DoF_calculator.set_context_variables(X, Y, Z)
+        required_context = self.DoF_calculator.required_context(X, Y, Z)
+        if 'pmfs' in required_context or 'cpmfs' in required_context:
+            joint = self.make_joint_pmf(X, Y, Z)
+            pmfs = self.make_pmfs(X, Y, Z, joint[0])
+        if 'distinct_values' in required_context and self.distinct_values_from_joint_pmf:
+            joint = self.make_joint_pmf(X, Y, Z)
+        self.provide_DoF_context(required_context, X, Y, Z, pmfs, joint)
+
+        DoF = self.DoF_calculator.calculate_DoF(X, Y, Z)
+
+        if not self.sufficient_samples(DoF):
+            result.end_timing()
+            result.index = self.ci_test_counter + 1
+            result.set_insufficient_samples()
+            result.set_variables(VarX, VarY, VarZ)
+            result.extra_info = ' DoF {}'.format(DoF)
+            return result
+
+        if joint is None:
+            joint = self.make_joint_pmf(X, Y, Z)
+        (PrXYZ, x_position, y_position) = joint
+
+        G = self.G_value(PrXYZ, x_position, y_position)
+        independent = self.decide_independence(G, DoF, result)
+
+        result.end_timing()
+        result.index = self.ci_test_counter + 1
+        result.set_independent(independent, self.significance)
+        result.set_variables(VarX, VarY, VarZ)
+        result.set_statistic('G', G, dict())
+
+        result.extra_info = ' DoF {}'.format(DoF)
+
+        return result
+
+
+    def make_joint_pmf(self, X, Y, Z):
+        """
+        Build the joint PMF of X, Y and Z, and return it along with the
+        positions of X and Y in its keys. When Z is empty, this is the joint
+        PMF of X and Y.
+
+        The class of the PMF is either PMF or ArrayPMF, as configured by the
+        'ci_test_pmf_class' parameter.
+        """
+        (VarX, VarY, VarZ) = self.load_variables(X, Y, Z)
+        if len(Z) == 0:
+            PrXYZ = self.PMF_class(JointVariables(VarX, VarY))
+        else:
+            PrXYZ = self.PMF_class(JointVariables(VarX, VarY, VarZ))
+        return (PrXYZ, 0, 1)
+
+
+    def make_pmfs(self, X, Y, Z, PrXYZ):
+        """
+        Build the rest of the PMFs and the CPMFs required by the DoF
+        calculator, given the joint PMF of X, Y and Z built by
+        make_joint_pmf(). Returns a tuple of two tuples, (PrXYZ, PrXZ, PrYZ,
+        PrZ) and (PrXYcZ, PrXcZ, PrYcZ, PrZ). When Z is empty, the first tuple
+        is (PrXY, PrX, PrY, None).
+        """
+        (VarX, VarY, VarZ) = self.load_variables(X, Y, Z)
+
         PrZ: PMF
         PrXcZ: CPMF
         PrYcZ: CPMF
         PrXYcZ: CPMF
 
+        PMF_class = self.PMF_class
+
         if len(Z) == 0:
-            PrXY = PMF(JointVariables(VarX, VarY))
-            PrX = PMF(VarX)
-            PrY = PMF(VarY)
+            PrXY = PrXYZ
+            PrX = PMF_class(VarX)
+            PrY = PMF_class(VarY)
             PrZ = OmegaPMF()
             PrXYcZ = OmegaCPMF(PrXY)
             PrXcZ = OmegaCPMF(PrX)
             PrYcZ = OmegaCPMF(PrY)
 
-            if self.DoF_calculator.requires_pmfs:
-                self.DoF_calculator.set_context_pmfs(PrXY, PrX, PrY, None)
+            return ((PrXY, PrX, PrY, None), (PrXYcZ, PrXcZ, PrYcZ, PrZ))
 
         else:
-            PrXYZ = PMF(JointVariables(VarX, VarY, VarZ))
-            PrXZ = PMF(JointVariables(VarX, VarZ))
-            PrYZ = PMF(JointVariables(VarY, VarZ))
-            PrZ = PMF(VarZ)
+            PrXZ = PMF_class(JointVariables(VarX, VarZ))
+            PrYZ = PMF_class(JointVariables(VarY, VarZ))
+            PrZ = PMF_class(VarZ)
 
             PrXcZ = PrXZ.condition_on(PrZ)
             PrYcZ = PrYZ.condition_on(PrZ)
             PrXYcZ = PrXYZ.condition_on(PrZ)
 
-            if self.DoF_calculator.requires_pmfs:
-                self.DoF_calculator.set_context_pmfs(PrXYZ, PrXZ, PrYZ, PrZ)
+            return ((PrXYZ, PrXZ, PrYZ, PrZ), (PrXYcZ, PrXcZ, PrYcZ, PrZ))
 
-        self.DoF_calculator.set_context_variables(X, Y, Z)
 
-        if self.DoF_calculator.requires_cpmfs:
-            self.DoF_calculator.set_context_cpmfs(PrXYcZ, PrXcZ, PrYcZ, PrZ)
+    def provide_DoF_context(self, required_context, X, Y, Z, pmfs, joint=None):
+        if 'pmfs' in required_context:
+            self.DoF_calculator.set_context_pmfs(*pmfs[0])
 
-        DoF = self.DoF_calculator.calculate_DoF(X, Y, Z)
+        if 'cpmfs' in required_context:
+            self.DoF_calculator.set_context_cpmfs(*pmfs[1])
+
+        if 'distinct_values' in required_context:
+            (X_val, Y_val) = self.count_distinct_values_per_z(X, Y, Z, joint)
+            self.DoF_calculator.set_context_distinct_values(X_val, Y_val)
 
-        if not self.sufficient_samples(DoF):
-            result.end_timing()
-            result.index = self.ci_test_counter + 1
-            result.set_insufficient_samples()
-            result.set_variables(VarX, VarY, VarZ)
-            result.extra_info = ' DoF {}'.format(DoF)
-            return result
 
-        G = self.G_value(PrXYcZ, PrXcZ, PrYcZ, PrZ)
-        p = chi2.cdf(G, DoF)
+    def count_distinct_values_per_z(self, X, Y, Z, joint=None):
+        # The distinct values are counted among the samples in the dataset, so
+        # the joint PMF is not needed.
+        columns = [self.datasetmatrix.get_column_X(column) for column in [X, Y] + Z]
+        key_matrix = DoFCalculators.encode_columns(numpy.column_stack(columns))
+        return DoFCalculators.count_distinct_values_per_z(key_matrix, 0, 1)
 
-        independent = None
-        if p < self.significance:
-            independent = True
+
+    def decide_independence(self, G, DoF, result):
+        """
+        Decide whether the G statistic indicates independence at the
+        configured significance, and set the chi2 distribution on the result.
+
+        With the default decision mode 'p_value', the exact p-value is computed
+        for each test and compared against the significance. With the decision
+        mode 'critical_value', G is compared against the critical value of the
+        chi2 distribution with DoF degrees of freedom, which is computed only
+        once per DoF and then cached. The comparison is equivalent, because
+        the chi2 CDF is monotonic, but it avoids calling the chi2 CDF for every
+        test. The exact p-value is then computed by the result only when
+        needed.
+        """
+        if self.decision_mode == 'critical_value':
+            independent = bool(G < self.critical_G_value(DoF))
+            result.set_distribution__lazy_p_value('chi2', {'DoF': DoF})
         else:
-            independent = False
+            p = chi2.cdf(G, DoF)
+            independent = bool(p < self.significance)
+            result.set_distribution('chi2', p, {'DoF': DoF})
 
-        result.end_timing()
-        result.index = self.ci_test_counter + 1
-        result.set_independent(independent, self.significance)
-        result.set_variables(VarX, VarY, VarZ)
-        result.set_statistic('G', G, dict())
-        result.set_distribution('chi2', p, {'DoF': DoF})
+        return independent
 
-        result.extra_info = ' DoF {}'.format(DoF)
 
-        return result
+    def critical_G_value(self, DoF):
+        try:
+            return self.critical_G_values[DoF]
+        except KeyError:
+            critical_G = chi2.ppf(self.significance, DoF)
+            self.critical_G_values[DoF] = critical_G
+            return critical_G
 
 
-    def G_value(self, PrXYcZ, PrXcZ, PrYcZ, PrZ):
-        cMI = infotheory.conditional_mutual_information(PrXYcZ, PrXcZ, PrYcZ, PrZ, base='e')
+    def G_value(self, PrXYZ, x_position, y_position):
+        cMI = infotheory.conditional_mutual_information__joint(PrXYZ, [x_position], [y_position], base='e')
         return 2 * self.N * cMI
 
 
@@ -3,13 +3,11 @@ import pickle
 
 from mbtk.math.PMF import PMF, CPMF, OmegaPMF, OmegaCPMF
 
-import mbtk.math.infotheory as infotheory
+import mbtk.math.DoFCalculators as DoFCalculators
 import mbtk.math.G_test__unoptimized
-from mbtk.math.CITestResult import CITestResult
 
 import mbtk.structures.ADTree
 
-from scipy.stats import chi2
 
 
 class G_test(mbtk.math.G_test__unoptimized.G_test):
@@ -22,6 +20,7 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
         self.AD_tree_build_duration = 0.0
         self.AD_tree = None
         self.N = None
+        self.distinct_values_from_joint_pmf = True
 
         self.prepare_AD_tree()
 
@@ -76,52 +75,7 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
                 pickle.dump(self.AD_tree, f)
 
 
-    def G_test_conditionally_independent(self, X, Y, Z):
-        result = CITestResult()
-        result.start_timing()
-
-        (PrXYcZ, PrXcZ, PrYcZ, PrZ) = self.calculate_pmf_from_AD_tree(X, Y, Z)
-
-        self.DoF_calculator.set_context_variables(X, Y, Z)
-        if self.DoF_calculator.requires_cpmfs:
-            self.DoF_calculator.set_context_cpmfs(PrXYcZ, PrXcZ, PrYcZ, PrZ)
-        DoF = self.DoF_calculator.calculate_DoF(X, Y, Z)
-
-        if not self.sufficient_samples(DoF):
-            result.end_timing()
-            result.index = self.ci_test_counter + 1
-            result.set_insufficient_samples()
-            result.set_variables(X, Y, Z)
-            result.extra_info = ' DoF {}'.format(DoF)
-            return result
-
-        G = self.G_value(PrXYcZ, PrXcZ, PrYcZ, PrZ)
-        p = chi2.cdf(G, DoF)
-
-        independent = None
-        if p < self.significance:
-            independent = True
-        else:
-            independent = False
-
-        result.end_timing()
-        result.index = self.ci_test_counter + 1
-        result.set_independent(independent, self.significance)
-        result.set_variables(X, Y, Z)
-        result.set_statistic('G', G, dict())
-        result.set_distribution('chi2', p, {'DoF': DoF})
-
-        result.extra_info = ' DoF {}'.format(DoF)
-
-        return result
-
-
-    def G_value(self, PrXYcZ, PrXcZ, PrYcZ, PrZ):
-        cMI = infotheory.conditional_mutual_information(PrXYcZ, PrXcZ, PrYcZ, PrZ, base='e')
-        return 2 * self.N * cMI
-
-
-    def calculate_pmf_from_AD_tree(self, X, Y, Z):
+    def make_joint_pmf(self, X, Y, Z):
         if len(Z) == 0:
             PrXY = self.AD_tree.make_pmf(sorted([X, Y]))
             if [X, Y] != sorted([X, Y]):
@@ -130,7 +84,18 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
                     new_key = tuple(reversed(key))
                     new_probabilities[new_key] = p
                 PrXY.probabilities = new_probabilities
+            return (PrXY, 0, 1)
+
+        # The keys of the PMFs retrieved from the AD-tree contain the values
+        # of the variables in sorted order.
+        joint_variables = sorted([X, Y] + list(Z))
+        PrXYZ = self.AD_tree.make_pmf(joint_variables)
+        return (PrXYZ, joint_variables.index(X), joint_variables.index(Y))
 
+
+    def make_pmfs(self, X, Y, Z, PrXYZ):
+        if len(Z) == 0:
+            PrXY = PrXYZ
             PrX = self.AD_tree.make_pmf([X])
             PrY = self.AD_tree.make_pmf([Y])
             PrXYcZ = OmegaCPMF(PrXY)
@@ -138,23 +103,32 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
             PrYcZ = OmegaCPMF(PrY)
             PrZ = OmegaPMF()
 
-            if self.DoF_calculator.requires_pmfs:
-                self.DoF_calculator.set_context_pmfs(PrXY, PrX, PrY, None)
+            return ((PrXY, PrX, PrY, None), (PrXYcZ, PrXcZ, PrYcZ, PrZ))
 
         else:
             Z = sorted(list(Z))
             PrZ = self.AD_tree.make_pmf(Z)
-            (PrXYcZ, PrXYZ) = self.make_cpmf_PrXYcZ(X, Y, Z, PrZ)
+            (PrXYcZ, PrXYZ) = self.make_cpmf_PrXYcZ(X, Y, Z, PrZ, PrXYZ)
             (PrXcZ, PrXZ) = self.make_cpmf_PrXcZ(X, Z, PrZ)
             (PrYcZ, PrYZ) = self.make_cpmf_PrXcZ(Y, Z, PrZ)
 
-            if self.DoF_calculator.requires_pmfs:
-                self.DoF_calculator.set_context_pmfs(PrXYZ, PrXZ, PrYZ, PrZ)
+            return ((PrXYZ, PrXZ, PrYZ, PrZ), (PrXYcZ, PrXcZ, PrYcZ, PrZ))
 
-        return (PrXYcZ, PrXcZ, PrYcZ, PrZ)
 
+    def count_distinct_values_per_z(self, X, Y, Z, joint=None):
+        # The distinct values are counted among the keys of the joint PMF
+        # retrieved from the AD-tree, instead of the samples in the dataset.
+        # The joint PMF is the one also used to calculate G, so that the
+        # AD-tree is queried only once per CI test.
+        if joint is None:
+            joint = self.make_joint_pmf(X, Y, Z)
+        (PrXYZ, ix, iy) = joint
+        PrXYZ.remove_zeros()
+        key_matrix = DoFCalculators.make_key_matrix(PrXYZ, len(Z) + 2)
+        return DoFCalculators.count_distinct_values_per_z(key_matrix, ix, iy)
 
-    def make_cpmf_PrXYcZ(self, X, Y, Z, PrZ=None):
+
+    def make_cpmf_PrXYcZ(self, X, Y, Z, PrZ=None, PrXYZ=None):
         if PrZ is None:
             PrZ = self.AD_tree.make_pmf(list(Z))
 
@@ -162,7 +136,8 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
         joint_variables = sorted(unsorted_variables)
         index = {var: joint_variables.index(var) for var in joint_variables}
 
-        PrXYZ = self.AD_tree.make_pmf(joint_variables)
+        if PrXYZ is None:
+            PrXYZ = self.AD_tree.make_pmf(joint_variables)
 
         PrXYcZ = CPMF(None, None)
 
@@ -177,7 +152,7 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
                 pmf = PMF(None)
                 PrXYcZ.conditional_probabilities[zkey] = pmf
             try:
-                pmf.probabilities[varkey] = joint_p / PrZ.p(zkey)
+                pmf.probabilities[varkey] = joint_p / PrZ.p_key(zkey)
             except ZeroDivisionError:
                 pass
 
@@ -207,7 +182,7 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
                 pmf = PMF(None)
                 PrXcZ.conditional_probabilities[zkey] = pmf
             try:
-                pmf.probabilities[varkey] = joint_p / PrZ.p(zkey)
+                pmf.probabilities[varkey] = joint_p / PrZ.p_key(zkey)
             except ZeroDivisionError:
                 pass
 
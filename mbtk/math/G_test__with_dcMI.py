@@ -3,9 +3,9 @@ import pickle
 
 from mbtk.math.CITestResult import CITestResult
 from mbtk.math.PMF import PMF
+from mbtk.structures.SharedJHT import SharedJHT
 
 import mbtk.math.G_test__unoptimized
-from scipy.stats import chi2
 
 
 class G_test(mbtk.math.G_test__unoptimized.G_test):
@@ -30,12 +30,28 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
             self.JHT_misses = self.JHT['misses']
             return
 
+        jht_shared_path = self.parameters.get('ci_test_jht_shared_path', None)
+        if jht_shared_path is not None:
+            # The JHT is shared with other processes, which read and publish
+            # entropy terms concurrently. The statistics remain per-process,
+            # so they start from 0 regardless of the contents of the table.
+            self.JHT = SharedJHT(
+                jht_shared_path,
+                self.parameters.get('ci_test_jht_shared_capacity', None),
+                self.parameters.get('ci_test_jht_shared_key_width', None))
+
         jht_load_path = self.parameters.get('ci_test_jht_path__load', None)
         if jht_load_path is not None and jht_load_path.exists():
             with jht_load_path.open('rb') as f:
-                self.JHT = pickle.load(f)
-            self.JHT_reads = self.JHT['reads']
-            self.JHT_misses = self.JHT['misses']
+                loaded_JHT = pickle.load(f)
+            if isinstance(self.JHT, SharedJHT):
+                del loaded_JHT['reads']
+                del loaded_JHT['misses']
+                self.JHT.update(loaded_JHT)
+            else:
+                self.JHT = loaded_JHT
+                self.JHT_reads = self.JHT['reads']
+                self.JHT_misses = self.JHT['misses']
 
 
     def G_test_conditionally_independent(self, X, Y, Z):
@@ -56,6 +72,12 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
         # sure that it has received the required joint distributions beforehand.
         G = self.G_value(X, Y, Z)
 
+        # The joint PMFs have already reached the DoF calculator through the
+        # JHT, so only the rest of the required context is provided here.
+        required_context = self.DoF_calculator.required_context(X, Y, Z)
+        required_context.discard('pmfs')
+        self.provide_DoF_context(required_context, X, Y, Z, None)
+
         DoF = self.DoF_calculator.calculate_DoF(X, Y, Z)
 
         if not self.sufficient_samples(DoF):
@@ -66,19 +88,13 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
             result.extra_info = ' DoF {}'.format(DoF)
             return result
 
-        p = chi2.cdf(G, DoF)
-        independent = None
-        if p < self.significance:
-            independent = True
-        else:
-            independent = False
+        independent = self.decide_independence(G, DoF, result)
 
         result.end_timing()
         result.index = self.ci_test_counter + 1
         result.set_independent(independent, self.significance)
         result.set_variables(X, Y, Z)
         result.set_statistic('G', G, dict())
-        result.set_distribution('chi2', p, {'DoF': DoF})
 
         result.extra_info = ' DoF {}'.format(DoF)
 
@@ -105,25 +121,45 @@ class G_test(mbtk.math.G_test__unoptimized.G_test):
             H = self.JHT[jht_key]
         except KeyError:
             self.JHT_misses += 1
-            joint_variables = self.datasetmatrix.get_variables('X', jht_key)
-            pmf = PMF(joint_variables)
+            pmf = self.make_joint_pmf(jht_key)
             H = - pmf.expected_value(lambda v, p: math.log(p))
             self.JHT[jht_key] = H
             if self.DoF_calculator.requires_pmfs:
                 self.DoF_calculator.set_context_pmfs(pmf, None, None, None)
+            return H
+
+        # The entropy term might have been computed by another process (when
+        # the JHT is shared) or in a previous run (when the JHT is loaded), in
+        # which case the DoF calculator may not have seen its joint
+        # distribution yet.
+        if self.DoF_calculator.requires_pmf_for(jht_key):
+            pmf = self.make_joint_pmf(jht_key)
+            self.DoF_calculator.set_context_pmfs(pmf, None, None, None)
 
         return H
 
 
+    def make_joint_pmf(self, jht_key):
+        joint_variables = self.datasetmatrix.get_variables('X', jht_key)
+        return PMF(joint_variables)
+
+
     def end(self):
         super().end()
 
         jht_save_path = self.parameters.get('ci_test_jht_path__save', None)
         if jht_save_path is not None:
-            self.JHT['reads'] = self.JHT_reads
-            self.JHT['misses'] = self.JHT_misses
+            if isinstance(self.JHT, SharedJHT):
+                JHT = self.JHT.snapshot()
+            else:
+                JHT = self.JHT
+            JHT['reads'] = self.JHT_reads
+            JHT['misses'] = self.JHT_misses
             with jht_save_path.open('wb') as f:
-                pickle.dump(self.JHT, f)
+                pickle.dump(JHT, f)
+
+        if isinstance(self.JHT, SharedJHT):
+            self.JHT.close()
 
 
     def create_flat_variable_set(self, *variables):
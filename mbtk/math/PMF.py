@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import itertools
+import math
 from typing import cast
 from collections import Counter
 
-from mbtk.math.Variable import Variable
+from mbtk.math.Variable import Variable, JointVariables
 from mbtk.utilities import functions as util
 import numpy
 
@@ -14,13 +15,23 @@ class PMF:
     variable: Variable
     variableIDs: tuple[int]
 
+    # The counts of the joint values of JointVariables are calculated from
+    # their encoded instances (see JointVariables.encoded_instances()), and
+    # the keys are decoded into tuples only when they are first needed. Until
+    # then, encoded_counts holds the tuple (value_arrays, shape, codes,
+    # counts).
+    encoded_counts = None
+
     def __init__(self, variable):
         self.tolerance_pdiff = 1e-10
         self.variable = variable
         if variable is not None:
             self.total_count = len(self.variable)
-            self.value_counts = self.count_values()
-            self.probabilities = self.normalize_counts()
+            if isinstance(variable, JointVariables) and variable.has_encodable_instances():
+                self.encoded_counts = self.count_encoded_values()
+            else:
+                self.value_counts = self.count_values()
+                self.probabilities = self.normalize_counts()
             self.variableIDs = tuple(variable.IDs())
         else:
             self.value_counts = dict()
@@ -29,6 +40,34 @@ class PMF:
             self.variableIDs = tuple()
 
 
+    @property
+    def probabilities(self):
+        if self.encoded_counts is not None:
+            self.decode_counts()
+        return self.decoded_probabilities
+
+
+    @probabilities.setter
+    def probabilities(self, probabilities):
+        if self.encoded_counts is not None:
+            self.decode_counts()
+        self.decoded_probabilities = probabilities
+
+
+    @property
+    def value_counts(self):
+        if self.encoded_counts is not None:
+            self.decode_counts()
+        return self.decoded_value_counts
+
+
+    @value_counts.setter
+    def value_counts(self, value_counts):
+        if self.encoded_counts is not None:
+            self.decode_counts()
+        self.decoded_value_counts = value_counts
+
+
     def __str__(self):
         output = ''
         keys = sorted(self.probabilities.keys())
@@ -84,6 +123,19 @@ class PMF:
             return 0.0
 
 
+    def p_key(self, key):
+        """
+        Return the probability of a key which is already in the canonical
+        form of the keys of PMFs, i.e. a key produced by canonical_key() or
+        obtained from keys() or items(). Unlike p(), the key is not
+        normalized again, which matters in loops over many lookups.
+        """
+        try:
+            return self.probabilities[key]
+        except KeyError:
+            return 0.0
+
+
     def IDs(self, *varIDs: int) -> tuple[int]:
         if len(varIDs) == 0:
             return self.variableIDs
@@ -97,7 +149,9 @@ class PMF:
         new_probabilities = dict()
 
         for key, value in self.probabilities.items():
-            new_key = process_pmf_key(self.remove_from_key(key, index))
+            new_key = self.remove_from_key(key, index)
+            if len(new_key) == 1:
+                new_key = new_key[0]
             try:
                 new_probabilities[new_key] += value
             except KeyError:
@@ -121,6 +175,28 @@ class PMF:
         return Counter(instances)
 
 
+    def count_encoded_values(self):
+        encoded_instances = self.variable.encoded_instances()
+        value_arrays = self.variable.encoding_values()
+        shape = tuple(len(values) for values in value_arrays)
+        size = math.prod(shape)
+        if size <= len(encoded_instances):
+            counts = numpy.bincount(encoded_instances, minlength=size)
+            codes = numpy.flatnonzero(counts)
+            counts = counts[codes]
+        else:
+            (codes, counts) = numpy.unique(encoded_instances, return_counts=True)
+        return (value_arrays, shape, codes, counts)
+
+
+    def decode_counts(self):
+        (value_arrays, shape, codes, counts) = self.encoded_counts
+        self.encoded_counts = None
+        keys = decode_keys(value_arrays, shape, codes)
+        self.value_counts = dict(zip(keys, counts.tolist()))
+        self.probabilities = self.normalize_counts()
+
+
     def normalize_counts(self, update_probabilities=False):
         normalized_counts = dict()
         for value, count in self.value_counts.items():
@@ -192,7 +268,7 @@ class PMF:
                 cpmf.conditional_probabilities[cond_key] = pmf
 
             try:
-                pmf.probabilities[non_cond_key] = joint_p / cond_pmf.p(cond_key)
+                pmf.probabilities[non_cond_key] = joint_p / cond_pmf.p_key(cond_key)
             except ZeroDivisionError:
                 pass
 
@@ -206,8 +282,8 @@ class PMF:
         if keys_equal is False:
             return False
         for key in (selfkeyset | otherkeyset):
-            selfp = self.p(key)
-            otherp = other.p(key)
+            selfp = self.p_key(key)
+            otherp = other.p_key(key)
             if abs(selfp - otherp) > self.tolerance_pdiff:
                 return False
         return True
@@ -266,6 +342,18 @@ class CPMF(PMF):
             return PMF(None)
 
 
+    def given_key(self, key):
+        """
+        Return the PMF conditioned on a key which is already in the canonical
+        form of the keys of PMFs, without normalizing it again (see
+        PMF.p_key()).
+        """
+        try:
+            return self.conditional_probabilities[key]
+        except KeyError:
+            return PMF(None)
+
+
     def count_values_conditionally(self):
         conditional_counts = {}
         for (v, cv) in zip(self.variable.instances(), self.conditioning_variable.instances()):
@@ -297,14 +385,367 @@ class CPMF(PMF):
         if keys_equal is False:
             return False
         for key in self.conditional_probabilities:
-            selfpmf = self.given(key)
-            otherpmf = other.given(key)
+            selfpmf = self.given_key(key)
+            otherpmf = other.given_key(key)
             if selfpmf != otherpmf:
                 return False
         return True
 
 
 
+class ArrayPMF(PMF):
+    """
+    A PMF which stores its probabilities in NumPy arrays instead of a dict,
+    while providing the same API as PMF.
+
+    The values of each variable are kept in a sorted array, and the shape of
+    the PMF is the tuple of the numbers of values of its variables. Each key
+    is encoded as a single integer, namely the position of the key in an
+    array of that shape (a mixed-radix code built from the indices of its
+    values). The PMF consists of the sorted array of the encoded keys found
+    in the samples, along with the arrays of their counts and probabilities.
+    Keys are decoded only when they are iterated over.
+    """
+
+    def __init__(self, variable):
+        self.tolerance_pdiff = 1e-10
+        self.variable = variable
+        self.cached_probabilities = None
+        if variable is not None:
+            encoded_instances = variable.encoded_instances()
+            if encoded_instances is None:
+                raise ValueError('Too many possible joint values to encode for an ArrayPMF, use a PMF instead.')
+            self.value_arrays = list(variable.encoding_values())
+            self.shape = tuple(len(values) for values in self.value_arrays)
+            (self.codes, self.counts) = numpy.unique(encoded_instances, return_counts=True)
+            self.total_count = len(encoded_instances)
+            self.probabilities_array = self.counts / self.total_count
+            self.variableIDs = tuple(variable.IDs())
+        else:
+            self.value_arrays = []
+            self.shape = tuple()
+            self.codes = numpy.zeros(0, dtype=numpy.int64)
+            self.counts = numpy.zeros(0, dtype=numpy.int64)
+            self.total_count = 0
+            self.probabilities_array = numpy.zeros(0)
+            self.variableIDs = tuple()
+
+
+    @classmethod
+    def from_arrays(cls, variableIDs, value_arrays, codes, probabilities_array, counts=None) -> ArrayPMF:
+        pmf = cls(None)
+        pmf.variableIDs = tuple(variableIDs)
+        pmf.value_arrays = list(value_arrays)
+        pmf.shape = tuple(len(values) for values in pmf.value_arrays)
+        pmf.codes = codes
+        pmf.probabilities_array = probabilities_array
+        if counts is not None:
+            pmf.counts = counts
+            pmf.total_count = int(numpy.sum(counts))
+        return pmf
+
+
+    @property
+    def probabilities(self):
+        if self.cached_probabilities is None:
+            self.cached_probabilities = dict(zip(self.keys(), self.values()))
+        return self.cached_probabilities
+
+
+    @probabilities.setter
+    def probabilities(self, probabilities):
+        # The keys are encoded again, and the counts are kept for the keys
+        # which remain.
+        value_counts = self.value_counts
+        (self.value_arrays, self.shape, self.codes, self.probabilities_array) = encode_dict(probabilities, self.shape)
+        self.counts = numpy.array([value_counts.get(key, 0) for key in self.keys()], dtype=numpy.int64)
+        self.cached_probabilities = None
+
+
+    @property
+    def value_counts(self):
+        return dict(zip(self.keys(), self.counts.tolist()))
+
+
+    @value_counts.setter
+    def value_counts(self, value_counts):
+        # The keys are encoded again, and the probabilities are kept for the
+        # keys which remain.
+        probabilities = self.probabilities
+        (self.value_arrays, self.shape, self.codes, self.counts) = encode_dict(value_counts, self.shape)
+        self.probabilities_array = numpy.array([probabilities.get(key, 0.0) for key in self.keys()], dtype=float)
+        self.cached_probabilities = None
+
+
+    def __len__(self):
+        return len(self.codes)
+
+
+    def keys(self):
+        return decode_keys(self.value_arrays, self.shape, self.codes)
+
+
+    def values(self):
+        return self.probabilities_array.tolist()
+
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+
+    def value_columns(self):
+        """
+        Return the values of the keys of the PMF as columns, one for each
+        variable, in the order of the keys.
+        """
+        return value_columns(self.value_arrays, self.shape, self.codes)
+
+
+    def remove_zeros(self):
+        nonzero = self.probabilities_array != 0.0
+        if not numpy.all(nonzero):
+            self.codes = self.codes[nonzero]
+            self.probabilities_array = self.probabilities_array[nonzero]
+            if len(self.counts) == len(nonzero):
+                self.counts = self.counts[nonzero]
+            self.cached_probabilities = None
+
+
+    def p(self, *args):
+        return self.p_key(process_pmf_key(args))
+
+
+    def p_key(self, key):
+        code = encode_key(self.value_arrays, self.shape, key)
+        if code == -1:
+            return 0.0
+
+        index = numpy.searchsorted(self.codes, code)
+        if index < len(self.codes) and self.codes[index] == code:
+            return float(self.probabilities_array[index])
+        return 0.0
+
+
+    def lookup(self, columns):
+        """
+        Return the probabilities of many keys at once. The keys are given as
+        columns of values, one for each variable of the PMF. Keys which are
+        not in the PMF have probability 0.
+        """
+        codes = encode_columns_of_keys(self.value_arrays, self.shape, columns)
+        return lookup_codes(self.codes, self.probabilities_array, codes)
+
+
+    def sum_over(self, ID: int) -> ArrayPMF:
+        index = self.variableIDs.index(ID)
+        indices = list(numpy.unravel_index(self.codes, self.shape))
+        del indices[index]
+
+        value_arrays = self.value_arrays[:index] + self.value_arrays[index + 1:]
+        shape = tuple(len(values) for values in value_arrays)
+        (codes, inverse) = numpy.unique(ravel_indices(indices, shape, len(self.codes)), return_inverse=True)
+        probabilities_array = numpy.bincount(inverse, weights=self.probabilities_array, minlength=len(codes))
+
+        variableIDs = self.remove_from_key(self.variableIDs, index)
+        return ArrayPMF.from_arrays(variableIDs, value_arrays, codes, probabilities_array)
+
+
+    def condition_on(self, cond_pmf: PMF) -> ArrayCPMF:
+        cond_vars = cond_pmf.IDs()
+
+        if len(cond_vars) == 0:
+            raise ValueError('empty conditioning set')
+
+        joint_IDs = self.IDs()
+        cond_axes = [joint_IDs.index(cvID) for cvID in cond_vars]
+        return ArrayCPMF.from_joint(self, cond_axes, cond_pmf)
+
+
+
+class ArrayCPMF(CPMF):
+    """
+    A CPMF which stores its conditional probabilities in NumPy arrays, in the
+    same way as ArrayPMF, instead of keeping a separate PMF object for each
+    value of the conditioning variable.
+
+    The keys of the conditioning variable and of the conditioned variable are
+    encoded separately. The arrays of the CPMF hold one element for each
+    joint key found in the samples, sorted by the encoded conditioning key
+    first, so that the probabilities conditioned on a specific value form a
+    contiguous slice.
+    """
+
+    def __init__(self, variable, given):
+        self.tolerance_pdiff = 1e-10
+        self.variable = variable
+        self.probabilities = None
+        self.cached_conditional_probabilities = None
+        self.variableIDs = tuple()
+        self.conditioning_IDs = tuple()
+        self.var_value_arrays = []
+        self.var_shape = tuple()
+        self.cond_value_arrays = []
+        self.cond_shape = tuple()
+        self.cond_codes = numpy.zeros(0, dtype=numpy.int64)
+        self.var_codes = numpy.zeros(0, dtype=numpy.int64)
+        self.counts = None
+        self.probabilities_array = numpy.zeros(0)
+        self.z_codes = numpy.zeros(0, dtype=numpy.int64)
+        self.z_starts = numpy.zeros(1, dtype=numpy.int64)
+
+        if not (variable is None) and not (given is None):
+            self.conditioning_variable = given
+            joint = ArrayPMF(JointVariables(variable, given))
+            var_axes_count = len(variable.IDs())
+            cond_axes = list(range(var_axes_count, len(joint.shape)))
+            self.build_from_joint(joint, cond_axes, None)
+            self.variableIDs = tuple(variable.IDs())
+            self.conditioning_IDs = tuple(given.IDs())
+
+
+    @classmethod
+    def from_joint(cls, joint, cond_axes, cond_pmf) -> ArrayCPMF:
+        cpmf = cls(None, None)
+        cpmf.build_from_joint(joint, cond_axes, cond_pmf)
+        return cpmf
+
+
+    def build_from_joint(self, joint, cond_axes, cond_pmf):
+        """
+        Condition the joint ArrayPMF on the variables found at the positions
+        cond_axes of its keys. If cond_pmf is None, the conditional
+        probabilities are computed from the counts of the joint PMF, otherwise
+        the joint probabilities are divided by the probabilities of the
+        conditioning values in cond_pmf, as in PMF.condition_on().
+        """
+        var_axes = [axis for axis in range(len(joint.shape)) if axis not in cond_axes]
+        indices = numpy.unravel_index(joint.codes, joint.shape)
+
+        self.variableIDs = tuple(joint.variableIDs[axis] for axis in var_axes)
+        self.conditioning_IDs = tuple(joint.variableIDs[axis] for axis in cond_axes)
+        self.var_value_arrays = [joint.value_arrays[axis] for axis in var_axes]
+        self.cond_value_arrays = [joint.value_arrays[axis] for axis in cond_axes]
+        self.var_shape = tuple(len(values) for values in self.var_value_arrays)
+        self.cond_shape = tuple(len(values) for values in self.cond_value_arrays)
+
+        row_count = len(joint.codes)
+        var_codes = ravel_indices([indices[axis] for axis in var_axes], self.var_shape, row_count)
+        cond_codes = ravel_indices([indices[axis] for axis in cond_axes], self.cond_shape, row_count)
+
+        order = numpy.lexsort((var_codes, cond_codes))
+        var_codes = var_codes[order]
+        cond_codes = cond_codes[order]
+        joint_probabilities = joint.probabilities_array[order]
+
+        (z_codes, z_starts, z_inverse) = numpy.unique(cond_codes, return_index=True, return_inverse=True)
+
+        if cond_pmf is None:
+            counts = joint.counts[order]
+            z_counts = numpy.add.reduceat(counts, z_starts) if row_count > 0 else counts
+            probabilities_array = counts / z_counts[z_inverse]
+            self.counts = counts
+        else:
+            z_probabilities = self.lookup_conditioning_probabilities(cond_pmf, z_codes)
+            present = z_probabilities[z_inverse] != 0.0
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                probabilities_array = joint_probabilities / z_probabilities[z_inverse]
+
+            # Rows conditioned on a value of probability 0 are dropped, like
+            # PMF.condition_on() does.
+            var_codes = var_codes[present]
+            cond_codes = cond_codes[present]
+            probabilities_array = probabilities_array[present]
+            (z_codes, z_starts) = numpy.unique(cond_codes, return_index=True)
+
+        self.var_codes = var_codes
+        self.cond_codes = cond_codes
+        self.probabilities_array = probabilities_array
+        self.z_codes = z_codes
+        self.z_starts = numpy.append(z_starts, len(cond_codes))
+        self.cached_conditional_probabilities = None
+
+
+    def lookup_conditioning_probabilities(self, cond_pmf, z_codes):
+        if isinstance(cond_pmf, ArrayPMF):
+            columns = value_columns(self.cond_value_arrays, self.cond_shape, z_codes)
+            return cond_pmf.lookup(columns)
+
+        z_keys = decode_keys(self.cond_value_arrays, self.cond_shape, z_codes)
+        return numpy.array([cond_pmf.p(z_key) for z_key in z_keys], dtype=float)
+
+
+    @property
+    def conditional_probabilities(self):
+        if self.cached_conditional_probabilities is None:
+            self.cached_conditional_probabilities = dict(self.items())
+        return self.cached_conditional_probabilities
+
+
+    def __len__(self):
+        return len(self.z_codes)
+
+
+    def keys(self):
+        return decode_keys(self.cond_value_arrays, self.cond_shape, self.z_codes)
+
+
+    def items(self):
+        return [(z, self.given_z_index(i)) for (i, z) in enumerate(self.keys())]
+
+
+    def given(self, *args):
+        return self.given_key(process_pmf_key(args))
+
+
+    def given_key(self, key):
+        code = encode_key(self.cond_value_arrays, self.cond_shape, key)
+        if code == -1:
+            return ArrayPMF(None)
+
+        z_index = numpy.searchsorted(self.z_codes, code)
+        if z_index < len(self.z_codes) and self.z_codes[z_index] == code:
+            return self.given_z_index(z_index)
+        return ArrayPMF(None)
+
+
+    def given_z_index(self, z_index):
+        start = self.z_starts[z_index]
+        end = self.z_starts[z_index + 1]
+        counts = None
+        if self.counts is not None:
+            counts = self.counts[start:end]
+        return ArrayPMF.from_arrays(
+            self.variableIDs,
+            self.var_value_arrays,
+            self.var_codes[start:end],
+            self.probabilities_array[start:end],
+            counts)
+
+
+    def var_value_columns(self):
+        return value_columns(self.var_value_arrays, self.var_shape, self.var_codes)
+
+
+    def cond_value_columns(self):
+        return value_columns(self.cond_value_arrays, self.cond_shape, self.cond_codes)
+
+
+    def lookup(self, cond_columns, var_columns):
+        """
+        Return the conditional probabilities of many keys at once, given as
+        columns of conditioning values and columns of conditioned values.
+        Keys which are not in the CPMF have probability 0.
+        """
+        cond_codes = encode_columns_of_keys(self.cond_value_arrays, self.cond_shape, cond_columns)
+        var_codes = encode_columns_of_keys(self.var_value_arrays, self.var_shape, var_columns)
+        var_size = max(1, int(numpy.prod(self.var_shape)))
+
+        row_keys = self.cond_codes * var_size + self.var_codes
+        codes = numpy.where((cond_codes == -1) | (var_codes == -1), -1, cond_codes * var_size + var_codes)
+        return lookup_codes(row_keys, self.probabilities_array, codes)
+
+
+
 class OmegaPMF(PMF):
 
     def __init__(self):
@@ -321,7 +762,31 @@ class OmegaCPMF(CPMF):
 
 
 
+def canonical_key(*args):
+    """
+    Normalize a key into the canonical form of the keys of PMFs, to be used
+    with PMF.p_key() and CPMF.given_key(). The arguments are the same as
+    those accepted by PMF.p() and CPMF.given().
+    """
+    return process_pmf_key(args)
+
+
+
 def process_pmf_key(key):
+    # Most keys are either a single value or a flat tuple of values, which
+    # are already canonical and need no flattening.
+    if len(key) == 1:
+        key = key[0]
+        if not isinstance(key, (list, tuple)):
+            return key
+    for element in key:
+        if isinstance(element, (list, tuple)):
+            break
+    else:
+        if len(key) == 1:
+            return key[0]
+        return tuple(key)
+
     # If the key is a tuple or list, flatten it.
     key = util.flatten(key)
     # Convert the key to a tuple, in case it is a list.
@@ -333,6 +798,107 @@ def process_pmf_key(key):
 
 
 
+def ravel_indices(indices, shape, count):
+    if len(shape) == 0:
+        return numpy.zeros(count, dtype=numpy.int64)
+    return numpy.ravel_multi_index(indices, shape)
+
+
+
+def value_columns(value_arrays, shape, codes):
+    if len(shape) == 0:
+        return []
+    indices = numpy.unravel_index(codes, shape)
+    return [values[index] for (values, index) in zip(value_arrays, indices)]
+
+
+
+def decode_keys(value_arrays, shape, codes):
+    if len(shape) == 0:
+        return [tuple()] * len(codes)
+    columns = [column.tolist() for column in value_columns(value_arrays, shape, codes)]
+    if len(columns) == 1:
+        return columns[0]
+    return list(zip(*columns))
+
+
+
+def encode_key(value_arrays, shape, key):
+    """
+    Encode a canonical key, as processed by process_pmf_key(), into its mixed-radix code,
+    or return -1 if any of its values is unknown.
+    """
+    if len(shape) == 1:
+        key = (key,)
+    elif not isinstance(key, tuple) or len(key) != len(shape):
+        return -1
+
+    indices = []
+    for (values, value) in zip(value_arrays, key):
+        try:
+            index = numpy.searchsorted(values, value)
+        except TypeError:
+            return -1
+        if index == len(values) or values[index] != value:
+            return -1
+        indices.append(index)
+
+    if len(shape) == 0:
+        return 0
+    return int(numpy.ravel_multi_index(indices, shape))
+
+
+
+def encode_dict(mapping, shape):
+    """
+    Encode the keys of a dict keyed by canonical keys, returning the tuple
+    (value_arrays, shape, codes, array), in which the codes are sorted and
+    the array holds the values of the dict in the same order. The shape is
+    only used if the dict is empty.
+    """
+    keys = list(mapping.keys())
+    if len(keys) == 0:
+        value_arrays = [numpy.zeros(0) for _ in shape]
+        return (value_arrays, tuple(0 for _ in shape), numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0))
+
+    if isinstance(keys[0], tuple):
+        columns = [numpy.array(column) for column in zip(*keys)]
+    else:
+        columns = [numpy.array(keys)]
+    value_arrays = [numpy.unique(column) for column in columns]
+    shape = tuple(len(values) for values in value_arrays)
+    codes = encode_columns_of_keys(value_arrays, shape, columns)
+    order = numpy.argsort(codes)
+    return (value_arrays, shape, codes[order], numpy.array(list(mapping.values()))[order])
+
+
+
+def encode_columns_of_keys(value_arrays, shape, columns):
+    """
+    Encode many keys at once, given as columns of values. Unknown keys are
+    encoded as -1.
+    """
+    count = len(columns[0]) if len(columns) > 0 else 0
+    valid = numpy.ones(count, dtype=bool)
+    indices = []
+    for (values, column) in zip(value_arrays, columns):
+        index = numpy.minimum(numpy.searchsorted(values, column), len(values) - 1)
+        valid &= (values[index] == column)
+        indices.append(index)
+    codes = ravel_indices(indices, shape, count)
+    return numpy.where(valid, codes, -1)
+
+
+
+def lookup_codes(sorted_codes, probabilities_array, codes):
+    if len(sorted_codes) == 0:
+        return numpy.zeros(len(codes))
+    positions = numpy.minimum(numpy.searchsorted(sorted_codes, codes), len(sorted_codes) - 1)
+    found = (sorted_codes[positions] == codes) & (codes != -1)
+    return numpy.where(found, probabilities_array[positions], 0.0)
+
+
+
 def cpmf_diff(A, B):
     import mbtk.utilities.colors as col
 
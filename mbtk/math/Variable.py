@@ -1,7 +1,10 @@
+import math
 import operator
 import itertools
 from collections import Counter
 
+import numpy
+
 from mbtk.math.Exceptions import VariableInstancesOfUnequalCount
 
 
@@ -15,6 +18,7 @@ class Variable:
         self.instances_list = instances
         self.lazy_instances_loader = None
         self.values = None
+        self.encoding = None
 
 
     def __len__(self):
@@ -41,6 +45,28 @@ class Variable:
             self.values = sorted(list(Counter(self.instances()).keys()))
 
 
+    def encoded_instances(self):
+        """
+        Return the instances as an int64 array of codes, where each code is
+        the index of the instance among the sorted distinct values of the
+        variable, as returned by encoding_values(). The encoding is
+        calculated only once.
+        """
+        if self.encoding is None:
+            self.encoding = encode_instances([self])
+        return self.encoding[1]
+
+
+    def encoding_values(self):
+        """
+        Return the list of the arrays of sorted distinct values on which the
+        codes returned by encoded_instances() are based, one array for each
+        variable.
+        """
+        self.encoded_instances()
+        return self.encoding[0]
+
+
 
 class Omega(Variable):
 
@@ -89,6 +115,36 @@ class JointVariables(Variable):
         return zip(*[var.instances() for var in self.variables])
 
 
+    def encoded_instances(self):
+        """
+        Return the joint instances as a single int64 array of mixed-radix
+        codes instead of tuples. The radices are the numbers of distinct
+        values of the variables, so each code can be decoded into the
+        indices of the values of its tuple with numpy.unravel_index(), using
+        the arrays of values returned by encoding_values().
+        """
+        if self.encoding is None:
+            self.encoding = encode_instances(self.variables)
+        return self.encoding[1]
+
+
+    def has_encodable_instances(self):
+        """
+        Check whether the joint instances can be encoded by
+        encoded_instances(), which requires array instances and a number of
+        possible joint values that fits the mixed-radix codes (see
+        fits_mixed_radix_codes()).
+        """
+        return self.has_array_instances() and self.encoded_instances() is not None
+
+
+    def has_array_instances(self):
+        for var in self.variables:
+            if not isinstance(var.instances(), numpy.ndarray):
+                return False
+        return len(self.variables) > 0
+
+
     def __len__(self):
         return len(self.variables[0])
 
@@ -152,3 +208,60 @@ def validate_variable_lengths(variables):
     for i in range(len(lengths) - 1):
         if lengths[i] != lengths[i + 1]:
             raise VariableInstancesOfUnequalCount([variables[i], variables[i + 1]])
+
+
+# The most dimensions accepted by numpy.ravel_multi_index() on every
+# supported NumPy version (NPY_MAXDIMS was 32 before NumPy 2).
+max_mixed_radix_width = 32
+
+
+
+def fits_mixed_radix_codes(shape):
+    """
+    Check whether all the keys of the given shape can be encoded as int64
+    mixed-radix codes.
+    """
+    return len(shape) <= max_mixed_radix_width and math.prod(shape) < 2 ** 63
+
+
+
+def encode_instances(variables):
+    """
+    Encode the joint instances of the variables as mixed-radix codes (see
+    JointVariables.encoded_instances()). Returns the arrays of values of the
+    variables and the codes, which are ``None`` if there are too many
+    possible joint values to encode (see fits_mixed_radix_codes()).
+    """
+    value_arrays = []
+    indices = []
+    for variable in variables:
+        instances = variable.instances()
+        if not isinstance(instances, (numpy.ndarray, list)):
+            instances = list(instances)
+        (values, inverse) = encode_values(instances)
+        value_arrays.append(values)
+        indices.append(inverse.reshape(-1))
+
+    shape = tuple(len(values) for values in value_arrays)
+    if not fits_mixed_radix_codes(shape):
+        return (value_arrays, None)
+    codes = numpy.ravel_multi_index(indices, shape).astype(numpy.int64, copy=False)
+    return (value_arrays, codes)
+
+
+
+def encode_values(instances):
+    """
+    Return the sorted distinct values of the instances and the index of each
+    instance in them, like ``numpy.unique(..., return_inverse=True)``. The
+    compact integer columns of dense matrices are encoded by counting instead
+    of sorting.
+    """
+    if isinstance(instances, numpy.ndarray) and instances.dtype.kind in 'iu' and instances.dtype.itemsize <= 2 and len(instances) > 0:
+        offset = int(instances.min())
+        shifted = instances.astype(numpy.intp) - offset
+        present = numpy.bincount(shifted) > 0
+        values = (numpy.flatnonzero(present) + offset).astype(instances.dtype)
+        codes_of_values = numpy.cumsum(present) - 1
+        return (values, codes_of_values[shifted])
+    return numpy.unique(instances, return_inverse=True)
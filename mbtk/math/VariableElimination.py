@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import itertools
+
+import numpy
+
+from mbtk.math.PMF import PMF
+from mbtk.structures.MethodCache import MethodCache
+
+
+
+class Factor:
+    """
+    A function of a set of discrete variables, stored as a NumPy array with
+    one axis for each variable. The variables are identified by their IDs,
+    and the axes of ``table`` follow the order of ``variables``.
+
+    :var tuple variables: The IDs of the variables of the factor.
+    :var numpy.ndarray table: The values of the factor, indexed by the
+        indices of the values of its variables.
+    :var key: A hashable description of how the factor was computed, used
+        by :class:`VariableElimination` to cache factors between queries.
+    """
+
+    variables: tuple[int, ...]
+    table: numpy.ndarray
+
+    def __init__(self, variables, table, key=None):
+        self.variables = tuple(variables)
+        self.table = table
+        self.key = key
+
+
+    def cardinalities(self) -> dict[int, int]:
+        return dict(zip(self.variables, self.table.shape))
+
+
+    def aligned_table(self, variables) -> numpy.ndarray:
+        """
+        Return ``self.table`` with its axes rearranged in the order of
+        ``variables``, which must contain all the variables of the factor,
+        and with axes of length 1 for the other variables, so that it can be
+        broadcast against the tables of other factors aligned the same way.
+        """
+        positions = [variables.index(variable) for variable in self.variables]
+        table: numpy.ndarray = self.table.transpose(numpy.argsort(positions))
+        shape = [1] * len(variables)
+        for position, cardinality in zip(positions, self.table.shape):
+            shape[position] = cardinality
+        return table.reshape(shape)
+
+
+    def product(self, other: Factor) -> Factor:
+        variables = tuple(sorted(set(self.variables) | set(other.variables)))
+        table = self.aligned_table(variables) * other.aligned_table(variables)
+        return Factor(variables, table)
+
+
+    def sum_out(self, variable: int) -> Factor:
+        axis = self.variables.index(variable)
+        variables = self.variables[:axis] + self.variables[axis + 1:]
+        return Factor(variables, self.table.sum(axis=axis))
+
+
+    def as_pmf(self) -> PMF:
+        """
+        Convert the factor into a PMF over its variables, with the keys made
+        of the indices of the values of the variables, in ascending order of
+        their IDs.
+        """
+        variables = tuple(sorted(self.variables))
+        table = self.aligned_table(variables)
+        indices = list(itertools.product(*[range(cardinality) for cardinality in table.shape]))
+        keys = [index[0] for index in indices] if len(variables) == 1 else indices
+
+        pmf = PMF(None)
+        pmf.probabilities = dict(zip(keys, table.ravel().tolist()))
+        pmf.IDs(*variables)
+        return pmf
+
+
+
+class VariableElimination:
+    """
+    An inference engine which computes marginal joint distributions of the
+    variables of a finalized :class:`BayesianNetwork
+    <mbtk.structures.BayesianNetwork.BayesianNetwork>` by variable
+    elimination over the CPTs of the network.
+
+    Only the CPTs of the requested variables and of their ancestors are
+    needed, since the other variables sum out to 1. The remaining variables
+    are eliminated in a min-fill order. Every factor produced by eliminating
+    a variable is cached under a key describing the factors it was computed
+    from, so later queries which eliminate the same variable from the same
+    factors reuse it.
+
+    :var MethodCache factor_cache: The cached factors, by their keys, along
+        with the counts of eliminations answered from the cache (hits) and
+        actually computed (misses).
+    """
+
+    cpt_factors: dict[int, Factor]
+
+    def __init__(self, bayesian_network, factor_cache=None):
+        self.bayesian_network = bayesian_network
+        if factor_cache is None:
+            factor_cache = MethodCache()
+        self.factor_cache = factor_cache
+        self.cpt_factors = self.create_cpt_factors()
+
+
+    def create_cpt_factors(self) -> dict[int, Factor]:
+        """
+        Create a factor from the CPT of each VariableNode, over the IDs of
+        its conditioning VariableNodes followed by its own ID.
+        """
+        bn = self.bayesian_network
+        cpt_factors = {}
+        for variable in bn.variable_nodes__sampling_order:
+            probdist = variable.probdist
+            variables = [bn.variable_nodes[varname].ID for varname in probdist.conditioning_variable_nodes.keys()]
+            variables.append(variable.ID)
+            cpt_factors[variable.ID] = Factor(variables, probdist.probabilities_array, key=('cpt', variable.ID))
+        return cpt_factors
+
+
+    def marginal(self, variables) -> Factor:
+        """
+        Compute the joint distribution of the variables with the IDs
+        ``variables`` as a factor.
+        """
+        bn = self.bayesian_network
+        relevant_IDs = set(bn.get_subnetwork_node_IDs(tuple(variables)))
+
+        # The CPT factors are listed in the sampling order, so that a joint
+        # which needs no elimination multiplies the CPTs in the same order as
+        # BayesianNetwork.joint_values_and_probabilities().
+        factors = [factor for ID, factor in self.cpt_factors.items() if ID in relevant_IDs]
+
+        variables_to_eliminate = relevant_IDs - set(variables)
+        for variable in self.elimination_order(factors, variables_to_eliminate):
+            factors = self.eliminate(factors, variable)
+
+        joint = factors[0]
+        for factor in factors[1:]:
+            joint = joint.product(factor)
+        return joint
+
+
+    def eliminate(self, factors, variable) -> list[Factor]:
+        """
+        Replace the factors which contain ``variable`` with the factor
+        obtained by multiplying them and summing ``variable`` out.
+        """
+        involved = [factor for factor in factors if variable in factor.variables]
+        remaining = [factor for factor in factors if variable not in factor.variables]
+
+        key = (variable, frozenset(factor.key for factor in involved))
+
+        def compute():
+            product = involved[0]
+            for factor in involved[1:]:
+                product = product.product(factor)
+            new_factor = product.sum_out(variable)
+            new_factor.key = key
+            return new_factor
+
+        remaining.append(self.factor_cache.get(key, compute))
+        return remaining
+
+
+    def elimination_order(self, factors, variables_to_eliminate) -> list[int]:
+        """
+        Order the variables to eliminate greedily, by always picking the
+        variable whose elimination adds the fewest edges between its
+        neighbours in the interaction graph of the factors (min-fill). Ties
+        are broken by the size of the factor created by the elimination,
+        then by ID.
+        """
+        neighbours: dict[int, set[int]] = {}
+        cardinalities: dict[int, int] = {}
+        for factor in factors:
+            cardinalities.update(factor.cardinalities())
+            for variable in factor.variables:
+                neighbours.setdefault(variable, set()).update(factor.variables)
+        for variable in neighbours:
+            neighbours[variable].discard(variable)
+
+        def cost(variable):
+            adjacent = neighbours[variable]
+            fill = sum(1 for (a, b) in itertools.combinations(adjacent, 2) if b not in neighbours[a])
+            size = numpy.prod([cardinalities[v] for v in adjacent], dtype=float) * cardinalities[variable]
+            return (fill, size, variable)
+
+        order = []
+        remaining = set(variables_to_eliminate)
+        while len(remaining) > 0:
+            variable = min(remaining, key=cost)
+            adjacent = neighbours.pop(variable)
+            for a in adjacent:
+                neighbours[a].discard(variable)
+                neighbours[a].update(adjacent - {a})
+            remaining.remove(variable)
+            order.append(variable)
+        return order
@@ -1,7 +1,9 @@
 import math
-from typing import Callable, Union
+from typing import Callable, Iterable, Union
 
-from mbtk.math.PMF import PMF, CPMF
+import numpy
+
+from mbtk.math.PMF import PMF, CPMF, ArrayPMF, ArrayCPMF, OmegaPMF, OmegaCPMF
 from mbtk.math.Variable import Variable, JointVariables
 
 
@@ -12,17 +14,17 @@ def mutual_information(
     base=2,
 ) -> float:
 
-    logarithm = create_logarithm_function(base)
-    MI = 0.0
-    for (x, px) in PrX.items():
-        for (y, py) in PrY.items():
-            pxy = PrXY.p(x, y)
-            if pxy == 0 or px == 0 or py == 0:
-                continue
-            else:
-                pMI = pxy * logarithm(pxy / (px * py))
-                MI += pMI
-    return MI
+    if isinstance(PrXY, ArrayPMF) and isinstance(PrX, ArrayPMF) and isinstance(PrY, ArrayPMF):
+        return mutual_information__arrays(PrXY, PrX, PrY, base)
+
+    # The probabilities of X and Y are looked up for each key of PrXY, so
+    # that the sum over all (x, y) runs over arrays.
+    keys = list(PrXY.keys())
+    pxy = numpy.fromiter(PrXY.values(), dtype=float, count=len(keys))
+    (x_keys, y_keys) = split_keys(keys, key_width(PrX.keys()))
+    px = lookup_probabilities(PrX.probabilities, x_keys)
+    py = lookup_probabilities(PrY.probabilities, y_keys)
+    return mutual_information__probabilities(pxy, px, py, base)
 
 
 
@@ -34,18 +36,293 @@ def conditional_mutual_information(
     base: Union[float, str] = 2,
 ) -> float:
 
-    logarithm = create_logarithm_function(base)
-    cMI = 0.0
-    for (z, pz) in PrZ.items():
-        for (x, pxcz) in PrXcZ.given(z).items():
-            for (y, pycz) in PrYcZ.given(z).items():
-                pxycz = PrXYcZ.given(z).p(x, y)
-                if pxycz == 0 or pxcz == 0 or pycz == 0:
-                    continue
-                else:
-                    pcMI = pz * pxycz * logarithm(pxycz / (pxcz * pycz))
-                    cMI += pcMI
-    return abs(cMI)
+    if isinstance(PrXYcZ, ArrayCPMF) and isinstance(PrXcZ, ArrayCPMF) and isinstance(PrYcZ, ArrayCPMF) and isinstance(PrZ, ArrayPMF):
+        return conditional_mutual_information__arrays(PrXYcZ, PrXcZ, PrYcZ, PrZ, base)
+
+    if isinstance(PrZ, OmegaPMF) and isinstance(PrXYcZ, OmegaCPMF):
+        # Conditioning on Ω is the same as not conditioning at all.
+        PrXY = PrXYcZ.given(1)
+        PrX = PrXcZ.given(1)
+        PrY = PrYcZ.given(1)
+        if isinstance(PrXY, ArrayPMF) and isinstance(PrX, ArrayPMF) and isinstance(PrY, ArrayPMF):
+            return abs(mutual_information__arrays(PrXY, PrX, PrY, base))
+
+    # The probabilities of x|z and y|z are looked up for each key of each
+    # PMF in PrXYcZ, so that the sum over all (x, y, z) runs over arrays.
+    x_width = key_width(key for pmf in PrXcZ.conditional_probabilities.values() for key in pmf.keys())
+    z_probabilities = []
+    xy_probabilities = []
+    x_probabilities = []
+    y_probabilities = []
+    for (z, PrXYgz) in PrXYcZ.items():
+        keys = list(PrXYgz.keys())
+        (x_keys, y_keys) = split_keys(keys, x_width)
+        z_probabilities.append(numpy.full(len(keys), PrZ.p_key(z)))
+        xy_probabilities.append(numpy.fromiter(PrXYgz.values(), dtype=float, count=len(keys)))
+        x_probabilities.append(lookup_probabilities(PrXcZ.given_key(z).probabilities, x_keys))
+        y_probabilities.append(lookup_probabilities(PrYcZ.given_key(z).probabilities, y_keys))
+
+    if len(xy_probabilities) == 0:
+        return 0.0
+    pz = numpy.concatenate(z_probabilities)
+    pxycz = numpy.concatenate(xy_probabilities)
+    pxcz = numpy.concatenate(x_probabilities)
+    pycz = numpy.concatenate(y_probabilities)
+    return conditional_mutual_information__probabilities(pz, pxycz, pxcz, pycz, base)
+
+
+
+def mutual_information__arrays(
+    PrXY: ArrayPMF,
+    PrX: ArrayPMF,
+    PrY: ArrayPMF,
+    base: Union[float, str] = 2,
+) -> float:
+
+    columns = PrXY.value_columns()
+    x_width = len(PrX.shape)
+
+    pxy = PrXY.probabilities_array
+    px = PrX.lookup(columns[:x_width])
+    py = PrY.lookup(columns[x_width:])
+    return mutual_information__probabilities(pxy, px, py, base)
+
+
+
+def conditional_mutual_information__arrays(
+    PrXYcZ: ArrayCPMF,
+    PrXcZ: ArrayCPMF,
+    PrYcZ: ArrayCPMF,
+    PrZ: ArrayPMF,
+    base: Union[float, str] = 2,
+) -> float:
+
+    z_columns = PrXYcZ.cond_value_columns()
+    xy_columns = PrXYcZ.var_value_columns()
+    x_width = len(PrXcZ.var_shape)
+
+    pxycz = PrXYcZ.probabilities_array
+    pz = PrZ.lookup(z_columns)
+    pxcz = PrXcZ.lookup(z_columns, xy_columns[:x_width])
+    pycz = PrYcZ.lookup(z_columns, xy_columns[x_width:])
+    return conditional_mutual_information__probabilities(pz, pxycz, pxcz, pycz, base)
+
+
+
+def mutual_information__probabilities(
+    pxy: numpy.ndarray,
+    px: numpy.ndarray,
+    py: numpy.ndarray,
+    base: Union[float, str] = 2,
+) -> float:
+    """
+    Calculate I(X;Y) from aligned arrays of probabilities, holding p(x, y),
+    p(x) and p(y) for each (x, y). The terms with a zero probability are
+    skipped.
+    """
+    nonzero = (pxy != 0) & (px != 0) & (py != 0)
+    pxy = pxy[nonzero]
+    logarithm = create_array_logarithm_function(base)
+    return float(numpy.sum(pxy * logarithm(pxy / (px[nonzero] * py[nonzero]))))
+
+
+
+def conditional_mutual_information__probabilities(
+    pz: numpy.ndarray,
+    pxycz: numpy.ndarray,
+    pxcz: numpy.ndarray,
+    pycz: numpy.ndarray,
+    base: Union[float, str] = 2,
+) -> float:
+    """
+    Calculate I(X;Y|Z) from aligned arrays of probabilities, holding p(z),
+    p(x, y | z), p(x | z) and p(y | z) for each (x, y, z). The terms with a
+    zero probability are skipped.
+    """
+    nonzero = (pxycz != 0) & (pz != 0) & (pxcz != 0) & (pycz != 0)
+    pxycz = pxycz[nonzero]
+    logarithm = create_array_logarithm_function(base)
+    cMI = numpy.sum(pz[nonzero] * pxycz * logarithm(pxycz / (pxcz[nonzero] * pycz[nonzero])))
+    return abs(float(cMI))
+
+
+
+def conditional_mutual_information__joint(
+    PrXYZ: PMF,
+    x_positions: list[int],
+    y_positions: list[int],
+    base: Union[float, str] = 2,
+) -> float:
+    """
+    Calculate I(X;Y|Z) from the joint PMF of X, Y and Z alone. The
+    x_positions and y_positions are the positions of the variables X and Y
+    in the keys of PrXYZ; all the other positions belong to Z, which may
+    also be empty, in which case I(X;Y) is calculated.
+    """
+    (columns, weights) = key_columns(PrXYZ)
+    z_positions = [i for i in range(len(columns)) if i not in x_positions and i not in y_positions]
+    x_codes = combine_codes([columns[i] for i in x_positions], len(weights))
+    y_codes = combine_codes([columns[i] for i in y_positions], len(weights))
+    z_codes = combine_codes([columns[i] for i in z_positions], len(weights))
+    return conditional_mutual_information__counts(x_codes, y_codes, z_codes, weights, base)
+
+
+
+def mutual_information__counts(
+    x_codes: numpy.ndarray,
+    y_codes: numpy.ndarray,
+    counts: Union[numpy.ndarray, None] = None,
+    base: Union[float, str] = 2,
+) -> float:
+    """
+    Calculate I(X;Y) in a single vectorized pass over rows of integer codes,
+    where each row (x_codes[i], y_codes[i]) has been observed counts[i]
+    times. The counts may also be probabilities or any other weights. If
+    counts is None, each row is a single sample. Rows may repeat.
+    """
+    z_codes = numpy.zeros(len(x_codes), dtype=numpy.int64)
+    return information__counts(x_codes, y_codes, z_codes, counts, base)
+
+
+
+def conditional_mutual_information__counts(
+    x_codes: numpy.ndarray,
+    y_codes: numpy.ndarray,
+    z_codes: numpy.ndarray,
+    counts: Union[numpy.ndarray, None] = None,
+    base: Union[float, str] = 2,
+) -> float:
+    """
+    Calculate I(X;Y|Z) in a single vectorized pass over rows of integer
+    codes, where each row (x_codes[i], y_codes[i], z_codes[i]) has been
+    observed counts[i] times. The counts may also be probabilities or any
+    other weights. If counts is None, each row is a single sample. Rows may
+    repeat.
+    """
+    return abs(information__counts(x_codes, y_codes, z_codes, counts, base))
+
+
+
+def information__counts(
+    x_codes: numpy.ndarray,
+    y_codes: numpy.ndarray,
+    z_codes: numpy.ndarray,
+    counts: Union[numpy.ndarray, None],
+    base: Union[float, str],
+) -> float:
+    if counts is None:
+        counts = numpy.ones(len(x_codes))
+    counts = numpy.asarray(counts, dtype=float)
+
+    N = numpy.sum(counts)
+    if len(counts) == 0 or N == 0:
+        return 0.0
+
+    # The counts of each (x, y, z), (x, z), (y, z) and z, for every row:
+    #   I(X;Y|Z) = Σ n(x,y,z)/N · log(n(x,y,z) · n(z) / (n(x,z) · n(y,z)))
+    n_xyz = counts_per_row(combine_codes([x_codes, y_codes, z_codes], len(counts)), counts)
+    n_xz = counts_per_row(combine_codes([x_codes, z_codes], len(counts)), counts)
+    n_yz = counts_per_row(combine_codes([y_codes, z_codes], len(counts)), counts)
+    n_z = counts_per_row(combine_codes([z_codes], len(counts)), counts)
+
+    nonzero = counts != 0
+    logarithm = create_array_logarithm_function(base)
+    ratios = (n_xyz[nonzero] * n_z[nonzero]) / (n_xz[nonzero] * n_yz[nonzero])
+    return float(numpy.sum(counts[nonzero] * logarithm(ratios)) / N)
+
+
+
+def counts_per_row(codes, counts):
+    return numpy.bincount(codes, weights=counts)[codes]
+
+
+
+def combine_codes(columns, count):
+    """
+    Combine columns of codes (or values) into a single array of codes, such
+    that rows with equal values in all the columns receive equal codes. The
+    codes are compact, i.e. between 0 and the number of distinct rows.
+    """
+    if len(columns) == 0:
+        return numpy.zeros(count, dtype=numpy.int64)
+    if len(columns) == 1:
+        (_, codes) = numpy.unique(columns[0], return_inverse=True)
+        return codes.reshape(-1)
+    (_, codes) = numpy.unique(numpy.column_stack(columns), axis=0, return_inverse=True)
+    return codes.reshape(-1)
+
+
+
+def key_columns(pmf: PMF) -> tuple[list[numpy.ndarray], numpy.ndarray]:
+    """
+    Return the keys of the PMF as columns of codes, one for each variable,
+    along with the array of their probabilities.
+    """
+    if isinstance(pmf, ArrayPMF):
+        columns = list(numpy.unravel_index(pmf.codes, pmf.shape))
+        return (columns, pmf.probabilities_array)
+
+    if pmf.encoded_counts is not None:
+        # The keys have not been decoded yet, so they need not be at all.
+        (_, shape, codes, counts) = pmf.encoded_counts
+        columns = list(numpy.unravel_index(codes, shape))
+        return (columns, counts / pmf.total_count)
+
+    keys = []
+    probabilities = []
+    for (key, p) in pmf.items():
+        keys.append(key if isinstance(key, tuple) else (key,))
+        probabilities.append(p)
+    return (encode_keys(keys), numpy.array(probabilities, dtype=float))
+
+
+
+def encode_keys(keys: list[tuple]) -> list[numpy.ndarray]:
+    """
+    Encode a list of equally long tuples of hashable values into columns of
+    integer codes, one for each position in the tuples.
+    """
+    if len(keys) == 0:
+        return []
+
+    columns = []
+    for position in range(len(keys[0])):
+        codes_of_values: dict = dict()
+        column = [codes_of_values.setdefault(key[position], len(codes_of_values)) for key in keys]
+        columns.append(numpy.array(column, dtype=numpy.int64))
+    return columns
+
+
+
+def key_width(keys: Iterable) -> int:
+    """
+    Return the number of values in the first of the given keys of a PMF.
+    """
+    for key in keys:
+        return len(key) if isinstance(key, tuple) else 1
+    return 1
+
+
+
+def split_keys(keys: list, width: int) -> tuple[list, list]:
+    """
+    Split equally long joint keys of a PMF into the keys formed by their
+    first width values and the keys formed by the rest of their values, both
+    in the canonical form of the keys of PMFs (see canonical_key()).
+    """
+    if len(keys) == 0:
+        return ([], [])
+    if not isinstance(keys[0], tuple):
+        return (keys, [tuple()] * len(keys))
+    rest = len(keys[0]) - width
+    heads = [key[0] for key in keys] if width == 1 else [key[:width] for key in keys]
+    tails = [key[width] for key in keys] if rest == 1 else [key[width:] for key in keys]
+    return (heads, tails)
+
+
+
+def lookup_probabilities(probabilities: dict, keys: list) -> numpy.ndarray:
+    return numpy.fromiter((probabilities.get(key, 0.0) for key in keys), dtype=float, count=len(keys))
 
 
 
@@ -83,3 +360,16 @@ def create_logarithm_function(base: Union[str, float]) -> Callable[[float], floa
     else:
         assert isinstance(base, float)
         return lambda x: math.log(x, float(base))
+
+
+
+def create_array_logarithm_function(base: Union[str, float]) -> Callable[[numpy.ndarray], numpy.ndarray]:
+    if base == 'e':
+        return numpy.log
+    elif base == 2:
+        return numpy.log2
+    elif base == 10:
+        return numpy.log10
+    else:
+        assert isinstance(base, float)
+        return lambda x: numpy.log(x) / math.log(float(base))
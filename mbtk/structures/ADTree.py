@@ -2,6 +2,7 @@ import time
 import collections
 
 from mbtk.math.PMF import PMF
+import mbtk.utilities.functions as util
 from mbtk.structures.ContingencyTree import ContingencyTreeNode
 
 
@@ -234,7 +235,7 @@ class ADNode:
         self.level = level
         self.row_selection = row_selection
         if self.row_selection is None:
-            self.count = tree.matrix.get_shape()[0]
+            self.count = tree.matrix.shape[0]
         else:
             self.count = len(self.row_selection)
         self.column_index = column_index
@@ -255,7 +256,7 @@ class ADNode:
             return
 
         VaryNodeClass = self.VaryNodeClass
-        column_count = tree.matrix.get_shape()[1]
+        column_count = tree.matrix.shape[1]
         for column_index in range(self.column_index + 1, column_count):
             node = VaryNodeClass(tree, column_index, self.row_selection, level=self.level + 1)
             # TODO insert directly at a proper index, after having created
@@ -333,12 +334,12 @@ class ADNode:
         ct = ContingencyTreeNode(self.column_index, self.value, None)
 
         if len(columns) == 1:
-            column = matrix.getcol(columns[0]).toarray()
+            column = util.matrix_column(matrix, columns[0])
             for row_index in self.row_selection:
-                key = [column[row_index, 0]]
+                key = [column[row_index]]
                 ct.add_count_to_leaf(columns, key, 1)
         else:
-            submatrix = matrix[:, columns].toarray()
+            submatrix = util.matrix_columns(matrix, columns)
             for row_index in self.row_selection:
                 key = submatrix[row_index, :]
                 ct.add_count_to_leaf(columns, key, 1)
@@ -417,7 +418,7 @@ class VaryNode:
         if self.row_selection is None:
             # If row_selection isn't set yet, initialize it to cover all the
             # rows.
-            row_count = tree.matrix.get_shape()[0]
+            row_count = tree.matrix.shape[0]
             self.row_selection = range(0, row_count)
 
         # Iterate over the rows in self.row_selection, putting each row_index
@@ -426,7 +427,7 @@ class VaryNode:
         try:
             column = tree.column_cache[self.column_index]
         except KeyError:
-            column = tree.matrix.getcol(self.column_index).transpose().toarray().ravel()
+            column = util.matrix_column(tree.matrix, self.column_index)
             tree.column_cache[self.column_index] = column
 
         for row_index in self.row_selection:
@@ -6,18 +6,26 @@ import operator
 import random
 import copy
 import pickle
+import multiprocessing
+import os
+import fcntl
+import hashlib
+import contextlib
 
 import numpy
 
 from collections import OrderedDict
 from pathlib import Path
-from typing import cast
+from typing import Union
 
 from mbtk.math.PMF import PMF
+from mbtk.math.VariableElimination import VariableElimination
+from mbtk.structures.MethodCache import MethodCache
 from mbtk.structures.Exceptions import BayesianNetworkNotFinalizedError
 
 
 def finalization_required(func):
+    @functools.wraps(func)
     def wrapper_guard_finalized(*args, **kwargs):
         instance = args[0]
         if instance.finalized is False:
@@ -27,7 +35,66 @@ def finalization_required(func):
     return wrapper_guard_finalized
 
 
+
+def cached_method(func):
+    """
+    Cache the results of a method of :class:`BayesianNetwork` in the
+    :class:`MethodCache <mbtk.structures.MethodCache.MethodCache>` named
+    after the method, found in the ``caches`` of the instance (see
+    py:meth:`BayesianNetwork.get_cache`). The arguments must be hashable.
+    """
+    cache_name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper_cached(self, *args, **kwargs):
+        key = args
+        if len(kwargs) > 0:
+            key = args + tuple(sorted(kwargs.items()))
+        return self.get_cache(cache_name).get(key, lambda: func(self, *args, **kwargs))
+    return wrapper_cached
+
+
 class BayesianNetwork:
+    """
+    A Bayesian network of discrete :class:`VariableNode` instances, usually
+    read from a BIF file.
+
+    The results of the expensive graph and inference methods are memoized in
+    the bounded :class:`MethodCache <mbtk.structures.MethodCache.MethodCache>`
+    instances of ``caches``, one per method, with the limits given by
+    ``cache_sizes``. The caches are cleared by py:meth:`finalize` and by
+    py:meth:`clear_caches`, their statistics are reported by
+    py:meth:`cache_statistics`, and the caches listed in
+    ``persistent_caches`` can be saved next to the BIF file with
+    py:meth:`save_caches`, to be reused by other processes and runs through
+    py:meth:`load_caches`.
+    """
+
+    # Created by py:meth:`finalize`.
+    variable_elimination: VariableElimination
+
+    sampling_block_size = 2 ** 16
+
+    cache_sizes = {
+        'create_joint_pmf': 4,
+        'create_partial_joint_pmf': 4096,
+        'get_subnetwork': 256,
+        'get_subnetwork_node_IDs': 65536,
+        'find_all_paths_recursive_cached': 2 ** 20,
+        'variable_elimination': 65536,
+        'd_separated_from': 65536,
+    }
+
+    persistent_caches = [
+        'create_partial_joint_pmf',
+        'get_subnetwork_node_IDs',
+        'variable_elimination',
+        'd_separated_from',
+    ]
+
+    # Networks pickled before the caches existed lack this attribute, so
+    # py:meth:`get_cache` creates it on demand.
+    caches: Union[dict[str, MethodCache], None] = None
 
     def __init__(self, name):
         self.name = name
@@ -39,6 +106,9 @@ class BayesianNetwork:
         self.variable_node_names__sampling_order = []
         self.joint_pmf_size = 0
         self.graph = None
+        self.variable_elimination = None
+        self.caches = None
+        self.sourcepath = None
         self.finalized = False
 
 
@@ -116,15 +186,141 @@ class BayesianNetwork:
 
 
     @finalization_required
-    def sample_matrix(self, n=1, dtype=None):
+    def sample_matrix(self, n=1, dtype=None, random_generator=None):
+        """
+        Generate a matrix of ``n`` samples, with the values as indices and the
+        columns ordered by py:meth:`variable_node_names`.
+
+        The VariableNodes are sampled in ``self.variable_nodes__sampling_order``,
+        each one for all the rows of a block at once, by looking up the
+        cummulative probabilities for the indices already sampled for its
+        conditioning VariableNodes. The rolls are drawn from
+        ``random_generator``, a ``numpy.random.Generator``. If it is not
+        given, the rolls continue the stream of Python's global ``random``
+        module, which is then advanced past them, so ``random.seed()`` yields
+        exactly the same samples as calling py:meth:`samples`.
+        """
+        if dtype is None:
+            dtype = self.sampling_dtype()
+
+        use_python_random = random_generator is None
+        if use_python_random:
+            random_generator = numpy_generator_from_python_random()
+
+        matrix = numpy.empty((n, len(self.variable_nodes)), dtype=dtype)
+        for start in range(0, n, self.sampling_block_size):
+            block = matrix[start:start + self.sampling_block_size]
+            rolls = random_generator.random((block.shape[0], len(self.variable_nodes__sampling_order)))
+            self.sample_block(block, rolls)
+
+        if use_python_random:
+            advance_python_random_to_numpy_generator(random_generator)
+
+        return matrix
+
+
+    @finalization_required
+    def sample_matrix_in_blocks(self, n, random_seed, block_size=None, workers=1, dtype=None):
+        """
+        Generate a matrix of ``n`` samples like py:meth:`sample_matrix`, but
+        split into blocks of ``block_size`` rows, which are sampled by a pool
+        of ``workers`` processes (see py:meth:`sample_blocks`).
+        """
+        if dtype is None:
+            dtype = self.sampling_dtype()
+
+        matrix = numpy.empty((n, len(self.variable_nodes)), dtype=dtype)
+        for start, block in self.sample_blocks(n, random_seed, block_size, workers, dtype):
+            matrix[start:start + block.shape[0]] = block
+
+        return matrix
+
+
+    @finalization_required
+    def sample_blocks(self, n, random_seed, block_size=None, workers=1, dtype=None):
         """
-        Generate a matrix of ``n`` samples by calling py:meth:`samples` then
-        converting its result into a NumPy array.
+        Generate ``n`` samples in consecutive blocks of ``block_size`` rows,
+        yielding the pairs ``(start, block)`` in order, where ``start`` is
+        the index of the first row of the block. Only the blocks being
+        sampled or waiting to be consumed are kept in memory.
+
+        Each block draws its rolls from its own child of
+        ``numpy.random.SeedSequence(random_seed)``, spawned in the order of
+        the blocks. The samples therefore only depend on ``random_seed`` and
+        ``block_size``, and are identical for any number of workers. Python's
+        global ``random`` module is not used at all.
         """
         if dtype is None:
-            dtype = numpy.int8
-        samples = self.samples(n, as_list=True, values_as_indices=True)
-        return numpy.asarray(list(samples), dtype=dtype)
+            dtype = self.sampling_dtype()
+        if block_size is None:
+            block_size = self.sampling_block_size
+
+        block_starts = range(0, n, block_size)
+        seed_sequences = numpy.random.SeedSequence(random_seed).spawn(len(block_starts))
+        tasks = [(min(block_size, n - start), seed_sequence, dtype) for start, seed_sequence in zip(block_starts, seed_sequences)]
+
+        if workers == 1:
+            yield from zip(block_starts, map(self.sample_seeded_block, tasks))
+        else:
+            with multiprocessing.Pool(workers, initializer=init_sampling_worker, initargs=(self,)) as pool:
+                yield from zip(block_starts, pool.imap(sample_seeded_block_in_worker, tasks))
+
+
+    @finalization_required
+    def sample_seeded_block(self, task):
+        """
+        Sample a block of ``row_count`` rows, with rolls drawn from a
+        generator seeded by ``seed_sequence``, where ``task`` is the tuple
+        ``(row_count, seed_sequence, dtype)``.
+        """
+        row_count, seed_sequence, dtype = task
+        random_generator = numpy.random.default_rng(seed_sequence)
+        block = numpy.empty((row_count, len(self.variable_nodes)), dtype=dtype)
+        rolls = random_generator.random((row_count, len(self.variable_nodes__sampling_order)))
+        self.sample_block(block, rolls)
+        return block
+
+
+    def sampling_dtype(self):
+        """
+        Return the narrowest signed integer dtype which can hold the indices
+        of the values of every VariableNode, used by default for sampled
+        matrices.
+        """
+        max_index = self.max_value_index()
+        for dtype in [numpy.int8, numpy.int16, numpy.int32]:
+            if max_index <= numpy.iinfo(dtype).max:
+                return dtype
+        return numpy.int64
+
+
+    def max_value_index(self) -> int:
+        return max([len(variable.values) - 1 for variable in self.variable_nodes.values()], default=0)
+
+
+    @finalization_required
+    def sample_block(self, block, rolls):
+        """
+        Fill the rows of ``block`` with samples, using ``rolls[:, j]`` as the
+        rolls of the ``j``-th VariableNode in the sampling order.
+        """
+        if numpy.issubdtype(block.dtype, numpy.integer) and self.max_value_index() > numpy.iinfo(block.dtype).max:
+            raise ValueError('The indices of the values of the BayesianNetwork {} do not fit in {}, use a wider dtype such as {}.'.format(self.name, block.dtype, numpy.dtype(self.sampling_dtype())))
+
+        for j, variable in enumerate(self.variable_nodes__sampling_order):
+            probdist = variable.probdist
+            rows = numpy.zeros(block.shape[0], dtype=numpy.intp)
+            for cond_varname, stride in zip(probdist.conditioning_variable_nodes.keys(), probdist.conditioning_strides):
+                cond_column = block[:, self.variable_nodes_index(cond_varname)]
+                rows += cond_column.astype(numpy.intp) * stride
+
+            # The sampled index is the first one whose cummulative probability
+            # reaches the roll, i.e. the count of the cummulative
+            # probabilities below the roll, as in sample_roll().
+            cummulative_probabilities = probdist.cummulative_probabilities_rows()[rows]
+            indices = numpy.count_nonzero(cummulative_probabilities < rolls[:, j, numpy.newaxis], axis=1)
+            numpy.minimum(indices, len(variable.values) - 1, out=indices)
+            block[:, self.variable_nodes_index(variable.name)] = indices
 
 
     def sample_values_to_indices(self, sample):
@@ -135,7 +331,7 @@ class BayesianNetwork:
         """
         sample_with_indices = {}
         for varname, value in sample.items():
-            sample_with_indices[varname] = self.variable_nodes[varname].values.index(value)
+            sample_with_indices[varname] = self.variable_nodes[varname].value_indices[value]
 
         return sample_with_indices
 
@@ -148,7 +344,7 @@ class BayesianNetwork:
 
 
 
-    @functools.cache
+    @cached_method
     @finalization_required
     def create_joint_pmf(self, values_as_indices=True) -> PMF:
         pmf = PMF(None)
@@ -159,49 +355,70 @@ class BayesianNetwork:
 
 
     @finalization_required
-    def joint_values_and_probabilities(self, values_as_indices=True, joint_vp=None, current_value=None, current_probability=1.0):
-        if joint_vp is None:
-            joint_vp = dict()
-
-        if current_value is None:
-            current_value = dict()
+    def joint_values_and_probabilities(self, values_as_indices=True):
+        """
+        Return a dictionary which maps every combination of values of the
+        VariableNodes, as a tuple ordered by py:meth:`variable_node_names`, to
+        its joint probability (see py:meth:`joint_probabilities_array`).
+        """
+        joint_probabilities = self.joint_probabilities_array()
+        index_columns = numpy.unravel_index(numpy.arange(joint_probabilities.size), joint_probabilities.shape)
+        axes = {varname: axis for axis, varname in enumerate(self.variable_node_names__sampling_order)}
 
-        if len(current_value) == len(self.variable_nodes__sampling_order):
+        key_columns = []
+        for varname in self.variable_node_names():
+            indices = index_columns[axes[varname]].tolist()
             if values_as_indices:
-                current_value = self.sample_values_to_indices(current_value)
-            current_value_as_list = self.sample_as_list(current_value)
-            current_value_tuple = tuple(current_value_as_list)
-            joint_vp[current_value_tuple] = current_probability
-            return joint_vp
-
-        current_variable = self.variable_nodes__sampling_order[len(current_value)]
-        for value in current_variable.values:
-            conditioning_values = current_variable.get_conditioning_values_from_partial_sample(current_value)
-            if len(conditioning_values) == 0:
-                conditioning_values = '<unconditioned>'
-            current_value_probability = current_probability * current_variable.probability_of_value(value, conditioning_values)
-            current_value[current_variable.name] = value
-            self.joint_values_and_probabilities(values_as_indices, joint_vp, current_value, current_value_probability)
+                key_columns.append(indices)
+            else:
+                values = self.variable_nodes[varname].values
+                key_columns.append([values[index] for index in indices])
 
-        del current_value[current_variable.name]
-        return joint_vp
+        return dict(zip(zip(*key_columns), joint_probabilities.ravel().tolist()))
 
 
-    @functools.cache
     @finalization_required
-    def create_partial_joint_pmf(self, variables: tuple[int]) -> PMF:
-        subnetwork = self.get_subnetwork(variables)
+    def joint_probabilities_array(self):
+        """
+        Compute the joint probabilities of all the combinations of values of
+        the VariableNodes as an array with one axis per VariableNode, in the
+        sampling order. Each CPT array is broadcast over the axes of its
+        VariableNode and conditioning VariableNodes, and the CPTs are
+        multiplied in the sampling order, so each joint probability is the
+        same product as the one computed by sampling the VariableNodes one by
+        one.
+        """
+        axes = {varname: axis for axis, varname in enumerate(self.variable_node_names__sampling_order)}
+        shape = tuple(len(variable.values) for variable in self.variable_nodes__sampling_order)
 
-        joint_pmf: PMF = subnetwork.create_joint_pmf()
+        joint_probabilities = numpy.ones(shape, dtype=numpy.float64)
+        for variable in self.variable_nodes__sampling_order:
+            probdist = variable.probdist
+            cpt_axes = [axes[varname] for varname in probdist.conditioning_variable_nodes.keys()]
+            cpt_axes.append(axes[variable.name])
+            cpt = probdist.probabilities_array.transpose(numpy.argsort(cpt_axes))
+            broadcast_shape = [1] * len(shape)
+            for axis in cpt_axes:
+                broadcast_shape[axis] = shape[axis]
+            joint_probabilities *= cpt.reshape(broadcast_shape)
 
-        variables_to_sum_over = set(joint_pmf.IDs()) - set(variables)
-        for variable in variables_to_sum_over:
-            joint_pmf = joint_pmf.sum_over(variable)
+        return joint_probabilities
 
-        return joint_pmf
 
+    @cached_method
+    @finalization_required
+    def create_partial_joint_pmf(self, variables: tuple[int]) -> PMF:
+        """
+        Create the joint PMF of the variables with the IDs ``variables``, by
+        variable elimination (see :class:`VariableElimination
+        <mbtk.math.VariableElimination.VariableElimination>`). The keys of the
+        PMF are made of the indices of the values of the variables, in
+        ascending order of their IDs.
+        """
+        return self.variable_elimination.marginal(variables).as_pmf()
 
-    @functools.cache
+
+    @cached_method
     @finalization_required
     def get_subnetwork(self, variables: tuple[int]) -> BayesianNetwork:
         subnetwork_nodes = self.get_nodes_by_ID(list(variables))
@@ -228,24 +445,17 @@ class BayesianNetwork:
         return subnetwork_nodes
 
 
-    @functools.cache
+    @cached_method
     @finalization_required
-    def get_subnetwork_node_IDs(self, node_IDs: tuple[int]) -> tuple[int]:
-        parents: set[int] = set()
+    def get_subnetwork_node_IDs(self, node_IDs: tuple[int, ...]) -> tuple[int, ...]:
+        """
+        Return the IDs of the nodes ``node_IDs`` and of all their ancestors,
+        in ascending order.
+        """
+        bits = IDs_as_bits(node_IDs)
         for node_ID in node_IDs:
-            node = self.variable_nodes_by_ID[node_ID]
-            parent_names = node.probdist.conditioning_variable_nodes.keys()
-            for parent_name in parent_names:
-                parent_ID = self.variable_nodes_index(parent_name)
-                parents.add(parent_ID)
-
-        if len(parents) > 0:
-            ancestors: tuple[int] = self.get_subnetwork_node_IDs(tuple(parents))
-            parents = parents | set(ancestors)
-
-        new_node_IDs = tuple(set(node_IDs) | set(parents))
-        node_IDs = cast(tuple[int], new_node_IDs)
-        return node_IDs
+            bits |= self.ancestor_bits[node_ID]
+        return bits_as_IDs(bits)
 
 
     def get_nodes_by_name(self, node_names: list[str]) -> dict[int, VariableNode]:
@@ -275,6 +485,8 @@ class BayesianNetwork:
 
 
     def finalize(self):
+        for variable in self.variable_nodes.values():
+            variable.value_indices = variable.create_value_indices()
         for variable in self.variable_nodes.values():
             variable.probdist.finalize()
 
@@ -293,10 +505,129 @@ class BayesianNetwork:
 
         self.graph_d = self.as_directed_graph()
         self.graph_u = self.as_undirected_graph()
+        self.create_graph_closures()
 
         self.joint_pmf_size = self.calculate_joint_pmf_size()
 
         self.finalized = True
+        self.clear_caches()
+        self.variable_elimination = VariableElimination(self, self.get_cache('variable_elimination'))
+
+
+
+    def get_cache(self, name) -> MethodCache:
+        if self.caches is None:
+            self.caches = {}
+        try:
+            return self.caches[name]
+        except KeyError:
+            cache = MethodCache(self.cache_sizes.get(name, None))
+            self.caches[name] = cache
+            return cache
+
+
+    def set_cache_size(self, name, max_entries):
+        self.get_cache(name).resize(max_entries)
+
+
+    def clear_caches(self, names=None):
+        """
+        Invalidate the results cached for the methods in ``names``, or for
+        all methods if ``names`` is ``None``.
+        """
+        if names is None:
+            names = list(self.caches or {})
+        for name in names:
+            self.get_cache(name).clear()
+
+
+    def cache_statistics(self):
+        return {name: cache.statistics() for name, cache in (self.caches or {}).items()}
+
+
+    def cache_stamp(self):
+        """
+        Identify this network by its name and by a hash of its variables,
+        their values, their parents and their CPTs, so that persisted caches
+        are only loaded into the network they were computed for, and not
+        into a network whose BIF file has been edited since.
+        """
+        digest = hashlib.sha256()
+        for varname in self.variable_node_names():
+            variable = self.variable_nodes[varname]
+            probdist = variable.probdist
+            conditioning_varnames = list(probdist.conditioning_variable_nodes.keys())
+            digest.update(repr((varname, variable.values, conditioning_varnames)).encode())
+            digest.update(probdist.probabilities_array.tobytes())
+        return (self.name, digest.hexdigest())
+
+
+    def default_caches_path(self):
+        if self.sourcepath is None:
+            raise ValueError('The BayesianNetwork {} was not read from a BIF file, so a path is required to save or load its caches.'.format(self.name))
+        return self.sourcepath.with_suffix('.caches.pickle')
+
+
+    @finalization_required
+    def save_caches(self, path=None, names=None):
+        """
+        Save the entries of the caches in ``names`` (by default those in
+        ``persistent_caches``) into ``path``, by default next to the BIF file
+        the network was read from. The entries already saved in ``path`` by
+        other processes or runs are kept, unless they are also cached here,
+        and then each cache is trimmed to the ``max_entries`` of its
+        :class:`MethodCache`, dropping the oldest entries. Saving holds an
+        exclusive lock on a sidecar lock file, so that processes saving into
+        the same file keep each other's entries, and the file is replaced
+        atomically, so that readers never see it partially written.
+        """
+        if path is None:
+            path = self.default_caches_path()
+        if names is None:
+            names = self.persistent_caches
+
+        with saved_caches_lock(path):
+            saved_entries = self.read_saved_caches(path)
+            for name in names:
+                cache = self.get_cache(name)
+                entries = saved_entries.setdefault(name, {})
+                # The entries of this network are the most recent ones.
+                for key, result in cache.entries.items():
+                    entries.pop(key, None)
+                    entries[key] = result
+                saved_entries[name] = trim_entries(entries, cache.max_entries)
+
+            temporary_path = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+            with temporary_path.open('wb') as f:
+                pickle.dump((self.cache_stamp(), saved_entries), f)
+            os.replace(temporary_path, path)
+
+
+    @finalization_required
+    def load_caches(self, path=None):
+        """
+        Add the entries saved by py:meth:`save_caches` in ``path`` to the
+        caches of this network, and return whether any were found.
+        """
+        if path is None:
+            path = self.default_caches_path()
+
+        saved_entries = self.read_saved_caches(path)
+        for name, entries in saved_entries.items():
+            self.get_cache(name).update(entries)
+        return len(saved_entries) > 0
+
+
+    def read_saved_caches(self, path):
+        try:
+            with path.open('rb') as f:
+                (stamp, saved_entries) = pickle.load(f)
+        except FileNotFoundError:
+            return {}
+
+        if stamp != self.cache_stamp():
+            return {}
+        return saved_entries
 
 
 
@@ -335,6 +666,61 @@ class BayesianNetwork:
         return graph
 
 
+    def create_graph_closures(self):
+        """
+        Create the structures needed by py:meth:`d_connected_nodes` and
+        py:meth:`get_subnetwork_node_IDs` from ``self.graph_d``: the parents
+        of each node, in ``self.graph_d_parents``, and the descendants and
+        ancestors of each node, in ``self.descendant_bits`` and
+        ``self.ancestor_bits``. The descendants and ancestors are bitsets
+        stored as integers, where bit ``i`` is set if the node with ID ``i``
+        is present (see py:func:`IDs_as_bits` and py:func:`bits_as_IDs`), so
+        that queries on them become bitwise operations.
+        """
+        self.graph_d_parents = {node: [] for node in self.graph_d}
+        for node, children in self.graph_d.items():
+            for child in children:
+                self.graph_d_parents[child].append(node)
+
+        self.descendant_bits = self.create_closure_bits(self.graph_d)
+        self.ancestor_bits = self.create_closure_bits(self.graph_d_parents)
+
+
+    def create_closure_bits(self, graph) -> dict[int, int]:
+        """
+        Create the bitset of all the nodes reachable from each node of the
+        acyclic ``graph``, which maps each node to its direct successors.
+        """
+        closure: dict[int, int] = {}
+        for node in graph:
+            # Iterative post-order traversal, to avoid exceeding the
+            # recursion limit on deep networks.
+            stack = [node]
+            while len(stack) > 0:
+                current = stack[-1]
+                if current in closure:
+                    stack.pop()
+                    continue
+                pending = [successor for successor in graph[current] if successor not in closure]
+                if len(pending) > 0:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+                bits = 0
+                for successor in graph[current]:
+                    bits |= (1 << successor) | closure[successor]
+                closure[current] = bits
+        return closure
+
+
+    def get_descendant_IDs(self, node_ID) -> tuple[int, ...]:
+        return bits_as_IDs(self.descendant_bits[node_ID])
+
+
+    def get_ancestor_IDs(self, node_ID) -> tuple[int, ...]:
+        return bits_as_IDs(self.ancestor_bits[node_ID])
+
+
     def as_undirected_graph(self):
         graph = {}
         for node in self.variable_nodes.values():
@@ -396,6 +782,9 @@ class BayesianNetwork:
             except KeyError:
                 self.graph_d[node] = []
 
+        self.create_graph_closures()
+        self.clear_caches()
+
 
     def conditionally_independent(self, x, y, conditioning_set):
         return self.d_separated(x, conditioning_set, y)
@@ -404,22 +793,93 @@ class BayesianNetwork:
     def d_separated(self, x, separators, y):
         if isinstance(separators, int):
             separators = [separators]
-        paths = self.find_all_undirected_paths(x, y)
-        for path in paths:
-            if not self.is_path_blocked_by_nodes(path, separators):
-                return False
-        return True
+        separators = frozenset(separators)
+
+        # D-separation is symmetric, so the query can be answered from the
+        # nodes d-separated from either x or y. Algorithms usually test many
+        # variables against the same target under the same separators, so
+        # prefer the endpoint whose answer is already cached.
+        cache = self.get_cache('d_separated_from')
+        if (x, separators) not in cache and (y, separators) in cache:
+            (x, y) = (y, x)
+        return y in self.d_separated_from(x, separators)
+
+
+    def d_separated_from(self, x, separators) -> frozenset[int]:
+        """
+        Return all the nodes d-separated from ``x`` by the nodes in
+        ``separators``, as found by a single pass of py:meth:`d_connected_nodes`.
+        The results are cached by ``(x, frozenset(separators))``.
+        """
+        separators = frozenset(separators)
+
+        def find_d_separated_nodes() -> frozenset[int]:
+            return frozenset(self.graph_d.keys() - self.d_connected_nodes(x, separators))
+        d_separated_nodes: frozenset[int] = self.get_cache('d_separated_from').get((x, separators), find_d_separated_nodes)
+        return d_separated_nodes
+
+
+    def d_connected_nodes(self, x, separators):
+        """
+        Find all the nodes connected to ``x`` by a trail which is active given
+        the nodes in ``separators``, in time linear in the size of the graph,
+        using the reachability algorithm from "Probabilistic Graphical Models"
+        by Koller and Friedman, 2009 (Algorithm 3.1), also known as Bayes-Ball.
+
+        The trails are traversed as (node, direction) pairs, where 'up' means
+        the trail arrived at the node from one of its children and 'down'
+        from one of its parents. A trail passes through a node in
+        ``separators`` only if the node is a collider, and through a collider
+        only if the collider or one of its descendants is in ``separators``.
+        Like the endpoints of the paths checked by py:meth:`is_path_blocked_by_nodes`,
+        ``x`` and the returned nodes themselves are never blocked, even if
+        they are in ``separators``.
+        """
+        separators = set(separators)
+        separator_bits = IDs_as_bits(separators)
+        up, down = 0, 1
+
+        visited = set()
+        reached = {x}
+        pending = []
+        for parent in self.graph_d_parents[x]:
+            pending.append((parent, up))
+        for child in self.graph_d[x]:
+            pending.append((child, down))
+
+        while len(pending) > 0:
+            node_direction = pending.pop()
+            if node_direction in visited:
+                continue
+            visited.add(node_direction)
+            (node, direction) = node_direction
+            reached.add(node)
+
+            conditioned_on = node in separators
+            if direction == up and not conditioned_on:
+                for parent in self.graph_d_parents[node]:
+                    pending.append((parent, up))
+                for child in self.graph_d[node]:
+                    pending.append((child, down))
+            elif direction == down:
+                if not conditioned_on:
+                    for child in self.graph_d[node]:
+                        pending.append((child, down))
+                if conditioned_on or self.descendant_bits[node] & separator_bits:
+                    for parent in self.graph_d_parents[node]:
+                        pending.append((parent, up))
+
+        return reached
 
 
     def is_path_blocked_by_nodes(self, path, conditioning_nodes):
+        conditioning_bits = IDs_as_bits(conditioning_nodes)
         for i, node in enumerate(path):
             if i == 0 or i == (len(path) - 1):
                 continue
-            descendants = self.graph_d[node]
             is_collider = self.is_node_collider(path, i)
             is_conditioned_on = node in conditioning_nodes
-            descendants_in_conditioning_nodes = set(descendants) & set(conditioning_nodes)
-            has_descendants_in_conditioning_nodes = (len(descendants_in_conditioning_nodes) > 0)
+            has_descendants_in_conditioning_nodes = (self.descendant_bits[node] & conditioning_bits) != 0
 
             if is_collider:
                 if not is_conditioned_on and not has_descendants_in_conditioning_nodes:
@@ -473,7 +933,7 @@ class BayesianNetwork:
         return paths
 
 
-    @functools.cache
+    @cached_method
     def find_all_paths_recursive_cached(self, start, end, path=None):
         if path is None:
             path = tuple()
@@ -547,6 +1007,8 @@ class VariableNode:
         BayesianNetwork instance.
     :var list(str) values: The list of possible values this VariableNode can take.
         The values (categories) must be strings.
+    :var dict value_indices: The index of each value in ``values``, filled in
+        when the BayesianNetwork is finalized.
     :var dict properties: A dictionary containing metadata about this VariableNode
         (e.g. any properties read from a BIF file).
     :var ProbabilityDistributionOfVariableNode probdist: The :class:`ProbabilityDistributionOfVariableNode`
@@ -557,6 +1019,7 @@ class VariableNode:
         self.ID = -1
         self.name = name
         self.values = []
+        self.value_indices = {}
         self.properties = {}
         self.probdist = None
 
@@ -607,11 +1070,13 @@ class VariableNode:
         return partial_sample
 
 
-    @functools.cache
+    def create_value_indices(self):
+        return {value: index for index, value in enumerate(self.values)}
+
+
     def probability_of_value(self, value, conditioning_values):
-        value_index = self.values.index(value)
-        value_probability = self.probdist.probabilities[conditioning_values][value_index]
-        return value_probability
+        row = self.probdist.conditioning_index(conditioning_values)
+        return self.probdist.probabilities_rows()[row, self.value_indices[value]]
 
 
     def get_unsampled_conditioning_variables(self, partial_sample):
@@ -647,6 +1112,16 @@ class ProbabilityDistributionOfVariableNode:
     Class representing the probability distribution of a VariableNode in a BayesianNetwork.
 
     The `ProbabilityDistributionOfVariableNode` class is tightly bound to the :class:`VariableNode` class.
+
+    The probabilities are read into ``probabilities``, a dict which maps
+    tuples of values of the conditioning VariableNodes (or
+    ``'<unconditioned>'``) to lists of probabilities. Finalizing arranges
+    them into ``probabilities_array`` and ``cummulative_probabilities_array``,
+    dense NumPy arrays with the shape ``(conditioning cardinalities...,
+    cardinality)``, which are indexed by the value indices of the
+    conditioning VariableNodes. Flattened to 2D, the row of a combination of
+    conditioning values is the dot product between their indices and
+    ``conditioning_strides``.
     """
 
     def __init__(self, var):
@@ -662,6 +1137,9 @@ class ProbabilityDistributionOfVariableNode:
         self.probabilities_with_indexed_conditioning = {}
         self.conditioning_variable_nodes = OrderedDict()
         self.cummulative_probabilities = OrderedDict()
+        self.probabilities_array = None
+        self.cummulative_probabilities_array = None
+        self.conditioning_strides = None
         self.properties = {}
 
 
@@ -687,6 +1165,9 @@ class ProbabilityDistributionOfVariableNode:
         self.cummulative_probabilities = self.create_cummulative_probabilities(self.probabilities)
         if '<unconditioned>' not in self.probabilities:
             self.probabilities_with_indexed_conditioning = self.create_probabilities_with_indexed_conditioning()
+        self.conditioning_strides = self.create_conditioning_strides()
+        self.probabilities_array = self.create_probabilities_array(self.probabilities)
+        self.cummulative_probabilities_array = numpy.cumsum(self.probabilities_array, axis=-1)
 
 
     def create_cummulative_probabilities(self, probabilities):
@@ -696,6 +1177,66 @@ class ProbabilityDistributionOfVariableNode:
         return cummulative_probabilities
 
 
+    def create_conditioning_strides(self):
+        """
+        Compute the strides which map the value indices of the conditioning
+        VariableNodes to a single row index, in row-major order over
+        ``self.conditioning_variable_nodes`` (the last conditioning
+        VariableNode varies fastest).
+        """
+        cardinalities = [len(cond_variable.values) for cond_variable in self.conditioning_variable_nodes.values()]
+        strides = numpy.ones(len(cardinalities), dtype=numpy.intp)
+        for i in range(len(cardinalities) - 2, -1, -1):
+            strides[i] = strides[i + 1] * cardinalities[i + 1]
+        return strides
+
+
+    def create_probabilities_array(self, probabilities):
+        """
+        Arrange a dict of probabilities, keyed by tuples of values of the
+        conditioning VariableNodes, into a dense NumPy array with one axis per
+        conditioning VariableNode and a last axis for the values of this
+        VariableNode.
+        """
+        if len(self.conditioning_variable_nodes) == 0:
+            return numpy.array(probabilities['<unconditioned>'], dtype=numpy.float64)
+
+        conditioning_values = [cond_variable.values for cond_variable in self.conditioning_variable_nodes.values()]
+        rows = [probabilities[values] for values in itertools.product(*conditioning_values)]
+        shape = [len(values) for values in conditioning_values] + [-1]
+        return numpy.array(rows, dtype=numpy.float64).reshape(shape)
+
+
+    def probabilities_rows(self):
+        """
+        Return ``probabilities_array`` as a 2D view, with one row per
+        combination of values of the conditioning VariableNodes.
+        """
+        return self.probabilities_array.reshape(-1, self.probabilities_array.shape[-1])
+
+
+    def cummulative_probabilities_rows(self):
+        """
+        Return ``cummulative_probabilities_array`` as a 2D view, with one row
+        per combination of values of the conditioning VariableNodes.
+        """
+        return self.cummulative_probabilities_array.reshape(-1, self.cummulative_probabilities_array.shape[-1])
+
+
+    def conditioning_index(self, conditioning_values):
+        """
+        Return the row of ``probabilities_rows()`` which corresponds to a
+        tuple of values of the conditioning VariableNodes, or to
+        ``'<unconditioned>'``.
+        """
+        if conditioning_values == '<unconditioned>':
+            return 0
+        row = 0
+        for cond_variable, value, stride in zip(self.conditioning_variable_nodes.values(), conditioning_values, self.conditioning_strides):
+            row += cond_variable.value_indices[value] * int(stride)
+        return row
+
+
     def create_probabilities_with_indexed_conditioning(self):
         prob_indexed = {}
         for conditioning_values in self.probabilities:
@@ -729,9 +1270,11 @@ class ProbabilityDistributionOfVariableNode:
 
     def sample(self, conditioning_values='<unconditioned>'):
         roll = random.random()
-        cummulative_probabilities = self.cummulative_probabilities[conditioning_values]
-        index = self.sample_roll(roll, cummulative_probabilities)
-        return index
+        cummulative_probabilities = self.cummulative_probabilities_rows()[self.conditioning_index(conditioning_values)]
+        # The first index whose cummulative probability reaches the roll, as
+        # in sample_roll().
+        index = int(numpy.searchsorted(cummulative_probabilities, roll, side='left'))
+        return min(index, len(cummulative_probabilities) - 1)
 
 
     def sample_roll(self, roll, cummulative_probabilities):
@@ -749,37 +1292,136 @@ class ProbabilityDistributionOfVariableNode:
             return "ProbabilityMassDistribution for variable {}, conditioned on {}".format(self.variable_name, self.conditioning_variable_names)
 
 
+# The BayesianNetwork sampled by the worker processes started by
+# BayesianNetwork.sample_blocks(), which sends it to each worker
+# only once, when the worker is started.
+sampling_worker_bayesian_network = None
+
+
+
+@contextlib.contextmanager
+def saved_caches_lock(path: Path):
+    lockpath = path.with_name(path.name + '.lock')
+    with lockpath.open('a') as lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+
+
+def trim_entries(entries: dict, max_entries) -> dict:
+    """
+    Keep only the last ``max_entries`` of ``entries``, or all of them if
+    ``max_entries`` is ``None``.
+    """
+    if max_entries is None or len(entries) <= max_entries:
+        return entries
+    keys = list(entries.keys())[len(entries) - max_entries:]
+    return {key: entries[key] for key in keys}
+
+
+
+def IDs_as_bits(IDs) -> int:
+    """
+    Convert a collection of node IDs into a bitset, stored as an integer
+    with bit ``i`` set for each ID ``i``.
+    """
+    bits = 0
+    for ID in IDs:
+        bits |= 1 << ID
+    return bits
+
+
+
+def bits_as_IDs(bits: int) -> tuple[int, ...]:
+    """
+    Convert a bitset created by py:func:`IDs_as_bits` back into the tuple of
+    the IDs it contains, in ascending order.
+    """
+    IDs = []
+    while bits:
+        lowest_bit = bits & -bits
+        IDs.append(lowest_bit.bit_length() - 1)
+        bits ^= lowest_bit
+    return tuple(IDs)
+
+
+
+def init_sampling_worker(bayesian_network: BayesianNetwork) -> None:
+    global sampling_worker_bayesian_network
+    sampling_worker_bayesian_network = bayesian_network
+
+
+
+def sample_seeded_block_in_worker(task):
+    return sampling_worker_bayesian_network.sample_seeded_block(task)
+
+
+
+def numpy_generator_from_python_random() -> numpy.random.Generator:
+    """
+    Create a ``numpy.random.Generator`` which continues the stream of Python's
+    global ``random`` module. Both are Mersenne Twisters and build their
+    doubles from two 32-bit outputs in the same way, so
+    ``generator.random()`` returns the same values as ``random.random()``
+    would.
+    """
+    _, internalstate, _ = random.getstate()
+    bit_generator = numpy.random.MT19937()
+    bit_generator.state = {
+        'bit_generator': 'MT19937',
+        'state': {
+            'key': numpy.array(internalstate[:-1], dtype=numpy.uint32),
+            'pos': internalstate[-1],
+        },
+    }
+    return numpy.random.Generator(bit_generator)
+
+
+
+def advance_python_random_to_numpy_generator(generator: numpy.random.Generator) -> None:
+    """
+    Set the state of Python's global ``random`` module to the state of a
+    generator created by :func:`numpy_generator_from_python_random`.
+    """
+    version, _, gauss_next = random.getstate()
+    state = generator.bit_generator.state['state']
+    internalstate = tuple(int(word) for word in state['key']) + (int(state['pos']),)
+    random.setstate((version, internalstate, gauss_next))
+
+
 
 def read_bif_file(sourcepath: Path, use_cache=True) -> BayesianNetwork:
-    bayesian_network = None
+    from mbtk.utilities.bif.Cache import load_bif_cache, save_bif_cache, source_stamp
 
-    # BIF files might be large, so we read them from source and then we pickle
-    # them to files. If a pickle-file is found, read it instead of the
-    # requested BIF file.
-    cachefile = sourcepath.with_suffix('.pickle')
+    # BIF files might be large, so we read them from source and then we cache
+    # the parsed network next to them (see mbtk.utilities.bif.Cache). If a
+    # cache written from the current contents of the requested BIF file is
+    # found, read it instead.
     if use_cache:
-        if cachefile.exists():
-            with cachefile.open('rb') as f:
-                bayesian_network = pickle.load(f)
-
-            assert isinstance(bayesian_network, BayesianNetwork)
+        bayesian_network = load_bif_cache(sourcepath)
+        if bayesian_network is not None:
+            bayesian_network.sourcepath = sourcepath
             return bayesian_network
 
-    bayesian_network = parse_bif_file(sourcepath)
-    with cachefile.open('wb') as f:
-        pickle.dump(bayesian_network, f)
+    stat = sourcepath.stat()
+    source = sourcepath.read_bytes()
+    bayesian_network = parse_bif(source.decode())
+    save_bif_cache(sourcepath, bayesian_network, source_stamp(stat, source))
 
     assert isinstance(bayesian_network, BayesianNetwork)
+    bayesian_network.sourcepath = sourcepath
     return bayesian_network
 
 
 
 def parse_bif_file(path):
-    from lark import Lark
-    from mbtk.utilities.bif.Grammar import bif_grammar
-    from mbtk.utilities.bif.Transformers import get_transformer_chain
-    parser = Lark(bif_grammar)
-    tree = parser.parse(path.read_text())
+    return parse_bif(path.read_text())
 
-    bayesian_network = get_transformer_chain().transform(tree)
-    return bayesian_network
+
+
+def parse_bif(text):
+    from mbtk.utilities.bif.Parser import get_bif_parser
+    return get_bif_parser().parse(text)
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+
+
+class MethodCache:
+    """
+    A bounded cache for the results of a method, keyed by the arguments of
+    each call. The least recently used results are evicted once there are
+    more than ``max_entries`` of them. A ``max_entries`` of ``None`` makes
+    the cache unbounded, while 0 disables it.
+
+    Unlike ``functools.cache``, a ``MethodCache`` is stored on the instance
+    whose method it caches, so it does not keep the instance alive, it can
+    be inspected, resized and cleared per instance, and it is pickled along
+    with the instance.
+
+    :var hits: The number of calls served from the cache.
+    :var misses: The number of calls whose result was not in the cache.
+    :var evictions: The number of results evicted to respect ``max_entries``.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def __contains__(self, key):
+        return key in self.entries
+
+
+    def get(self, key, compute):
+        """
+        Return the cached result for ``key``, or call ``compute()`` to create
+        it, then cache it.
+        """
+        try:
+            result = self.entries[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return result
+
+        self.misses += 1
+        result = compute()
+        self.put(key, result)
+        return result
+
+
+    def put(self, key, result):
+        if self.max_entries == 0:
+            return
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        self.evict(self.max_entries)
+
+
+    def update(self, entries):
+        """
+        Add the results from a mapping of keys to results, without counting
+        them as hits or misses.
+        """
+        for key, result in entries.items():
+            self.put(key, result)
+
+
+    def evict(self, max_entries):
+        if max_entries is None:
+            return
+        while len(self.entries) > max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+
+    def resize(self, max_entries):
+        self.max_entries = max_entries
+        self.evict(max_entries)
+
+
+    def clear(self):
+        self.entries.clear()
+
+
+    def statistics(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+        }
@@ -0,0 +1,247 @@
+import os
+import fcntl
+import contextlib
+
+import numpy
+
+
+class SharedJHT:
+    """
+    A joint entropy table (JHT) which can be shared by multiple processes
+    running the G-test with dcMI at the same time, e.g. when IPC-MB is run
+    for all the targets of a dataset in separate processes.
+
+    The entropy terms are stored in an open-addressing hash table, inside a
+    file which is memory-mapped by every process that uses it. Placing the
+    file on a ``tmpfs`` filesystem (e.g. ``/dev/shm``) keeps the entire table
+    in shared memory. Concurrent access is synchronized with ``flock()`` on
+    the same file: lookups take a shared lock, while publishing a new entropy
+    term takes an exclusive lock. The first process to open the file creates
+    and initializes it; all the other processes attach to it.
+
+    Each slot of the table stores the key (the sorted IDs of the variables,
+    padded with ``-1`` up to ``key_width``), the entropy value and a state
+    flag. Keys wider than ``key_width`` and keys which do not fit in the
+    table anymore are kept in a process-local dictionary instead, so the
+    table never refuses an entry.
+
+    The counters ``reads``, ``hits``, ``misses`` and ``publications`` are kept
+    per process, and are not shared.
+    """
+
+    default_capacity = 2 ** 18
+    default_key_width = 32
+    magic = b'MBTKJHT1'
+    header_size = 64
+
+    def __init__(self, path, capacity=None, key_width=None):
+        if capacity is None:
+            capacity = SharedJHT.default_capacity
+        if key_width is None:
+            key_width = SharedJHT.default_key_width
+
+        # The capacity must be a power of 2, to allow masking the hash
+        # instead of computing its modulo.
+        capacity = 1 << max(0, int(capacity) - 1).bit_length()
+
+        self.path = path
+        self.capacity = capacity
+        self.key_width = key_width
+        self.local_entries = dict()
+
+        self.reads = 0
+        self.hits = 0
+        self.misses = 0
+        self.publications = 0
+
+        self.fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        with self.locked(fcntl.LOCK_EX):
+            self.initialize_or_attach()
+
+        self.slot_dtype = SharedJHT.make_slot_dtype(self.key_width)
+        self.slots = numpy.memmap(
+            str(self.path),
+            dtype=self.slot_dtype,
+            mode='r+',
+            offset=SharedJHT.header_size,
+            shape=(self.capacity,))
+        self.mask = self.capacity - 1
+
+
+    @staticmethod
+    def make_slot_dtype(key_width):
+        return numpy.dtype([
+            ('state', numpy.int64),
+            ('value', numpy.float64),
+            ('key', numpy.int32, (key_width,))])
+
+
+    def initialize_or_attach(self):
+        header_dtype = numpy.dtype([
+            ('magic', 'S8'),
+            ('capacity', numpy.int64),
+            ('key_width', numpy.int64)])
+
+        size = os.fstat(self.fd).st_size
+        if size == 0:
+            # We are the first process to open the table, so we create it.
+            # The file is extended with ftruncate(), which makes it sparse
+            # and zero-filled, i.e. all the slots start out as empty.
+            slot_dtype = SharedJHT.make_slot_dtype(self.key_width)
+            os.ftruncate(self.fd, SharedJHT.header_size + self.capacity * slot_dtype.itemsize)
+            header = numpy.zeros(1, dtype=header_dtype)
+            header['magic'] = SharedJHT.magic
+            header['capacity'] = self.capacity
+            header['key_width'] = self.key_width
+            os.pwrite(self.fd, header.tobytes(), 0)
+        else:
+            # Another process has already created the table, so we adopt its
+            # layout, regardless of the capacity and key width we were given.
+            header_bytes = os.pread(self.fd, header_dtype.itemsize, 0)
+            header = numpy.frombuffer(header_bytes, dtype=header_dtype)
+            if header['magic'][0] != SharedJHT.magic:
+                raise ValueError('{} is not a shared JHT file'.format(self.path))
+            self.capacity = int(header['capacity'][0])
+            self.key_width = int(header['key_width'][0])
+
+
+    @contextlib.contextmanager
+    def locked(self, operation):
+        fcntl.flock(self.fd, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+    def encode_key(self, key):
+        encoded_key = numpy.full(self.key_width, -1, dtype=numpy.int32)
+        sorted_key = sorted(key)
+        encoded_key[:len(sorted_key)] = sorted_key
+        return (tuple(sorted_key), encoded_key)
+
+
+    def find_slot(self, sorted_key, encoded_key):
+        """
+        Probe the table for ``encoded_key``, starting from the slot
+        determined by its hash. Return a tuple ``(index, found)``, where
+        ``index`` is either the slot containing the key or the first empty
+        slot encountered, or ``-1`` if the table is full and the key is not
+        in it.
+        """
+        start = hash(sorted_key) & self.mask
+        for i in range(self.capacity):
+            index = (start + i) & self.mask
+            slot = self.slots[index]
+            if slot['state'] == 0:
+                return (index, False)
+            if numpy.array_equal(slot['key'], encoded_key):
+                return (index, True)
+        return (-1, False)
+
+
+    def __getitem__(self, key):
+        self.reads += 1
+        try:
+            value = self.get_shared_or_local(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return value
+
+
+    def get_shared_or_local(self, key):
+        if len(key) > self.key_width:
+            return self.local_entries[key]
+
+        (sorted_key, encoded_key) = self.encode_key(key)
+        with self.locked(fcntl.LOCK_SH):
+            (index, found) = self.find_slot(sorted_key, encoded_key)
+            if found:
+                return float(self.slots[index]['value'])
+
+        return self.local_entries[key]
+
+
+    def __setitem__(self, key, value):
+        if len(key) > self.key_width:
+            self.local_entries[key] = value
+            return
+
+        (sorted_key, encoded_key) = self.encode_key(key)
+        with self.locked(fcntl.LOCK_EX):
+            (index, found) = self.find_slot(sorted_key, encoded_key)
+            if index == -1:
+                self.local_entries[key] = value
+                return
+            if not found:
+                # Write the key and the value before marking the slot as
+                # occupied.
+                self.slots[index]['key'] = encoded_key
+                self.slots[index]['value'] = value
+                self.slots[index]['state'] = 1
+                self.publications += 1
+
+
+    def __contains__(self, key):
+        try:
+            self.get_shared_or_local(key)
+        except KeyError:
+            return False
+        return True
+
+
+    def __len__(self):
+        with self.locked(fcntl.LOCK_SH):
+            shared_count = int(numpy.count_nonzero(self.slots['state']))
+        return shared_count + len(self.local_entries)
+
+
+    def items(self):
+        return self.snapshot().items()
+
+
+    def update(self, entries):
+        for key, value in entries.items():
+            self[key] = value
+
+
+    def snapshot(self):
+        """
+        Return the current contents of the table as a plain ``dict``, in the
+        format used by the G-test with dcMI when saving its JHT, i.e. with
+        ``frozenset`` keys.
+        """
+        entries = dict()
+        with self.locked(fcntl.LOCK_SH):
+            occupied = numpy.flatnonzero(self.slots['state'])
+            keys = self.slots['key'][occupied]
+            values = self.slots['value'][occupied]
+
+        for key, value in zip(keys, values):
+            variables = frozenset(int(ID) for ID in key if ID != -1)
+            entries[variables] = float(value)
+        entries.update(self.local_entries)
+        return entries
+
+
+    def statistics(self):
+        return {
+            'pid': os.getpid(),
+            'reads': self.reads,
+            'hits': self.hits,
+            'misses': self.misses,
+            'publications': self.publications,
+            'local_entries': len(self.local_entries),
+        }
+
+
+    def close(self):
+        if self.slots is not None:
+            self.slots.flush()
+            del self.slots
+            self.slots = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -51,7 +51,7 @@ class ADTreeDebug(ADTree):
         self.count_bins = 50
         for i in range(self.count_bins):
             self.count_stats[i] = 0
-        self.sample_count = self.matrix.get_shape()[0]
+        self.sample_count = self.matrix.shape[0]
         self.bin_size = int(self.sample_count / self.count_bins)
         self.leaf_list_nodes = 0
         self.topmost_list_length = 5
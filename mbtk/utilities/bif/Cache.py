@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Union
+
+from mbtk.structures.BayesianNetwork import BayesianNetwork, VariableNode, ProbabilityDistributionOfVariableNode
+
+
+# Caches of parsed BIF files are gzipped JSON documents, tagged with
+# BIF_CACHE_FORMAT and BIF_CACHE_VERSION. Increment BIF_CACHE_VERSION whenever
+# the layout produced by network_as_dict() changes, so that the caches
+# written by older versions are ignored and their BIF files parsed again.
+BIF_CACHE_FORMAT = 'mbtk-bif-cache'
+BIF_CACHE_VERSION = 1
+
+
+def bif_cache_path(sourcepath: Path) -> Path:
+    return sourcepath.with_suffix('.bif-cache.json.gz')
+
+
+
+def source_stamp(stat: os.stat_result, source: bytes) -> dict:
+    """
+    Describe the contents of a BIF file, given its ``stat`` and ``source``,
+    as read before parsing it.
+    """
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': hashlib.sha256(source).hexdigest(),
+    }
+
+
+
+def is_source_unchanged(sourcepath: Path, stamp: dict) -> bool:
+    """
+    Check whether the BIF file still has the contents described by
+    ``stamp``. The file is only hashed again if its modification time
+    changed while its size did not, e.g. after being touched or copied.
+    """
+    stat = sourcepath.stat()
+    if stat.st_size != stamp['size']:
+        return False
+    if stat.st_mtime_ns == stamp['mtime_ns']:
+        return True
+    return hashlib.sha256(sourcepath.read_bytes()).hexdigest() == str(stamp['sha256'])
+
+
+
+def load_bif_cache(sourcepath: Path) -> Union[BayesianNetwork, None]:
+    """
+    Read the (non-finalized) Bayesian network cached for the BIF file
+    ``sourcepath`` by py:func:`save_bif_cache`, or return ``None`` if there
+    is no cache, if it has another format or version, or if the BIF file has
+    changed since the cache was written.
+    """
+    try:
+        with gzip.open(bif_cache_path(sourcepath), 'rt', encoding='utf-8') as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, EOFError):
+        # A corrupted or truncated cache is simply written again.
+        return None
+
+    if cache.get('format') != BIF_CACHE_FORMAT or cache.get('version') != BIF_CACHE_VERSION:
+        return None
+    if not is_source_unchanged(sourcepath, cache['source']):
+        return None
+
+    return network_from_dict(cache['network'])
+
+
+
+def save_bif_cache(sourcepath: Path, bayesian_network: BayesianNetwork, stamp: dict) -> None:
+    """
+    Cache the Bayesian network parsed from the BIF file ``sourcepath``,
+    whose contents are described by ``stamp`` (see py:func:`source_stamp`).
+    The cache is replaced atomically, so that concurrent readers never see
+    it partially written.
+    """
+    cache = {
+        'format': BIF_CACHE_FORMAT,
+        'version': BIF_CACHE_VERSION,
+        'source': stamp,
+        'network': network_as_dict(bayesian_network),
+    }
+
+    cachepath = bif_cache_path(sourcepath)
+    temporary_path = cachepath.with_name('{}.{}.tmp'.format(cachepath.name, os.getpid()))
+    with gzip.open(temporary_path, 'wt', encoding='utf-8') as f:
+        json.dump(cache, f, separators=(',', ':'))
+    os.replace(temporary_path, cachepath)
+
+
+
+def network_as_dict(bayesian_network: BayesianNetwork) -> dict:
+    variables = []
+    probability_distributions = []
+    for variable in bayesian_network.variable_nodes.values():
+        variables.append({
+            'name': variable.name,
+            'values': variable.values,
+            'properties': variable.properties,
+        })
+
+        probdist = variable.probdist
+        if probdist is None:
+            continue
+        probability_distributions.append({
+            'variable': probdist.variable_name,
+            'conditioning_variables': list(probdist.conditioning_variable_nodes.keys()),
+            'probabilities': list(probdist.probabilities.items()),
+            'properties': probdist.properties,
+        })
+
+    return {
+        'name': bayesian_network.name,
+        'properties': bayesian_network.properties,
+        'variables': variables,
+        'probability_distributions': probability_distributions,
+    }
+
+
+
+def network_from_dict(network: dict) -> BayesianNetwork:
+    """
+    Rebuild the Bayesian network described by py:func:`network_as_dict`,
+    exactly as :class:`BIFTransformerNetwork
+    <mbtk.utilities.bif.Transformers.BIFTransformerNetwork>` builds it.
+    """
+    bn = BayesianNetwork(network['name'])
+    bn.properties = network['properties']
+    for attributes in network['variables']:
+        variable = VariableNode(attributes['name'])
+        variable.values = attributes['values']
+        variable.properties = attributes['properties']
+        bn.variable_nodes[variable.name] = variable
+
+    for attributes in network['probability_distributions']:
+        variable = bn.variable_nodes[attributes['variable']]
+        pd = ProbabilityDistributionOfVariableNode(variable)
+        # JSON has no tuples, so the conditioning values come back as lists.
+        pd.probabilities = {
+            (key if isinstance(key, str) else tuple(key)): probabilities
+            for (key, probabilities) in attributes['probabilities']
+        }
+        pd.conditioning_variable_nodes = OrderedDict(
+            (varname, bn.variable_nodes[varname])
+            for varname in attributes['conditioning_variables']
+        )
+        pd.properties = attributes['properties']
+        variable.probdist = pd
+
+    return bn
@@ -0,0 +1,19 @@
+import functools
+
+from lark import Lark
+
+from mbtk.utilities.bif.Grammar import bif_grammar
+from mbtk.utilities.bif.Transformers import get_transformer
+
+
+@functools.cache
+def get_bif_parser() -> Lark:
+    """
+    Create the parser of BIF files once per process. The grammar is parsed
+    in LALR mode with the contextual lexer, and the
+    :class:`BIFTransformer <mbtk.utilities.bif.Transformers.BIFTransformer>`
+    is applied during parsing, so ``get_bif_parser().parse(text)`` directly
+    returns a (non-finalized) :class:`BayesianNetwork
+    <mbtk.structures.BayesianNetwork.BayesianNetwork>`.
+    """
+    return Lark(bif_grammar, parser='lalr', lexer='contextual', transformer=get_transformer())
@@ -13,6 +13,11 @@ def get_transformer_chain():
 
 
 
+def get_transformer():
+    return BIFTransformer()
+
+
+
 class BIFTransformerBasic(Transformer):
 
     def identifier(self, items):
@@ -144,3 +149,14 @@ class BIFTransformerNetwork(Transformer):
                     pd.conditioning_variable_nodes[varname] = bn.variable_nodes[varname]
 
         return bn
+
+
+
+class BIFTransformer(BIFTransformerBasic, BIFTransformerVariables, BIFTransformerProbabilities, BIFTransformerNetwork):
+    """
+    All the stages of the chain returned by py:func:`get_transformer_chain`
+    in a single transformer, which the LALR parser can apply while parsing,
+    without building the parse tree first. The stages handle disjoint rules,
+    and each rule only receives the results of the same or earlier stages,
+    so applying them together gives the same result as chaining them.
+    """
@@ -1,6 +1,11 @@
+import mmap
+import struct
+import zipfile
+
 import pudb
 import numpy
 import scipy.io
+import scipy.sparse
 
 from pathlib import Path
 
@@ -11,11 +16,36 @@ def ensure_folder(folder):
     path.mkdir(parents=True, exist_ok=True)
 
 
-
-def load_matrix(path, matrix_name):
-    matrix = None
-    fname = str(path / "{0}.mtx".format(matrix_name))
-    matrix = scipy.io.mmread(fname)
+# The suffixes of the files in which a matrix may be saved, in the order in
+# which load_matrix() looks for them. The Matrix Market text format (.mtx) is
+# only read, for the datasets saved before the binary formats existed.
+matrix_file_suffixes = ['.npy', '.npz', '.mtx']
+
+
+
+def load_matrix(path, matrix_name, mmap=False):
+    """
+    Load a matrix saved by :py:func:`save_matrix`, detecting its format from
+    the file found in ``path``: a dense array in ``.npy`` format, the CSC
+    components of a sparse matrix in an ``.npz`` archive, or a legacy Matrix
+    Market ``.mtx`` file.
+
+    If ``mmap`` is ``True``, the arrays of the binary formats are mapped
+    read-only from their files instead of being read into memory, so that
+    processes loading the same matrix share it through the page cache.
+    Legacy ``.mtx`` files cannot be mapped and are always read.
+    """
+    fname = find_matrix_file(path, matrix_name)
+    if fname.suffix == '.npy':
+        if mmap:
+            return numpy.load(fname, mmap_mode='r').view(numpy.ndarray)
+        return numpy.load(fname)
+    if fname.suffix == '.npz':
+        if mmap:
+            return load_mapped_sparse_matrix(fname)
+        return scipy.sparse.load_npz(fname).tocsc()
+
+    matrix = scipy.io.mmread(str(fname))
     if isinstance(matrix, numpy.ndarray):
         matrix = numpy.matrix(matrix)
     else:
@@ -25,8 +55,155 @@ def load_matrix(path, matrix_name):
 
 
 def save_matrix(path, matrix_name, matrix):
-    fname = str(path / "{0}.mtx".format(matrix_name))
-    scipy.io.mmwrite(fname, matrix)
+    """
+    Save a matrix in binary form: a sparse matrix as an uncompressed ``.npz``
+    archive of its CSC components, and a dense matrix as an ``.npy`` array,
+    which keeps its dtype and memory layout. Files left from saving the same
+    matrix in another format are removed, so that :py:func:`load_matrix`
+    cannot find stale data.
+    """
+    if scipy.sparse.issparse(matrix):
+        suffix = '.npz'
+        fname = path / (matrix_name + suffix)
+        scipy.sparse.save_npz(fname, scipy.sparse.csc_matrix(matrix), compressed=False)
+    else:
+        suffix = '.npy'
+        fname = path / (matrix_name + suffix)
+        numpy.save(fname, numpy.asarray(matrix))
+
+    remove_matrix_files(path, matrix_name, except_suffix=suffix)
+
+
+
+def create_mapped_matrix(path, matrix_name, shape, dtype):
+    """
+    Create a dense, Fortran-ordered matrix of the given shape and dtype,
+    mapped writable from an ``.npy`` file, so that it can be filled in
+    blocks without ever being held entirely in memory. The file can then be
+    loaded by :py:func:`load_matrix` like any matrix saved by
+    :py:func:`save_matrix`.
+    """
+    suffix = '.npy'
+    fname = path / (matrix_name + suffix)
+    matrix = numpy.lib.format.open_memmap(fname, mode='w+', dtype=dtype, shape=shape, fortran_order=True)
+    remove_matrix_files(path, matrix_name, except_suffix=suffix)
+    return matrix
+
+
+
+def remove_matrix_files(path, matrix_name, except_suffix):
+    """
+    Remove the files left from saving a matrix in other formats than the
+    one with the suffix ``except_suffix``, so that :py:func:`load_matrix`
+    cannot find stale data.
+    """
+    for other_suffix in matrix_file_suffixes:
+        if other_suffix != except_suffix:
+            (path / (matrix_name + other_suffix)).unlink(missing_ok=True)
+
+
+
+def load_mapped_sparse_matrix(fname):
+    """
+    Load a sparse matrix saved by ``scipy.sparse.save_npz(...,
+    compressed=False)``, mapping its ``data``, ``indices`` and ``indptr``
+    arrays read-only from the archive.
+    """
+    with numpy.load(fname) as archive:
+        matrix_format = archive['format'].item()
+        shape = tuple(archive['shape'])
+    if isinstance(matrix_format, bytes):
+        matrix_format = matrix_format.decode('ascii')
+
+    components = {}
+    with zipfile.ZipFile(fname) as archive, open(fname, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if name in ('data', 'indices', 'indptr'):
+                components[name] = map_archived_array(f, info)
+
+    matrix_class = scipy.sparse.csc_matrix if matrix_format == 'csc' else scipy.sparse.csr_matrix
+    return matrix_class((components['data'], components['indices'], components['indptr']), shape=shape, copy=False)
+
+
+
+def map_archived_array(f, info):
+    """
+    Map read-only the ``.npy`` array stored without compression as the
+    member ``info`` of the zip archive opened as ``f``.
+    """
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError("Cannot map the compressed array {}".format(info.filename))
+
+    # The array starts after the local file header of the member, whose
+    # fixed part is 30 bytes long and ends with the lengths of the variable
+    # parts, namely the file name and the extra field.
+    f.seek(info.header_offset + 26)
+    (name_length, extra_length) = struct.unpack('<HH', f.read(4))
+    f.seek(info.header_offset + 30 + name_length + extra_length)
+
+    version = numpy.lib.format.read_magic(f)
+    if version == (1, 0):
+        (shape, fortran_order, dtype) = numpy.lib.format.read_array_header_1_0(f)
+    else:
+        (shape, fortran_order, dtype) = numpy.lib.format.read_array_header_2_0(f)
+
+    order = 'F' if fortran_order else 'C'
+    if numpy.prod(shape) == 0:
+        return numpy.empty(shape, dtype=dtype, order=order)
+    mapped = numpy.memmap(f, dtype=dtype, mode='r', offset=f.tell(), shape=shape, order=order)
+    return mapped.view(numpy.ndarray)
+
+
+
+def is_memory_mapped(matrix):
+    """
+    Whether the arrays of a dense or sparse matrix are mapped from a file,
+    as loaded by :py:func:`load_matrix` with ``mmap=True``.
+    """
+    array = matrix.data if scipy.sparse.issparse(matrix) else matrix
+    while array is not None:
+        if isinstance(array, (numpy.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+
+def find_matrix_file(path, matrix_name):
+    for suffix in matrix_file_suffixes:
+        fname = path / (matrix_name + suffix)
+        if fname.exists():
+            return fname
+    raise FileNotFoundError("No saved matrix {} in {}".format(matrix_name, path))
+
+
+
+def matrix_column(matrix, column):
+    """
+    Return a column of a sparse or dense matrix as a 1-dimensional array.
+    """
+    if scipy.sparse.issparse(matrix):
+        return matrix.getcol(column).transpose().toarray().ravel()
+    return numpy.asarray(matrix[:, column]).ravel()
+
+
+
+def matrix_columns(matrix, columns):
+    """
+    Return the requested columns of a sparse or dense matrix as a
+    2-dimensional array.
+    """
+    if scipy.sparse.issparse(matrix):
+        return matrix[:, columns].toarray()
+    return numpy.asarray(matrix[:, columns])
+
+
+
+def dense_matrix(matrix):
+    if scipy.sparse.issparse(matrix):
+        return matrix.toarray()
+    return numpy.asarray(matrix)
 
 
 
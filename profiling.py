@@ -7,6 +7,18 @@ import mbtk.math.G_test__with_dcMI
 import mbtk.math.G_test__with_AD_tree
 import mbtk.math.DoFCalculators as DoFCalculators
 
+import mbtk.math.infotheory as infotheory
+from mbtk.math.PMF import PMF
+from mbtk.math.Variable import JointVariables
+from mbtk.dataset.DatasetMatrix import DatasetMatrix
+from mbtk.dataset.BinaryExperimentalDataset import BinaryExperimentalDataset
+from mbtk.structures.BayesianNetwork import BayesianNetwork
+
+import numpy
+import scipy.sparse
+
+import random
+import time
 import cProfile
 import pstats
 from pstats import SortKey
@@ -40,6 +52,18 @@ def dataset(size):
 
 
 
+def dataset_alarm(size):
+    configuration = dict()
+    configuration['label'] = 'ds_alarm_{}'.format(int(size))
+    configuration['sourcepath'] = testutil.bif_folder / 'alarm.bif'
+    configuration['sample_count'] = int(size)
+    configuration['random_seed'] = 97
+    configuration['values_as_indices'] = True
+    configuration['objectives'] = []
+    return testutil.MockDataset(configuration)
+
+
+
 def make_parameters__unoptimized(dof_class):
     parameters = dict()
     parameters['ci_test_class'] = mbtk.math.G_test__unoptimized.G_test
@@ -163,6 +187,111 @@ def run_dcmi():
 
 
 
+def run_cmi():
+    ds = dataset_alarm(8e3)
+    matrix = ds.datasetmatrix
+    column_count = matrix.get_column_count('X')
+
+    rng = random.Random(1)
+    triples = list()
+    while len(triples) < 300:
+        (X, Y) = rng.sample(range(column_count), 2)
+        Z = [z for z in rng.sample(range(column_count), rng.randrange(1, 4)) if z not in (X, Y)]
+        if len(Z) > 0:
+            triples.append((X, Y, Z))
+
+    # Only conditioning the joint PMFs and calculating the CMI are timed,
+    # because they consist of many lookups of individual keys, unlike
+    # counting the values of the variables.
+    print('start')
+    duration = 0.0
+    lookup_durations = {'p': 0.0, 'p_key': 0.0}
+    for (X, Y, Z) in triples:
+        VarX = matrix.get_variable('X', X)
+        VarY = matrix.get_variable('X', Y)
+        VarZ = matrix.get_variables('X', Z)
+        PrZ = PMF(VarZ)
+        PrXYZ = PMF(JointVariables(VarX, VarY, VarZ))
+        PrXZ = PMF(JointVariables(VarX, VarZ))
+        PrYZ = PMF(JointVariables(VarY, VarZ))
+
+        start = time.time()
+        PrXYcZ = PrXYZ.condition_on(PrZ)
+        PrXcZ = PrXZ.condition_on(PrZ)
+        PrYcZ = PrYZ.condition_on(PrZ)
+        infotheory.conditional_mutual_information(PrXYcZ, PrXcZ, PrYcZ, PrZ, base='e')
+        duration += time.time() - start
+
+        # Look up every key of the joint PMF, once with normalization and
+        # once with the canonical keys themselves.
+        keys = list(PrXYZ.keys())
+        start = time.time()
+        for key in keys:
+            PrXYZ.p(key)
+        lookup_durations['p'] += time.time() - start
+        start = time.time()
+        for key in keys:
+            PrXYZ.p_key(key)
+        lookup_durations['p_key'] += time.time() - start
+
+    print('{} CMI calculations: {:.3f}s'.format(len(triples), duration))
+    print('key lookups with p(): {:.3f}s, with p_key(): {:.3f}s'.format(lookup_durations['p'], lookup_durations['p_key']))
+
+
+
+def run_preprocessing():
+    # A synthetic binary matrix shaped like RCV1v2, with 50k sparse columns.
+    (row_count, column_count) = (20000, 50000)
+    rng = numpy.random.default_rng(1)
+
+    def make_datasetmatrix():
+        datasetmatrix = DatasetMatrix('synthetic')
+        datasetmatrix.X = scipy.sparse.random(row_count, column_count, density=0.002, format='csr', random_state=rng, data_rvs=numpy.ones)
+        datasetmatrix.Y = scipy.sparse.random(row_count, 100, density=0.05, format='csr', random_state=rng, data_rvs=numpy.ones)
+        datasetmatrix.row_labels = ['row{}'.format(r) for r in range(row_count)]
+        datasetmatrix.column_labels_X = ['colx{}'.format(c) for c in range(column_count)]
+        datasetmatrix.column_labels_Y = ['coly{}'.format(c) for c in range(100)]
+        return datasetmatrix
+
+    print('start')
+    datasetmatrix = make_datasetmatrix()
+    exds = BinaryExperimentalDataset(None)
+    start = time.time()
+    columns_to_remove = exds.thresholded_columns_to_remove(datasetmatrix, 'X', (0.002, 0.1))
+    print('thresholded_columns_to_remove: {:.3f}s, {} columns'.format(time.time() - start, len(columns_to_remove)))
+
+    start = time.time()
+    datasetmatrix.delete_columns_X(columns_to_remove.keys())
+    print('delete_columns_X: {:.3f}s'.format(time.time() - start))
+
+    rows_to_keep = sorted(rng.choice(row_count, row_count // 2, replace=False).tolist())
+    start = time.time()
+    datasetmatrix.keep_rows(rows_to_keep)
+    print('keep_rows: {:.3f}s'.format(time.time() - start))
+
+
+
+def run_sampling():
+    bn = BayesianNetwork.from_bif_file(testutil.bif_folder / 'alarm.bif', use_cache=True)
+    bn.finalize()
+
+    random.seed(97)
+    start = time.time()
+    bn.samples(10000, as_list=True, values_as_indices=True)
+    print('samples(1e4): {:.3f}s'.format(time.time() - start))
+
+    random.seed(97)
+    start = time.time()
+    bn.sample_matrix(int(1e6))
+    print('sample_matrix(1e6): {:.3f}s'.format(time.time() - start))
+
+    for workers in [1, 4]:
+        start = time.time()
+        bn.sample_matrix_in_blocks(int(4e6), 97, workers=workers)
+        print('sample_matrix_in_blocks(4e6), {} workers: {:.3f}s'.format(workers, time.time() - start))
+
+
+
 def profile_unoptimized():
     cProfile.run('run_unoptimized()', 'unoptimized.pstats')
     p = pstats.Stats('unoptimized.pstats')
@@ -197,6 +326,14 @@ def profile_dcmi():
     p.sort_stats(SortKey.CUMULATIVE).print_stats(50, functions)
 
 
+
+def profile_cmi():
+    cProfile.run('run_cmi()', 'cmi.pstats')
+    p = pstats.Stats('cmi.pstats')
+    functions = '|'.join(['condition_on', 'conditional_mutual_information', 'p_key', 'p', 'given', 'process_pmf_key', 'flatten'])
+    p.sort_stats(SortKey.CUMULATIVE).print_stats(50, functions)
+
+
 if __name__ == '__main__':
     try:
         profile = sys.argv[1]
@@ -212,5 +349,11 @@ if __name__ == '__main__':
         profile_dynadtree()
     elif profile == 'dcmi':
         profile_dcmi()
+    elif profile == 'cmi':
+        profile_cmi()
+    elif profile == 'preprocessing':
+        run_preprocessing()
+    elif profile == 'sampling':
+        run_sampling()
     else:
         print('unknown profile')
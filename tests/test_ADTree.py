@@ -275,6 +275,43 @@ def test_compare_g_tests__alarm(ds_alarm_5e2, adtree_alarm_5e2_llta0):
 
 
 
+def test_g_test_queries_AD_tree_once(ds_survey_5e2, adtree_survey_5e2_llta20, monkeypatch):
+    """
+    This test ensures that the G-test with an AD-tree retrieves the joint PMF
+    from the AD-tree only once per CI test, even when StructuralDoF requires
+    the distinct values per z.
+    """
+    ds = ds_survey_5e2
+    adtree = adtree_survey_5e2_llta20
+
+    parameters = dict()
+    parameters['ci_test_debug'] = 0
+    parameters['ci_test_significance'] = 0.95
+    parameters['ci_test_ad_tree_class'] = ADTree
+    parameters['ci_test_ad_tree_leaf_list_threshold'] = 20
+    parameters['ci_test_ad_tree_preloaded'] = adtree
+    parameters['omega'] = ds.omega
+    parameters['source_bayesian_network'] = ds.bayesiannetwork
+    parameters['ci_test_dof_calculator_class'] = mbtk.math.DoFCalculators.StructuralDoF
+
+    G_with_AD_tree = mbtk.math.G_test__with_AD_tree.G_test(ds.datasetmatrix, parameters)
+
+    queried_variables = []
+    make_pmf = adtree.make_pmf
+
+    def counting_make_pmf(variables):
+        queried_variables.append(list(variables))
+        return make_pmf(variables)
+
+    monkeypatch.setattr(adtree, 'make_pmf', counting_make_pmf)
+
+    for (X, Y, Z) in [(4, 3, set()), (5, 3, {1, 2})]:
+        queried_variables.clear()
+        G_with_AD_tree.conditionally_independent(X, Y, Z)
+        assert queried_variables == [sorted([X, Y] + list(Z))]
+
+
+
 def test_making_pmf_larger_dataset(ds_survey_5e2, adtree_survey_5e2_llta20):
     ds = ds_survey_5e2
     adtree = adtree_survey_5e2_llta20
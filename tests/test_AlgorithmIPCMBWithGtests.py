@@ -1,7 +1,9 @@
 import gc
+import pickle
 
 import tests.utilities as testutil
 import pytest
+from scipy.stats import chi2
 
 from mbtk.algorithms.mb.ipcmb import AlgorithmIPCMB
 import mbtk.math.G_test__unoptimized
@@ -11,6 +13,7 @@ import mbtk.structures.DynamicADTree
 import mbtk.math.G_test__with_dcMI
 import mbtk.math.DSeparationCITest
 import mbtk.math.DoFCalculators as DoFCalculators
+from mbtk.math.PMF import ArrayPMF
 
 DebugLevel = 0
 CITestDebugLevel = 0
@@ -140,6 +143,102 @@ def test_ipcmb_correctness__dcmi(ds_lc_repaired_8e3, testfolders):
 
 
 
+def test_ipcmb_correctness__dcmi_shared_jht(ds_lc_repaired_8e3, testfolders):
+    """
+    This test ensures that IPC-MB correctly finds all the MBs in the repaired
+    LUNGCANCER dataset when using the G-test with dcMI and a shared JHT,
+    without any DoF cache persisted between the runs.
+    """
+    ds = ds_lc_repaired_8e3
+    jht_shared_path = testfolders['jht'] / 'jht_{}.shm'.format(ds.label)
+    jht_path = testfolders['jht'] / 'jht_{}_shared_snapshot.pickle'.format(ds.label)
+    parameters = make_parameters__dcmi(DoFCalculators.CachedStructuralDoF)
+    parameters['ci_test_jht_shared_path'] = jht_shared_path
+    parameters['ci_test_jht_path__save'] = jht_path
+    parameters_dsep = make_parameters__dsep()
+
+    targets = range(ds.datasetmatrix.get_column_count('X'))
+    for target in targets:
+        mb, _, ipcmb = run_IPCMB(ds, target, parameters)
+        mb_dsep, _, _ = run_IPCMB(ds, target, parameters_dsep)
+        assert mb == mb_dsep
+
+    assert ipcmb.CITest.JHT_reads > ipcmb.CITest.JHT_misses
+
+    with jht_path.open('rb') as f:
+        JHT = pickle.load(f)
+    assert JHT['reads'] == ipcmb.CITest.JHT_reads
+    assert JHT['misses'] == ipcmb.CITest.JHT_misses
+    assert len(JHT) > 2
+
+
+
+def test_decision_modes__critical_value_vs_p_value(ds_survey_2e3, testfolders):
+    """
+    This test ensures that deciding independence by comparing G against the
+    cached critical values produces the same CI test results as computing the
+    exact p-value for every test, and that the lazily computed p-values are
+    present in the saved CI test results.
+    """
+    ds = ds_survey_2e3
+    results_path = testfolders['ci_test_results'] / 'critical_value_{}.pickle'.format(ds.label)
+
+    parameters_p_value = make_parameters__dcmi(DoFCalculators.CachedStructuralDoF)
+    parameters_critical_value = make_parameters__dcmi(DoFCalculators.CachedStructuralDoF)
+    parameters_critical_value['ci_test_decision_mode'] = 'critical_value'
+    parameters_critical_value['ci_test_results_path__save'] = results_path
+
+    targets = range(ds.datasetmatrix.get_column_count('X'))
+    for target in targets:
+        mb_p_value, results_p_value, _ = run_IPCMB(ds, target, parameters_p_value)
+        mb_critical_value, results_critical_value, ipcmb = run_IPCMB(ds, target, parameters_critical_value)
+
+        assert mb_p_value == mb_critical_value
+        assert len(ipcmb.CITest.critical_G_values) > 0
+
+        # IPC-MB ends the CI test, which saves the results.
+        with results_path.open('rb') as f:
+            saved_results = pickle.load(f)
+        for saved_result, result_p_value in zip(saved_results, results_p_value):
+            assert not saved_result.p_value__pending
+            assert saved_result.p_value__exact == result_p_value.p_value
+
+        assertEqualCITestResults(results_p_value, results_critical_value)
+
+    # The p-value remains pending until it is needed.
+    parameters = make_parameters__dcmi(DoFCalculators.CachedStructuralDoF)
+    parameters['ci_test_decision_mode'] = 'critical_value'
+    parameters['ci_test_significance'] = CITestSignificance
+    parameters['omega'] = ds.omega
+    ci_test = mbtk.math.G_test__with_dcMI.G_test(ds.datasetmatrix, parameters)
+    ci_test.conditionally_independent(0, 1, [2])
+    result = ci_test.ci_test_results[0]
+    assert result.p_value__pending
+    DoF = result.test_distribution_parameters['DoF']
+    assert result.p_value == chi2.cdf(result.statistic_value, DoF)
+    assert not result.p_value__pending
+
+
+
+def test_pmf_classes__unoptimized(ds_survey_2e3):
+    """
+    This test ensures that the unoptimized G-test produces the same results
+    when using array-backed PMFs as when using the dict-based PMFs.
+    """
+    ds = ds_survey_2e3
+
+    for dof in [DoFCalculators.StructuralDoF, DoFCalculators.CachedStructuralDoF]:
+        parameters = dict()
+        parameters['G_test__unoptimized'] = make_parameters__unoptimized(dof)
+        parameters['G_test__unoptimized__arrays'] = make_parameters__unoptimized(dof)
+        parameters['G_test__unoptimized__arrays']['ci_test_pmf_class'] = ArrayPMF
+
+        targets = range(ds.datasetmatrix.get_column_count('X'))
+        for target in targets:
+            validate_IPCMB_across_Gtest_implementations(ds, target, parameters, validate_mb=False, validate_ci_tests=True)
+
+
+
 @pytest.mark.slow
 def test_dof_computation_methods__dcmi_vs_adtree(ds_survey_2e3, adtree_survey_2e3_llta0, testfolders):
     """
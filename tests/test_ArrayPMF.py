@@ -0,0 +1,180 @@
+import numpy
+
+import mbtk.math.infotheory as infotheory
+from mbtk.math.Variable import Variable, JointVariables
+from mbtk.math.PMF import PMF, CPMF, ArrayPMF, ArrayCPMF
+
+
+def test_single_variable_array_pmf():
+    variable = Variable(numpy.array([3, 5, 1, 1, 4, 3, 7, 0, 2, 1, 0, 5, 4, 7, 2, 4]))
+    variable.ID = 1
+
+    PrVariable = ArrayPMF(variable)
+    assert PrVariable.shape == (7,)
+    assert len(PrVariable) == 7
+    assert PrVariable.IDs() == (1,)
+    assert PrVariable.value_counts == {0: 2, 1: 3, 2: 2, 3: 2, 4: 3, 5: 2, 7: 2}
+    assert PrVariable.probabilities == PMF(variable).probabilities
+
+    assert 2 / 16 == PrVariable.p(3)
+    assert 3 / 16 == PrVariable.p(4)
+    assert 0 == PrVariable.p(6)
+    assert 0 == PrVariable.p(8)
+    assert 0 == PrVariable.p('unknown')
+
+
+
+def test_joint_variables_array_pmf():
+    animals = Variable(['cat', 'dog', 'cat', 'mouse', 'dog', 'cat'])
+    animals.ID = 3
+    colors = Variable(['gray', 'yellow', 'brown', 'silver', 'white', 'gray'])
+    colors.ID = 2
+    sizes = Variable(['small', 'small', 'large', 'small', 'normal', 'small'])
+    sizes.ID = 1
+
+    fauna = JointVariables(sizes, colors, animals)
+    PrFauna = ArrayPMF(fauna)
+    assert PrFauna.shape == (3, 5, 3)
+    assert PrFauna.IDs() == (1, 2, 3)
+    assert PrFauna.p('small', 'gray', 'cat') == 2 / 6
+    assert PrFauna.p(('small', 'silver', 'mouse')) == 1 / 6
+    assert PrFauna.p('small', 'silver', 'dog') == 0
+    assert PrFauna.p('small', 'silver') == 0
+    assert PrFauna == PMF(fauna)
+    assert sorted(PrFauna.keys()) == sorted(PMF(fauna).keys())
+
+
+
+def test_array_pmf_assigning_probabilities_and_counts():
+    animals = Variable(['cat', 'dog', 'cat', 'mouse', 'dog', 'cat'])
+    animals.ID = 2
+    sizes = Variable(['small', 'small', 'large', 'small', 'normal', 'small'])
+    sizes.ID = 1
+
+    PrFauna = ArrayPMF(JointVariables(sizes, animals))
+    expected_PrFauna = PMF(JointVariables(sizes, animals))
+
+    # Like a PMF, an ArrayPMF accepts new dicts of probabilities and counts,
+    # and encodes their keys again.
+    PrFauna.normalize_counts(update_probabilities=True)
+    assert PrFauna.probabilities == expected_PrFauna.probabilities
+
+    PrFauna.probabilities = {('small', 'cat'): 0.5, ('huge', 'whale'): 0.5}
+    assert PrFauna.p('small', 'cat') == 0.5
+    assert PrFauna.p('huge', 'whale') == 0.5
+    assert PrFauna.p('small', 'dog') == 0
+    assert PrFauna.value_counts == {('huge', 'whale'): 0, ('small', 'cat'): 2}
+
+    PrFauna.value_counts = {('small', 'cat'): 2, ('small', 'mouse'): 1}
+    assert PrFauna.value_counts == {('small', 'cat'): 2, ('small', 'mouse'): 1}
+    assert PrFauna.probabilities == {('small', 'cat'): 0.5, ('small', 'mouse'): 0}
+
+
+
+def test_array_pmf_summing_over_variable():
+    V0 = Variable([0, 1, 1, 1, 0, 1, 0, 1])
+    V1 = Variable([0, 0, 1, 1, 0, 1, 1, 1])
+    V2 = Variable([0, 0, 0, 0, 1, 0, 1, 1])
+    V3 = Variable([0, 0, 0, 0, 0, 0, 1, 1])
+
+    V0.ID = 1000
+    V1.ID = 1111
+    V2.ID = 1222
+    V3.ID = 1333
+
+    Pr = ArrayPMF(JointVariables(V0, V1, V2, V3))
+    expected_Pr = PMF(JointVariables(V0, V1, V2, V3))
+    assert Pr == expected_Pr
+
+    for ID in [V2.ID, V1.ID, V0.ID]:
+        Pr = Pr.sum_over(ID)
+        expected_Pr = expected_Pr.sum_over(ID)
+        assert isinstance(Pr, ArrayPMF)
+        assert Pr.IDs() == expected_Pr.IDs()
+        assert Pr == expected_Pr
+
+    assert Pr.p(0) == 6 / 8
+    assert Pr.p(1) == 2 / 8
+
+
+
+def test_array_cpmf():
+    V0 = Variable([0, 1, 0, 1, 0, 1, 0, 1])
+    V1 = Variable([0, 0, 1, 1, 0, 0, 1, 1])
+    V2 = Variable([0, 0, 0, 0, 1, 1, 1, 1])
+    V78 = Variable([0, 0, 0, 0, 0, 0, 1, 1])
+
+    Pr = ArrayCPMF(V2, V78)
+    assert Pr.given(0).p(0) == 4 / 6
+    assert Pr.given(0).p(1) == 2 / 6
+    assert Pr.given(1).p(0) == 0 / 2
+    assert Pr.given(1).p(1) == 2 / 2
+    assert Pr.given(2).p(1) == 0
+    assert Pr == CPMF(V2, V78)
+
+    Pr = ArrayCPMF(V1, JointVariables(V2, V78))
+    assert len(Pr) == 3
+    assert Pr.given(0, 0).p(0) == 2 / 4
+    assert Pr.given(0, 0).p(1) == 2 / 4
+    assert Pr.given(0, 1).p(0) == 0
+    assert Pr.given(1, 0).p(0) == 2 / 2
+    assert Pr.given(1, 1).p(1) == 2 / 2
+    assert Pr == CPMF(V1, JointVariables(V2, V78))
+
+    Pr = ArrayCPMF(JointVariables(V0, V1), V2)
+    assert Pr == CPMF(JointVariables(V0, V1), V2)
+
+
+
+def test_array_pmf_condition_on():
+    V0 = Variable([0, 1, 1, 1, 0, 1, 0, 1, 2, 2])
+    V1 = Variable([0, 0, 1, 1, 0, 1, 1, 1, 0, 1])
+    V2 = Variable([0, 0, 0, 0, 1, 0, 1, 1, 0, 0])
+
+    V0.ID = 10
+    V1.ID = 11
+    V2.ID = 12
+
+    PrXYZ = ArrayPMF(JointVariables(V0, V1, V2))
+    PrZ = ArrayPMF(JointVariables(V2, V1))
+    PrXcYZ = PrXYZ.condition_on(PrZ)
+    assert isinstance(PrXcYZ, ArrayCPMF)
+    assert PrXcYZ.variableIDs == (10,)
+    assert PrXcYZ.conditioning_IDs == (12, 11)
+
+    expected_PrXcYZ = PMF(JointVariables(V0, V1, V2)).condition_on(PMF(JointVariables(V2, V1)))
+    assert set(PrXcYZ.keys()) == set(expected_PrXcYZ.keys())
+    for z in expected_PrXcYZ.keys():
+        for (x, p) in expected_PrXcYZ.given(z).items():
+            assert PrXcYZ.given(z).p(x) == p
+
+    # Conditioning on a dict-based PMF gives the same result.
+    PrXcYZ = PrXYZ.condition_on(PMF(JointVariables(V2, V1)))
+    for z in expected_PrXcYZ.keys():
+        for (x, p) in expected_PrXcYZ.given(z).items():
+            assert PrXcYZ.given(z).p(x) == p
+
+
+
+def test_infotheory_with_array_pmfs():
+    rng = numpy.random.default_rng(42)
+    X = Variable(rng.integers(0, 3, 500))
+    Y = Variable(rng.integers(0, 4, 500))
+    Z = Variable(rng.integers(0, 2, 500))
+    W = Variable((X.instances() + rng.integers(0, 2, 500)) % 3)
+    X.ID, Y.ID, Z.ID, W.ID = (1, 2, 3, 4)
+
+    expected_MI = infotheory.mutual_information(PMF(JointVariables(X, W)), PMF(X), PMF(W))
+    MI = infotheory.mutual_information(ArrayPMF(JointVariables(X, W)), ArrayPMF(X), ArrayPMF(W))
+    assert abs(expected_MI - MI) < 1e-12
+
+    ZW = JointVariables(Z, W)
+    expected_cMI = infotheory.conditional_mutual_information(*infotheory.calculate_pmf_for_cmi(X, Y, ZW))
+    PrZW = ArrayPMF(ZW)
+    cMI = infotheory.conditional_mutual_information(
+        ArrayPMF(JointVariables(X, Y, ZW)).condition_on(PrZW),
+        ArrayPMF(JointVariables(X, ZW)).condition_on(PrZW),
+        ArrayPMF(JointVariables(Y, ZW)).condition_on(PrZW),
+        PrZW)
+    assert abs(expected_cMI - cMI) < 1e-12
+    assert cMI > 0
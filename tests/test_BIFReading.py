@@ -1,8 +1,17 @@
+import gzip
+import json
+import shutil
 from collections import OrderedDict
 from pathlib import Path
 
+from lark import Lark
+
 import tests.utilities as testutil
 from mbtk.structures.BayesianNetwork import BayesianNetwork, VariableNode, ProbabilityDistributionOfVariableNode
+from mbtk.structures.BayesianNetwork import parse_bif_file
+from mbtk.utilities.bif.Cache import bif_cache_path, load_bif_cache
+from mbtk.utilities.bif.Grammar import bif_grammar
+from mbtk.utilities.bif.Transformers import get_transformer_chain
 
 
 def test_reading_bif_file():
@@ -14,6 +23,61 @@ def test_reading_bif_file():
     assertBayesianNetworkEqual(bn_expected, bn_read)
 
 
+
+def test_lalr_parser_same_as_earley_parser():
+    for name in ['survey', 'lc_repaired', 'alarm']:
+        path = Path(testutil.bif_folder, name + '.bif')
+        tree = Lark(bif_grammar).parse(path.read_text())
+        bn_earley = get_transformer_chain().transform(tree)
+        bn_lalr = parse_bif_file(path)
+        assertBayesianNetworkEqual(bn_earley, bn_lalr)
+
+
+
+def test_reading_bif_file__cache():
+    testutil.tmp_folder.mkdir(parents=True, exist_ok=True)
+    survey_bif = Path(testutil.tmp_folder, 'survey.bif')
+    shutil.copyfile(Path(testutil.bif_folder, 'survey.bif'), survey_bif)
+    cachepath = bif_cache_path(survey_bif)
+    cachepath.unlink(missing_ok=True)
+
+    bn_expected = default_Bayesian_network()
+    bn_read = BayesianNetwork.from_bif_file(survey_bif, use_cache=True)
+    assertBayesianNetworkEqual(bn_expected, bn_read)
+    assert cachepath.exists()
+
+    bn_cached = load_bif_cache(survey_bif)
+    assertBayesianNetworkEqual(bn_expected, bn_cached)
+    for variable in bn_cached.variable_nodes.values():
+        assert variable.probdist.variable is variable
+
+    bn_cached = BayesianNetwork.from_bif_file(survey_bif, use_cache=True)
+    assertBayesianNetworkEqual(bn_expected, bn_cached)
+    assert bn_cached.sourcepath == survey_bif
+
+    # Changing the BIF file invalidates the cache.
+    survey_bif.write_text(survey_bif.read_text().replace('testing yes', 'testing no'))
+    assert load_bif_cache(survey_bif) is None
+    bn_read = BayesianNetwork.from_bif_file(survey_bif, use_cache=True)
+    assert bn_read.properties == {'testing': 'no'}
+    assert load_bif_cache(survey_bif).properties == {'testing': 'no'}
+
+    # Caches of another version are ignored.
+    with gzip.open(cachepath, 'rt', encoding='utf-8') as f:
+        cache = json.load(f)
+    cache['version'] = -1
+    with gzip.open(cachepath, 'wt', encoding='utf-8') as f:
+        json.dump(cache, f)
+    assert load_bif_cache(survey_bif) is None
+
+    cachepath.write_bytes(b'not a cache')
+    assert load_bif_cache(survey_bif) is None
+
+    survey_bif.unlink()
+    cachepath.unlink()
+
+
+
 def assertBayesianNetworkEqual(bnA, bnB):
     assert bnA.name == bnB.name
     assert bnA.properties == bnB.properties
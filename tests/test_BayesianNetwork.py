@@ -1,12 +1,17 @@
 import random
 import operator
+import itertools
+import multiprocessing
 from collections import Counter
+from pathlib import Path
 
 import numpy
 import pytest
 
 from mbtk.structures.BayesianNetwork import BayesianNetwork, VariableNode, ProbabilityDistributionOfVariableNode
 from mbtk.structures.Exceptions import BayesianNetworkNotFinalizedError
+from mbtk.utilities.bif.Cache import bif_cache_path
+import tests.utilities as testutil
 
 
 delta = 0.0000001
@@ -35,6 +40,32 @@ def test_probability_distribution():
 
 
 
+def test_probability_distribution_arrays(bn_survey):
+    bn = bn_survey
+
+    probdist = bn.variable_nodes['AGE'].probdist
+    assert probdist.probabilities_array.shape == (3,)
+    assert numpy.array_equal(probdist.probabilities_array, [0.3, 0.5, 0.2])
+
+    EDU = bn.variable_nodes['EDU']
+    probdist = EDU.probdist
+    assert list(probdist.conditioning_variable_nodes.keys()) == ['AGE', 'SEX']
+    assert probdist.probabilities_array.shape == (3, 2, 2)
+    assert list(probdist.conditioning_strides) == [2, 1]
+
+    # P(EDU = uni | AGE = young, SEX = F)
+    assert probdist.probabilities_array[0, 1, 1] == 0.36
+    assert probdist.conditioning_index(('young', 'F')) == 1
+    assert probdist.probabilities_rows()[1, 1] == 0.36
+    assert EDU.probability_of_value('uni', ('young', 'F')) == 0.36
+    assert EDU.value_indices == {'highschool': 0, 'uni': 1}
+
+    for conditioning_values, cummulative_probabilities in probdist.cummulative_probabilities.items():
+        row = probdist.conditioning_index(conditioning_values)
+        assert list(probdist.cummulative_probabilities_rows()[row]) == cummulative_probabilities
+
+
+
 def test_creating_complete_joint_pmf(bn_survey):
     bn = bn_survey
 
@@ -173,6 +204,130 @@ def test_creating_partial_joint_pmf_variant_4(bn_survey):
 
 
 
+def test_bounded_method_caches():
+    bn = BayesianNetwork.from_bif_file(Path(testutil.bif_folder, 'survey.bif'), use_cache=False)
+    bn.finalize()
+    bn.set_cache_size('get_subnetwork_node_IDs', 2)
+
+    for ID in bn.variable_IDs:
+        bn.get_subnetwork_node_IDs((ID,))
+    statistics = bn.cache_statistics()['get_subnetwork_node_IDs']
+    assert statistics['entries'] == 2
+    assert statistics['evictions'] > 0
+
+    pmf = bn.create_partial_joint_pmf((1, 3))
+    assert bn.create_partial_joint_pmf((1, 3)) is pmf
+    assert bn.cache_statistics()['create_partial_joint_pmf']['hits'] == 1
+
+    bn.clear_caches(['create_partial_joint_pmf'])
+    assert bn.create_partial_joint_pmf((1, 3)) is not pmf
+
+    # Refinalizing invalidates every cache.
+    bn.finalize()
+    assert all(statistics['entries'] == 0 for statistics in bn.cache_statistics().values())
+
+
+
+def test_persisted_method_caches():
+    path = Path(testutil.tmp_folder, 'survey.caches.pickle')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+
+    bn = BayesianNetwork.from_bif_file(Path(testutil.bif_folder, 'survey.bif'), use_cache=False)
+    bn.finalize()
+    assert bn.sourcepath == Path(testutil.bif_folder, 'survey.bif')
+    assert bn.load_caches(path) is False
+
+    pmf = bn.create_partial_joint_pmf((0, 5))
+    bn.save_caches(path)
+
+    # A second network saving into the same file adds its own entries to
+    # those already saved.
+    other_bn = BayesianNetwork.from_bif_file(Path(testutil.bif_folder, 'survey.bif'), use_cache=False)
+    other_bn.finalize()
+    other_bn.create_partial_joint_pmf((2,))
+    other_bn.save_caches(path)
+
+    loaded_bn = BayesianNetwork.from_bif_file(Path(testutil.bif_folder, 'survey.bif'), use_cache=False)
+    loaded_bn.finalize()
+    assert loaded_bn.load_caches(path) is True
+    cache = loaded_bn.get_cache('create_partial_joint_pmf')
+    assert ((0, 5),) in cache
+    assert ((2,),) in cache
+    assert loaded_bn.create_partial_joint_pmf((0, 5)).probabilities == pmf.probabilities
+    assert cache.hits == 1
+    assert cache.misses == 0
+
+    # Caches saved for a different network are ignored.
+    lc_bn = BayesianNetwork.from_bif_file(Path(testutil.bif_folder, 'lc_repaired.bif'), use_cache=False)
+    lc_bn.finalize()
+    assert lc_bn.load_caches(path) is False
+
+    # So are the caches saved before the CPTs of the network were edited.
+    edited_bif = Path(testutil.tmp_folder, 'survey.bif')
+    edited_bif.write_text(Path(testutil.bif_folder, 'survey.bif').read_text().replace('0.3, 0.5, 0.2', '0.2, 0.5, 0.3'))
+    edited_bn = BayesianNetwork.from_bif_file(edited_bif, use_cache=False)
+    edited_bn.finalize()
+    assert edited_bn.load_caches(path) is False
+    assert edited_bn.create_partial_joint_pmf((0,)).probabilities != bn.create_partial_joint_pmf((0,)).probabilities
+
+    # The saved caches are trimmed to the sizes of the caches.
+    loaded_bn.set_cache_size('create_partial_joint_pmf', 1)
+    loaded_bn.create_partial_joint_pmf((1,))
+    loaded_bn.save_caches(path)
+    assert loaded_bn.read_saved_caches(path)['create_partial_joint_pmf'].keys() == {((1,),)}
+
+    # Networks not read from a BIF file need an explicit path.
+    loaded_bn.sourcepath = None
+    with pytest.raises(ValueError):
+        loaded_bn.save_caches()
+    with pytest.raises(ValueError):
+        loaded_bn.load_caches()
+
+    path.unlink()
+    path.with_name(path.name + '.lock').unlink()
+    edited_bif.unlink()
+    bif_cache_path(edited_bif).unlink()
+
+
+
+def init_caches_saving_worker():
+    global caches_saving_bn
+    caches_saving_bn = BayesianNetwork.from_bif_file(Path(testutil.bif_folder, 'survey.bif'), use_cache=False)
+    caches_saving_bn.finalize()
+
+
+
+def save_partial_joint_pmf_caches(task):
+    (path, variables) = task
+    caches_saving_bn.clear_caches()
+    caches_saving_bn.create_partial_joint_pmf(variables)
+    caches_saving_bn.save_caches(path)
+
+
+
+def test_persisted_method_caches__concurrent_saves():
+    # Every process saves a different entry, so without locking, the
+    # entries saved concurrently by other processes would be lost.
+    path = Path(testutil.tmp_folder, 'survey_concurrent.caches.pickle')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+
+    all_variables = list(itertools.chain.from_iterable(itertools.combinations(range(6), k) for k in [1, 2, 3]))
+    tasks = [(path, variables) for variables in all_variables]
+    with multiprocessing.Pool(6, initializer=init_caches_saving_worker) as pool:
+        pool.map(save_partial_joint_pmf_caches, tasks, chunksize=1)
+
+    bn = BayesianNetwork.from_bif_file(Path(testutil.bif_folder, 'survey.bif'), use_cache=False)
+    bn.finalize()
+    saved_entries = bn.read_saved_caches(path)
+    assert saved_entries['create_partial_joint_pmf'].keys() == {(variables,) for variables in all_variables}
+
+    path.unlink()
+    path.with_name(path.name + '.lock').unlink()
+
+
+
 def test_get_ancestors_of_nodes__survey(bn_survey):
     bn = bn_survey
 
@@ -346,6 +501,88 @@ def test_sampling_multiple(bn_survey):
 
 
 
+def test_sampling_matrix__same_as_samples(bn_survey, bn_alarm):
+    for bn in [bn_survey, bn_alarm]:
+        random.seed(1984)
+        samples = bn.samples(2000, as_list=True, values_as_indices=True)
+        expected_matrix = numpy.asarray(samples, dtype=numpy.int8)
+        expected_next_roll = random.random()
+
+        random.seed(1984)
+        sample_matrix = bn.sample_matrix(2000)
+        assert sample_matrix.dtype == numpy.int8
+        assert numpy.array_equal(expected_matrix, sample_matrix)
+        assert expected_next_roll == random.random()
+
+
+
+def test_sampling_matrix__wide_variables(bn_survey):
+    assert bn_survey.sampling_dtype() == numpy.int8
+
+    values = ['v{}'.format(i) for i in range(200)]
+    bif = Path(testutil.tmp_folder, 'wide.bif')
+    bif.write_text('\n'.join([
+        'network wide {',
+        '}',
+        'variable W {',
+        '  type discrete [ 200 ] { ' + ', '.join(values) + ' };',
+        '}',
+        'probability ( W ) {',
+        '  table ' + ', '.join(['0.005'] * 200) + ';',
+        '}',
+        '']))
+    bn = BayesianNetwork.from_bif_file(bif, use_cache=False)
+    bn.finalize()
+
+    assert bn.sampling_dtype() == numpy.int16
+    random.seed(1984)
+    sample_matrix = bn.sample_matrix(2000)
+    assert sample_matrix.dtype == numpy.int16
+    assert sample_matrix.max() > 127
+
+    with pytest.raises(ValueError):
+        bn.sample_block(numpy.zeros((10, 1), dtype=numpy.int8), numpy.zeros((10, 1)))
+
+
+def test_sampling_matrix__numpy_generator(bn_alarm):
+    bn = bn_alarm
+
+    sample_matrix_1 = bn.sample_matrix(1000, random_generator=numpy.random.default_rng(42))
+    sample_matrix_2 = bn.sample_matrix(1000, random_generator=numpy.random.default_rng(42))
+    assert sample_matrix_1.shape == (1000, len(bn))
+    assert numpy.array_equal(sample_matrix_1, sample_matrix_2)
+
+    # Blocks are filled from one continuous stream of rolls.
+    bn.sampling_block_size = 300
+    sample_matrix_3 = bn.sample_matrix(1000, random_generator=numpy.random.default_rng(42))
+    del bn.sampling_block_size
+    assert numpy.array_equal(sample_matrix_1, sample_matrix_3)
+
+    for varname in bn.variable_node_names():
+        column = sample_matrix_1[:, bn.variable_nodes_index(varname)]
+        assert column.min() >= 0
+        assert column.max() < len(bn.variable_nodes[varname].values)
+
+
+
+def test_sampling_matrix_in_blocks__independent_of_workers(bn_alarm):
+    bn = bn_alarm
+
+    random.seed(1984)
+    random_state = random.getstate()
+    sample_matrix_serial = bn.sample_matrix_in_blocks(1000, 97, block_size=300, workers=1)
+    assert sample_matrix_serial.shape == (1000, len(bn))
+    # The global random module is left untouched.
+    assert random_state == random.getstate()
+
+    sample_matrix_parallel = bn.sample_matrix_in_blocks(1000, 97, block_size=300, workers=3)
+    assert numpy.array_equal(sample_matrix_serial, sample_matrix_parallel)
+
+    sample_matrix_other_seed = bn.sample_matrix_in_blocks(1000, 98, block_size=300, workers=1)
+    assert not numpy.array_equal(sample_matrix_serial, sample_matrix_other_seed)
+
+
+
 def test_variable_IDs(bn_survey, bn_lungcancer, bn_alarm):
     bn = bn_survey
     assert bn.variable_nodes['AGE'].ID == 0
@@ -724,6 +961,80 @@ def test_d_separation__custom_graph_3():
 
 
 
+def test_d_separation__descendant_of_collider():
+    # The collider 1 is unblocked by conditioning on its grandchild 5, not
+    # only on itself or on its children.
+    graph = {
+        0: [1],
+        4: [1],
+        1: [2, 3],
+        2: [5],
+        3: [5]
+    }
+    bn = BayesianNetwork('testnet')
+    bn.from_directed_graph(graph)
+
+    assert bn.get_descendant_IDs(1) == (2, 3, 5)
+    assert bn.get_ancestor_IDs(5) == (0, 1, 2, 3, 4)
+    assert bn.d_separated(0, [], 4) is True
+    assert bn.d_separated(0, [5], 4) is False
+    assert bn.d_separated(0, [2], 4) is False
+    assert bn.d_separated(0, [1, 5], 4) is False
+    assert bn.d_connected_nodes(0, [1]) == {0, 1, 4}
+
+
+
+def test_d_separation__same_as_paths(bn_lungcancer, bn_alarm):
+    # The reachability algorithm must agree with checking every undirected
+    # path between the two nodes.
+    def d_separated_by_paths(bn, x, Z, y):
+        paths = bn.find_all_undirected_paths(x, y)
+        return all(bn.is_path_blocked_by_nodes(path, Z) for path in paths)
+
+    bn = bn_lungcancer
+    IDs = bn.variable_IDs
+    for x, y in itertools.product(IDs, IDs):
+        for Z in itertools.chain.from_iterable(itertools.combinations(IDs, k) for k in range(4)):
+            assert bn.d_separated(x, Z, y) == d_separated_by_paths(bn, x, Z, y)
+
+    bn = bn_alarm
+    rng = random.Random(42)
+    for i in range(200):
+        x, y = rng.sample(bn.variable_IDs, 2)
+        Z = rng.sample(bn.variable_IDs, rng.randint(0, 6))
+        assert bn.d_separated(x, Z, y) == d_separated_by_paths(bn, x, Z, y)
+
+
+
+def test_d_separated_from():
+    graph = {
+        1: [2, 3],
+        2: [4],
+        3: [4],
+        4: [5],
+        5: []
+    }
+    bn = BayesianNetwork('testnet')
+    bn.from_directed_graph(graph)
+
+    assert bn.d_separated_from(2, [1]) == {3}
+    assert bn.d_separated_from(1, [4]) == {5}
+    assert bn.d_separated_from(5, [2, 3]) == {1}
+    assert bn.d_separated_from(1, []) == set()
+
+    cache = bn.get_cache('d_separated_from')
+    assert (2, frozenset([1])) in cache
+    misses = cache.misses
+
+    # Both endpoints are answered from the set already found for 2.
+    assert bn.d_separated(2, [1], 3) is True
+    assert bn.d_separated(3, [1], 2) is True
+    assert bn.d_separated(4, [1], 2) is False
+    assert cache.misses == misses
+    assert cache.hits == 3
+
+
+
 def test_d_separation__lc_repaired(bn_lc_repaired):
     # Simple graph, similar to 'lungcancer' (a.k.a. 'asia'), but with no
     # deterministic nodes.
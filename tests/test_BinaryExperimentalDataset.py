@@ -325,12 +325,12 @@ def assertObjectiveNotInExDs(exds, objective_label):
 
 def assertExDsDimensions(exds, train_row_count, test_row_count, feature_count, objective_count):
     total_row_count = train_row_count + test_row_count
-    assert (total_row_count, feature_count) == exds.matrix.X.get_shape()
-    assert (total_row_count, objective_count) == exds.matrix.Y.get_shape()
-    assert (train_row_count, feature_count) == exds.matrix_train.X.get_shape()
-    assert (train_row_count, objective_count) == exds.matrix_train.Y.get_shape()
-    assert (test_row_count, feature_count) == exds.matrix_test.X.get_shape()
-    assert (test_row_count, objective_count) == exds.matrix_test.Y.get_shape()
+    assert (total_row_count, feature_count) == exds.matrix.X.shape
+    assert (total_row_count, objective_count) == exds.matrix.Y.shape
+    assert (train_row_count, feature_count) == exds.matrix_train.X.shape
+    assert (train_row_count, objective_count) == exds.matrix_train.Y.shape
+    assert (test_row_count, feature_count) == exds.matrix_test.X.shape
+    assert (test_row_count, objective_count) == exds.matrix_test.Y.shape
     assert feature_count == len(exds.matrix.column_labels_X)
     assert feature_count == len(exds.matrix_train.column_labels_X)
     assert feature_count == len(exds.matrix_test.column_labels_X)
@@ -367,7 +367,7 @@ def assertThresholdedObjectivesToRemove(exds, expected_objectives_to_remove, mat
 def compute_counts_per_feature_columns(datasetmatrix):
     # Count how many values of 1 are there on each feature column.
     computed_counts_per_feature = {}
-    row_count = datasetmatrix.X.get_shape()[0]
+    row_count = datasetmatrix.X.shape[0]
     for feature_index, feature_label in enumerate(datasetmatrix.column_labels_X):
         feature_column = datasetmatrix.get_column_X(feature_index)
         computed_counts_per_feature[feature_label] = numpy.sum(feature_column) / row_count
@@ -378,7 +378,7 @@ def compute_counts_per_feature_columns(datasetmatrix):
 def compute_counts_per_objective_columns(datasetmatrix):
     # Count how many values of 1 are there on each objective column.
     computed_counts_per_objective = {}
-    row_count = datasetmatrix.X.get_shape()[0]
+    row_count = datasetmatrix.X.shape[0]
     for objective_index, objective_label in enumerate(datasetmatrix.column_labels_Y):
         objective_column = datasetmatrix.get_column_Y(objective_index)
         computed_counts_per_objective[objective_label] = numpy.sum(objective_column) / row_count
@@ -4,6 +4,7 @@ import scipy
 from pathlib import Path
 
 import tests.utilities as testutil
+import mbtk.utilities.functions as util
 import pytest
 
 from mbtk.dataset.DatasetMatrix import DatasetMatrix
@@ -19,6 +20,79 @@ def test_saving_and_loading():
     check_saving_and_loading(dm, folder)
 
 
+def test_saving_and_loading_formats():
+    folder = testutil.ensure_empty_tmp_subfolder('test_datasetmatrix__save_load_formats')
+
+    # A sparse DatasetMatrix is saved as .npz archives of CSC components.
+    dm = DatasetMatrix('testmatrix', storage='sparse')
+    configure_default_datasetmatrix(dm)
+    check_saving_and_loading(dm, folder)
+
+    dm2 = DatasetMatrix('testmatrix', storage='sparse')
+    dm2.load(folder)
+    assert isinstance(dm2.X, scipy.sparse.csc_matrix)
+
+    # Saving the same DatasetMatrix densely replaces the .npz files.
+    dm3 = DatasetMatrix('testmatrix')
+    configure_default_datasetmatrix(dm3)
+    dm3.finalize()
+    dm3.save(folder)
+    check_datamatrix_files(folder, dm3)
+
+    dm4 = DatasetMatrix('testmatrix')
+    dm4.load(folder)
+    assert dm4.X.dtype == numpy.uint8
+    assert dm4.X.flags.f_contiguous
+    assert dm3 == dm4
+
+    # Folders saved in the legacy Matrix Market format can still be loaded.
+    for name in ["X", "Y"]:
+        (folder / 'testmatrix' / (name + ".npy")).unlink()
+        scipy.io.mmwrite(str(folder / 'testmatrix' / (name + ".mtx")), scipy.sparse.csc_matrix(dm3.get_matrix(name)))
+
+    dm5 = DatasetMatrix('testmatrix')
+    dm5.load(folder)
+    assert dm3 == dm5
+
+
+def test_loading_mapped():
+    folder = testutil.ensure_empty_tmp_subfolder('test_datasetmatrix__load_mapped')
+
+    for storage in ['sparse', 'dense']:
+        dm = DatasetMatrix('testmatrix', storage=storage)
+        configure_default_datasetmatrix(dm)
+        dm.finalize()
+        dm.save(folder)
+
+        dm2 = DatasetMatrix('testmatrix')
+        dm2.load(folder, mmap=True)
+        assert dm2.final is True
+        assert dm == dm2
+        assert type(dm2.X) is type(dm.X)
+        assert util.is_memory_mapped(dm2.X)
+        assert util.is_memory_mapped(dm2.Y)
+
+        if storage == 'sparse':
+            for array in [dm2.X.data, dm2.X.indices, dm2.X.indptr]:
+                assert util.is_memory_mapped(array)
+                assert array.flags.writeable is False
+        else:
+            assert dm2.X.flags.writeable is False
+            assert dm2.X.flags.f_contiguous
+
+        for c in range(dm.X.shape[1]):
+            assert numpy.array_equal(dm.get_column_X(c), dm2.get_column_X(c))
+        assert dm.get_values_per_column('X') == dm2.get_values_per_column('X')
+
+        # Loading without mmap reads the matrices into memory.
+        dm3 = DatasetMatrix('testmatrix', storage=storage)
+        dm3.load(folder)
+        assert not util.is_memory_mapped(dm3.X)
+        assert dm == dm3
+
+        del dm2
+
+
 def test_removing_rows():
     # Set up a simple DatasetMatrix
     dm = DatasetMatrix('testmatrix')
@@ -282,6 +356,32 @@ def test_removing_columns_Y():
     check_saving_and_loading(dm, folder)
 
 
+def test_deleting_with_masks():
+    rng = numpy.random.default_rng(42)
+    matrix = rng.integers(0, 3, (30, 50))
+    columns_to_delete = set(rng.choice(50, 20, replace=False).tolist())
+    rows_to_keep = sorted(rng.choice(30, 12, replace=False).tolist())
+
+    dm = DatasetMatrix('testmatrix')
+    dm.X = scipy.sparse.csr_matrix(matrix)
+    dm.Y = scipy.sparse.csr_matrix(matrix[:, :5])
+    dm.row_labels = ["row{}".format(r) for r in range(30)]
+    dm.column_labels_X = ["colx{}".format(c) for c in range(50)]
+    dm.column_labels_Y = ["coly{}".format(c) for c in range(5)]
+
+    # Columns to delete may be given as any collection, e.g. the keys of the
+    # dicts returned by BinaryExperimentalDataset.thresholded_columns_to_remove().
+    dm.delete_columns_X({c: None for c in columns_to_delete}.keys())
+    kept_columns = [c for c in range(50) if c not in columns_to_delete]
+    assert dm.column_labels_X == ["colx{}".format(c) for c in kept_columns]
+    assert numpy.array_equal(dm.X.toarray(), matrix[:, kept_columns])
+
+    dm.keep_rows(rows_to_keep)
+    assert dm.row_labels == ["row{}".format(r) for r in rows_to_keep]
+    assert numpy.array_equal(dm.X.toarray(), matrix[rows_to_keep][:, kept_columns])
+    assert numpy.array_equal(dm.Y.toarray(), matrix[rows_to_keep, :5])
+
+
 def test_making_variables():
     # Set up a simple DatasetMatrix
     dm = DatasetMatrix('testmatrix')
@@ -302,6 +402,91 @@ def test_making_variables():
     assert [2, 6, 10, 14] == variable.values
 
 
+def test_caching_columns():
+    dm = DatasetMatrix('testmatrix', storage='sparse')
+    configure_default_datasetmatrix(dm)
+
+    # Columns are not cached before finalizing.
+    assert dm.get_column_X(1).tolist() == [2, 6, 10, 14]
+    assert len(dm.column_cache) == 0
+
+    dm.finalize()
+    column = dm.get_column_X(1)
+    assert column.tolist() == [2, 6, 10, 14]
+    assert dm.get_column_X(1) is column
+    assert dm.get_variable('X', 1).instances() is column
+    assert dm.get_column_Y(0).tolist() == [101, 201, 301, 401]
+    assert dm.column_cache.hits == 2
+    assert dm.column_cache.misses == 2
+    with pytest.raises(ValueError):
+        column[0] = 0
+
+    # The least recently used columns are evicted once the cache is full.
+    dm.set_column_cache_size(2 * column.nbytes)
+    dm.get_column_X(1)
+    dm.get_column_X(2)
+    dm.get_column_X(3)
+    assert dm.column_cache.evictions == 2
+    assert ('X', 1) not in dm.column_cache
+    assert ('X', 2) in dm.column_cache
+    assert ('X', 3) in dm.column_cache
+
+    # Replacing a matrix invalidates the cache.
+    dm.X = default_matrix_X().tocsc() * 2
+    assert dm.get_column_X(2).tolist() == [6, 14, 22, 30]
+    assert len(dm.column_cache) == 1
+
+    dm.set_column_cache_size(0)
+    assert dm.get_column_X(0).tolist() == [2, 10, 18, 26]
+    assert len(dm.column_cache) == 0
+
+
+
+def test_dense_storage():
+    dm = DatasetMatrix('testmatrix')
+    configure_default_datasetmatrix(dm)
+    dm.finalize()
+
+    # The default matrices have no zeros and small values, so they are
+    # stored densely, with the smallest dtypes which fit their values.
+    assert isinstance(dm.X, numpy.ndarray)
+    assert dm.X.dtype == numpy.uint8
+    assert dm.X.flags.f_contiguous
+    assert dm.Y.dtype == numpy.int16
+    assert DatasetMatrix.sparse_equal(default_matrix_X(), dm.X) is True
+
+    column = dm.get_column_X(2)
+    assert column.tolist() == [3, 7, 11, 15]
+    assert column.base is dm.X
+    assert dm.get_values_per_column('X')[0] == [1, 5, 9, 13]
+    assert dm.get_variables('X', [0, 1]).encoded_instances().tolist() == [0, 5, 10, 15]
+
+    dm_rows = dm.select_rows([1, 3])
+    assert dm_rows.get_column_X(0).tolist() == [5, 13]
+    dm_columns = dm.select_columns_X([1, 3])
+    assert dm_columns.get_column_X(1).tolist() == [4, 8, 12, 16]
+    assert dm_columns.get_column_Y(1).tolist() == [102, 202, 302, 402]
+
+    # Sparse matrices with mostly zeros, or with values which do not fit the
+    # compact dtypes, remain sparse.
+    dm = DatasetMatrix('testmatrix')
+    dm.X = scipy.sparse.csr_matrix(numpy.identity(40, dtype=int))
+    dm.Y = scipy.sparse.csr_matrix(numpy.full((40, 2), 100000))
+    dm.finalize()
+    assert isinstance(dm.X, scipy.sparse.csc_matrix)
+    assert isinstance(dm.Y, scipy.sparse.csc_matrix)
+
+    # Unfinalizing restores the sparse matrices, which can be modified again.
+    dm = DatasetMatrix('testmatrix', storage='dense')
+    configure_default_datasetmatrix(dm)
+    dm.finalize()
+    dm.unfinalize()
+    dm.delete_column_X(0)
+    assert isinstance(dm.X, scipy.sparse.csr_matrix)
+    assert dm.X.toarray()[0].tolist() == [2, 3, 4]
+
+
+
 def test_getting_values_per_column():
     dm = DatasetMatrix('testmatrix')
     dm.X = scipy.sparse.csr_matrix(numpy.array([
@@ -331,6 +516,39 @@ def test_getting_values_per_column():
                              [-5, 0, 1, 2, 3]]
     assert column_values_Y == expected_col_values_Y
 
+    # The values are the same in either storage, and after finalizing they
+    # are kept in the metadata and saved along with the matrices.
+    folder = testutil.ensure_empty_tmp_subfolder('test_datasetmatrix__values_per_column')
+    for storage in ['sparse', 'dense']:
+        dm_final = DatasetMatrix('testmatrix', storage=storage)
+        dm_final.X = dm.X.copy()
+        dm_final.Y = dm.Y.copy()
+        dm_final.finalize()
+        assert 'values_per_column' not in dm_final.metadata
+        assert dm_final.get_values_per_column('X') == expected_col_values_X
+        assert dm_final.get_values_per_column('Y') == expected_col_values_Y
+        assert set(dm_final.metadata['values_per_column'].keys()) == {'X', 'Y'}
+
+        dm_final.save(folder)
+        dm_loaded = DatasetMatrix('testmatrix')
+        dm_loaded.load(folder)
+        assert set(dm_loaded.metadata['values_per_column'].keys()) == {'X', 'Y'}
+        assert dm_loaded.get_values_per_column('X') == expected_col_values_X
+        assert dm_loaded.get_values_per_column('Y') == expected_col_values_Y
+
+        # Replacing a matrix discards the values found for the old one.
+        dm_loaded.X = dm_loaded.Y
+        assert dm_loaded.get_values_per_column('X') == expected_col_values_Y
+
+    # Random matrices, compared with finding the values column by column.
+    rng = numpy.random.default_rng(42)
+    for density in [0.0, 0.05, 0.5, 1.0]:
+        matrix = scipy.sparse.random(60, 40, density=density, format='csr', random_state=rng, data_rvs=lambda n: rng.integers(-3, 4, n))
+        expected = [list(numpy.unique(matrix[:, c].toarray())) for c in range(matrix.shape[1])]
+        for m in [matrix, matrix.toarray()]:
+            (values, indptr) = DatasetMatrix.find_values_per_column(m)
+            assert [list(values[indptr[c]:indptr[c + 1]]) for c in range(matrix.shape[1])] == expected
+
 
 
 def default_matrix_X():
@@ -384,7 +602,7 @@ def check_saving_and_loading(dm, folder):
     # Finalize the DatasetMatrix and save it.
     dm.finalize()
     dm.save(Path(folder))
-    check_datamatrix_files(folder, dm.label)
+    check_datamatrix_files(folder, dm)
 
     # Load the saved data into a fresh DatasetMatrix with the same label
     # and compare with the old one.
@@ -393,13 +611,19 @@ def check_saving_and_loading(dm, folder):
     assert dm == dm2
 
 
-def check_datamatrix_files(folder, label):
-    folder = folder / label
+def check_datamatrix_files(folder, dm):
+    folder = folder / dm.label
     filelist = [f.name for f in folder.iterdir() if f.is_file()]
-    expectedfiles = ["X.mtx", "Y.mtx", "row_labels.txt", "column_labels_X.txt", "column_labels_Y.txt"]
+    expectedfiles = [matrix_filename("X", dm.X), matrix_filename("Y", dm.Y), "values_per_column_X.npz", "values_per_column_Y.npz", "row_labels.txt", "column_labels_X.txt", "column_labels_Y.txt"]
     assert set(expectedfiles) == set(filelist)
 
 
+def matrix_filename(name, matrix):
+    if scipy.sparse.issparse(matrix):
+        return name + ".npz"
+    return name + ".npy"
+
+
 def check_no_datamatrix_folder(folder, label):
     folder = folder / label
     assert folder.is_dir() is False
@@ -0,0 +1,136 @@
+import itertools
+
+import numpy
+
+from mbtk.math.PMF import PMF, OmegaPMF, OmegaCPMF
+import mbtk.math.G_test__unoptimized
+import mbtk.math.DoFCalculators as DoFCalculators
+
+
+def test_CachedStructuralDoF_pairwise_DoFs(ds_lc_repaired_8e3):
+    """
+    This test ensures that the pairwise DoFs computed by CachedStructuralDoF
+    from a single joint PMF are the same as the DoFs computed by
+    StructuralDoF for each pair of variables, conditioned on the rest.
+    """
+    ds = ds_lc_repaired_8e3
+    G_test = make_G_test(ds, DoFCalculators.CachedStructuralDoF)
+    cached_sdof = G_test.DoF_calculator
+    sdof = DoFCalculators.StructuralDoF(G_test)
+
+    for variableIDs in [[0, 1], [2, 4, 7], [1, 3, 5, 6], [0, 2, 3, 6, 7]]:
+        pmf = PMF(ds.datasetmatrix.get_variables('X', variableIDs))
+        cached_sdof.cache_DoFs_for_pmf(pmf)
+        (variables, pairwise_dofs) = cached_sdof.DoF_cache[frozenset(variableIDs)]
+        assert isinstance(pairwise_dofs, numpy.ndarray)
+        assert pairwise_dofs.shape == (len(variableIDs), len(variableIDs))
+
+        for (X, Y) in itertools.permutations(variableIDs, 2):
+            Z = [z for z in variableIDs if z != X and z != Y]
+            expected_DoF = calculate_StructuralDoF(ds, G_test, sdof, X, Y, Z)
+            assert cached_sdof.calculate_DoF(X, Y, Z) == expected_DoF
+
+
+
+def test_pairwise_structural_DoFs():
+    """
+    This test ensures that the pairwise DoFs calculated for all the pairs at
+    once are the same as those calculated for each pair separately.
+    """
+    rng = numpy.random.default_rng(42)
+    for keysize in [2, 3, 5]:
+        key_matrix = numpy.unique(rng.integers(0, 3, size=(100, keysize)), axis=0)
+        key_matrix = DoFCalculators.encode_columns(key_matrix)
+        pairwise_dofs = DoFCalculators.pairwise_structural_DoFs(key_matrix)
+
+        for (ix, iy) in itertools.combinations(range(keysize), 2):
+            (X_val, Y_val) = DoFCalculators.count_distinct_values_per_z(key_matrix, ix, iy)
+            expected_DoF = DoFCalculators.structural_DoF(X_val, Y_val)
+            assert pairwise_dofs[ix, iy] == expected_DoF
+            assert pairwise_dofs[iy, ix] == expected_DoF
+
+    # Keys too wide for mixed-radix codes are left to be counted pair by pair.
+    key_matrix = numpy.ones((2, 70), dtype=numpy.int64)
+    key_matrix[0, :] = 0
+    assert DoFCalculators.pairwise_structural_DoFs(key_matrix) is None
+
+
+
+def test_CachedStructuralDoF_converts_older_cache_entries(ds_lc_repaired_8e3):
+    ds = ds_lc_repaired_8e3
+    G_test = make_G_test(ds, DoFCalculators.CachedStructuralDoF)
+    cached_sdof = G_test.DoF_calculator
+
+    cached_sdof.DoF_cache[frozenset([3, 1, 2])] = ([3, 1, 2], {
+        (0, 1): 2, (1, 0): 2,
+        (0, 2): 3, (2, 0): 3,
+        (1, 2): 4, (2, 1): 4,
+    })
+    cached_sdof.convert_DoF_cache_entries()
+
+    (variables, pairwise_dofs) = cached_sdof.DoF_cache[frozenset([1, 2, 3])]
+    assert variables == [3, 1, 2]
+    assert isinstance(pairwise_dofs, numpy.ndarray)
+    assert cached_sdof.calculate_DoF(3, 1, [2]) == 2
+    assert cached_sdof.calculate_DoF(2, 3, [1]) == 3
+    assert cached_sdof.calculate_DoF(1, 2, [3]) == 4
+
+
+
+def test_StructuralDoF_from_distinct_values(ds_lc_repaired_8e3):
+    """
+    This test ensures that StructuralDoF calculates the same DoF from the
+    counts of distinct values per z as from the CPMFs.
+    """
+    ds = ds_lc_repaired_8e3
+    G_test = make_G_test(ds, DoFCalculators.StructuralDoF)
+    sdof = G_test.DoF_calculator
+
+    for (X, Y, Z) in [(0, 1, []), (2, 4, [7]), (1, 3, [5, 6]), (0, 7, [2, 3, 6])]:
+        sdof.reset()
+        expected_DoF = calculate_StructuralDoF(ds, G_test, sdof, X, Y, Z)
+
+        sdof.reset()
+        assert sdof.required_context(X, Y, Z) == {'distinct_values'}
+        G_test.provide_DoF_context({'distinct_values'}, X, Y, Z, None)
+        assert sdof.calculate_DoF(X, Y, Z) == expected_DoF
+
+
+
+def test_required_context(ds_lc_repaired_8e3):
+    ds = ds_lc_repaired_8e3
+
+    udof = make_G_test(ds, DoFCalculators.UnadjustedDoF).DoF_calculator
+    assert udof.required_context(0, 1, [2]) == set()
+
+    G_test = make_G_test(ds, DoFCalculators.CachedStructuralDoF)
+    cached_sdof = G_test.DoF_calculator
+    assert cached_sdof.required_context(0, 1, [2]) == {'pmfs'}
+    G_test.conditionally_independent(0, 1, [2])
+    assert cached_sdof.required_context(0, 1, [2]) == set()
+    assert cached_sdof.required_context(2, 0, [1]) == set()
+    assert cached_sdof.required_context(0, 1, [3]) == {'pmfs'}
+
+
+
+def calculate_StructuralDoF(ds, G_test, sdof, X, Y, Z):
+    (VarX, VarY, VarZ) = G_test.load_variables(X, Y, Z)
+    if len(Z) == 0:
+        PrZ = OmegaPMF()
+        PrXcZ = OmegaCPMF(PMF(VarX))
+        PrYcZ = OmegaCPMF(PMF(VarY))
+    else:
+        PrZ = PMF(VarZ)
+        PrXcZ = PMF(ds.datasetmatrix.get_variables('X', [X] + Z)).condition_on(PrZ)
+        PrYcZ = PMF(ds.datasetmatrix.get_variables('X', [Y] + Z)).condition_on(PrZ)
+    sdof.set_context_cpmfs(None, PrXcZ, PrYcZ, PrZ)
+    return sdof.calculate_DoF(X, Y, Z)
+
+
+
+def make_G_test(ds, dof_class):
+    parameters = dict()
+    parameters['ci_test_significance'] = 0.95
+    parameters['omega'] = ds.omega
+    parameters['ci_test_dof_calculator_class'] = dof_class
+    return mbtk.math.G_test__unoptimized.G_test(ds.datasetmatrix, parameters)
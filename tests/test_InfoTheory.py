@@ -1,7 +1,8 @@
 import numpy
 
 import mbtk.math.infotheory as infotheory
-from mbtk.math.Variable import Variable
+from mbtk.math.Variable import Variable, JointVariables
+from mbtk.math.PMF import PMF, ArrayPMF
 
 
 def almostEqual(x: float, y: float) -> bool:
@@ -80,3 +81,98 @@ def test_MI__binary() -> None:
     expected_MI = 1
     calculated_MI = infotheory.mutual_information(*infotheory.calculate_pmf_for_mi(X, Y))
     assert almostEqual(expected_MI, calculated_MI)
+
+
+
+def test_MI_and_cMI__counts() -> None:
+    # The vectorized calculations over codes and counts must agree with the
+    # calculations over PMFs.
+    rng = numpy.random.default_rng(7)
+    x = rng.integers(0, 3, 400)
+    y = rng.integers(0, 4, 400)
+    z = rng.integers(0, 2, 400)
+    w = (x + rng.integers(0, 2, 400)) % 3
+
+    X = Variable(x)
+    Y = Variable(y)
+    Z = Variable(z)
+    W = Variable(w)
+    X.ID, Y.ID, Z.ID, W.ID = (1, 2, 3, 4)
+
+    expected_MI = infotheory.mutual_information(*infotheory.calculate_pmf_for_mi(X, W))
+    assert almostEqual(expected_MI, infotheory.mutual_information__counts(x, w))
+
+    # Counting repeated rows beforehand gives the same result.
+    (rows, counts) = numpy.unique(numpy.column_stack([x, w]), axis=0, return_counts=True)
+    assert almostEqual(expected_MI, infotheory.mutual_information__counts(rows[:, 0], rows[:, 1], counts))
+
+    expected_cMI = infotheory.conditional_mutual_information(*infotheory.calculate_pmf_for_cmi(X, Y, Z))
+    calculated_cMI = infotheory.conditional_mutual_information__counts(x, y, z, base=2)
+    assert almostEqual(expected_cMI, calculated_cMI)
+
+    expected_cMI = infotheory.conditional_mutual_information(*infotheory.calculate_pmf_for_cmi(X, W, Z), base='e')
+    calculated_cMI = infotheory.conditional_mutual_information__counts(x, w, z, base='e')
+    assert almostEqual(expected_cMI, calculated_cMI)
+    assert calculated_cMI > 0
+
+    assert infotheory.conditional_mutual_information__counts(x[:0], y[:0], z[:0]) == 0
+
+
+
+def test_cMI__joint() -> None:
+    rng = numpy.random.default_rng(11)
+    X = Variable(rng.integers(0, 3, 300))
+    Y = Variable(rng.integers(0, 2, 300))
+    Z = Variable(rng.integers(0, 3, 300))
+    X.ID, Y.ID, Z.ID = (1, 2, 3)
+
+    expected_cMI = infotheory.conditional_mutual_information(*infotheory.calculate_pmf_for_cmi(X, Y, Z))
+
+    # The positions of X and Y in the keys of the joint PMF are arbitrary.
+    PrZXY = PMF(JointVariables(Z, X, Y))
+    assert almostEqual(expected_cMI, infotheory.conditional_mutual_information__joint(PrZXY, [1], [2]))
+    PrXYZ = ArrayPMF(JointVariables(X, Y, Z))
+    assert almostEqual(expected_cMI, infotheory.conditional_mutual_information__joint(PrXYZ, [0], [1]))
+
+    # Without any other positions, the joint PMF gives I(X;Y).
+    expected_MI = infotheory.mutual_information(*infotheory.calculate_pmf_for_mi(X, Y))
+    PrXY = PMF(JointVariables(X, Y))
+    assert almostEqual(expected_MI, infotheory.conditional_mutual_information__joint(PrXY, [0], [1]))
+
+
+
+def test_MI_and_cMI__given_marginals() -> None:
+    # The PMF-based calculations use the marginal PMFs they are given, even
+    # if those are not the marginals of the joint PMF, and accept the tuple
+    # keys of JointVariables.
+    rng = numpy.random.default_rng(5)
+    X = JointVariables(Variable(rng.choice(['a', 'b'], 200)), Variable(rng.integers(0, 2, 200)))
+    Y = Variable(rng.integers(0, 3, 200))
+    Z = Variable(rng.choice(['u', 'v'], 200))
+    Y.ID, Z.ID = (3, 4)
+    X.variables[0].ID, X.variables[1].ID = (1, 2)
+
+    (PrXY, PrX, PrY) = infotheory.calculate_pmf_for_mi(X, Y)
+    for key in PrX.keys():
+        PrX.probabilities[key] = 1 / len(PrX)
+
+    expected_MI = 0.0
+    for (x, px) in PrX.items():
+        for (y, py) in PrY.items():
+            pxy = PrXY.p(x, y)
+            if pxy != 0:
+                expected_MI += pxy * numpy.log2(pxy / (px * py))
+    assert almostEqual(expected_MI, infotheory.mutual_information(PrXY, PrX, PrY))
+
+    (PrXYcZ, PrXcZ, PrYcZ, PrZ) = infotheory.calculate_pmf_for_cmi(X, Y, Z)
+    PrZ.probabilities['u'] = 0.25
+    PrZ.probabilities['v'] = 0.75
+
+    expected_cMI = 0.0
+    for (z, pz) in PrZ.items():
+        for (x, pxcz) in PrXcZ.given(z).items():
+            for (y, pycz) in PrYcZ.given(z).items():
+                pxycz = PrXYcZ.given(z).p(x, y)
+                if pxycz != 0:
+                    expected_cMI += pz * pxycz * numpy.log2(pxycz / (pxcz * pycz))
+    assert almostEqual(expected_cMI, infotheory.conditional_mutual_information(PrXYcZ, PrXcZ, PrYcZ, PrZ))
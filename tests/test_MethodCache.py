@@ -0,0 +1,43 @@
+from mbtk.structures.MethodCache import MethodCache
+
+
+def test_method_cache__lru_eviction():
+    cache = MethodCache(2)
+    computed = []
+
+    def compute(key):
+        return lambda: computed.append(key) or key * 10
+
+    assert cache.get(1, compute(1)) == 10
+    assert cache.get(2, compute(2)) == 20
+    assert cache.get(1, compute(1)) == 10
+    assert computed == [1, 2]
+
+    # Key 2 is now the least recently used, so it is evicted.
+    assert cache.get(3, compute(3)) == 30
+    assert 1 in cache
+    assert 2 not in cache
+    assert 3 in cache
+    assert cache.statistics() == {'hits': 1, 'misses': 3, 'evictions': 1, 'entries': 2, 'max_entries': 2}
+
+    cache.resize(1)
+    assert list(cache.entries.keys()) == [3]
+    assert cache.evictions == 2
+
+    cache.invalidate(3)
+    assert len(cache) == 0
+
+
+
+def test_method_cache__unbounded_and_disabled():
+    cache = MethodCache()
+    cache.update({i: i for i in range(1000)})
+    assert len(cache) == 1000
+    assert cache.hits == 0
+    assert cache.misses == 0
+
+    cache = MethodCache(0)
+    assert cache.get('a', lambda: 1) == 1
+    assert cache.get('a', lambda: 2) == 2
+    assert len(cache) == 0
+    assert cache.misses == 2
@@ -1,5 +1,6 @@
 import numpy
 import scipy
+import pytest
 
 import tests.utilities as testutil
 
@@ -96,6 +97,37 @@ def test_generating_the_datasetmatrix__binary():
 
 
 
+def test_streaming_matches_documents():
+    source = RCV1v2DatasetSource(default_configuration())
+    for industry in ['FNG', 'ART', 'ENGN']:
+        documentIDs = source.read_documentIDs_in_industry(industry)
+        documents = source.read_documents(documentIDs)
+        words = source.gather_complete_word_list(documents)
+        topics = source.gather_complete_topic_list(documents)
+
+        for feature_type in ['wordcount', 'binary']:
+            (dok_words, dok_topics) = source.create_dok_matrices(documents, documentIDs, words, topics, feature_type)
+
+            (matrix_words, streamed_words) = source.read_document_term_matrix(documentIDs, feature_type)
+            assert isinstance(matrix_words, scipy.sparse.csr_matrix)
+            assert matrix_words.has_sorted_indices
+            assert streamed_words == words
+            assert DatasetMatrix.sparse_equal(dok_words.tocsr(), matrix_words) is True
+
+        (matrix_topics, streamed_topics) = source.read_document_topic_matrix(documentIDs)
+        assert streamed_topics == topics
+        assert DatasetMatrix.sparse_equal(dok_topics.tocsr(), matrix_topics) is True
+
+    # The rows follow the order of the requested documents, not of the file.
+    (matrix_words, words) = source.read_document_term_matrix([302, 101], 'wordcount')
+    assert matrix_words[0, words.index('dopamine')] == 9
+    assert matrix_words[1, words.index('dopamine')] == 0
+
+    with pytest.raises(ValueError):
+        source.read_document_term_matrix([101, 999], 'wordcount')
+
+
+
 def default_configuration():
     configuration = {
         'sourcepath': testutil.test_folder / 'rcv1v2_test_dataset',
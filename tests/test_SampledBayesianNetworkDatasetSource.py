@@ -3,7 +3,9 @@ import random
 import pytest
 
 import tests.utilities as testutil
+import mbtk.utilities.functions as util
 
+from mbtk.dataset.DatasetMatrix import DatasetMatrix
 from mbtk.structures.BayesianNetwork import BayesianNetwork
 from mbtk.dataset.sources.SampledBayesianNetworkDatasetSource import SampledBayesianNetworkDatasetSource
 
@@ -72,6 +74,69 @@ def test_sampling_bayesian_network_as_dataset_source__exact():
 
 
 
+def test_sampling_bayesian_network_as_dataset_source__random_blocks():
+    configuration = default_configuration()
+    configuration['method'] = 'random_blocks'
+    configuration['sample_count'] = 5000
+    configuration['sampling_block_size'] = 1200
+
+    bayesian_network = BayesianNetwork.from_bif_file(configuration['sourcepath'], use_cache=False)
+    bayesian_network.finalize()
+    sample_matrix = bayesian_network.sample_matrix_in_blocks(5000, configuration['random_seed'], block_size=1200)
+
+    sbnds = SampledBayesianNetworkDatasetSource(configuration)
+    datasetmatrix_serial = sbnds.create_dataset_matrix('test_sbnds')
+
+    configuration['sampling_workers'] = 2
+    sbnds = SampledBayesianNetworkDatasetSource(configuration)
+    datasetmatrix_parallel = sbnds.create_dataset_matrix('test_sbnds')
+
+    assert ['AGE', 'EDU', 'OCC', 'SEX'] == datasetmatrix_serial.column_labels_X
+    assert ['R', 'TRN'] == datasetmatrix_serial.column_labels_Y
+    assert (datasetmatrix_serial.X != datasetmatrix_parallel.X).nnz == 0
+    assert (datasetmatrix_serial.Y != datasetmatrix_parallel.Y).nnz == 0
+
+    assert numpy.array_equal(sample_matrix[:, 0], datasetmatrix_serial.get_column_X(0)) is True
+    assert numpy.array_equal(sample_matrix[:, 4], datasetmatrix_serial.get_column_X(3)) is True
+    assert numpy.array_equal(sample_matrix[:, 5], datasetmatrix_serial.get_column_Y(1)) is True
+
+
+
+def test_sampling_bayesian_network_as_dataset_source__streaming():
+    configuration = default_configuration()
+    configuration['method'] = 'random_blocks'
+    configuration['sample_count'] = 5000
+    configuration['sampling_block_size'] = 1200
+
+    sbnds = SampledBayesianNetworkDatasetSource(configuration)
+    datasetmatrix_in_memory = sbnds.create_dataset_matrix('test_sbnds_streaming')
+    datasetmatrix_in_memory.finalize()
+
+    configuration['stream_folder'] = testutil.ensure_empty_tmp_subfolder('test_sbnds_streaming')
+    configuration['sampling_workers'] = 2
+    sbnds = SampledBayesianNetworkDatasetSource(configuration)
+    datasetmatrix = sbnds.create_dataset_matrix('test_sbnds_streaming')
+
+    assert datasetmatrix.final is True
+    assert util.is_memory_mapped(datasetmatrix.X) is True
+    assert util.is_memory_mapped(datasetmatrix.Y) is True
+    assert datasetmatrix.X.flags.f_contiguous is True
+    assert (configuration['stream_folder'] / 'test_sbnds_streaming' / 'X.npy').exists()
+
+    assert ['AGE', 'EDU', 'OCC', 'SEX'] == datasetmatrix.column_labels_X
+    assert ['R', 'TRN'] == datasetmatrix.column_labels_Y
+    assert datasetmatrix_in_memory.row_labels == datasetmatrix.row_labels
+    assert numpy.array_equal(datasetmatrix_in_memory.X, datasetmatrix.X)
+    assert numpy.array_equal(datasetmatrix_in_memory.Y, datasetmatrix.Y)
+
+    for matrix_label in ['X', 'Y']:
+        expected_values = DatasetMatrix.find_values_per_column(datasetmatrix.get_matrix(matrix_label))
+        (values, indptr) = datasetmatrix.get_values_per_column_arrays(matrix_label)
+        assert numpy.array_equal(expected_values[0], values)
+        assert numpy.array_equal(expected_values[1], indptr)
+
+
+
 def default_configuration():
     configuration = {}
     configuration['sourcepath'] = testutil.bif_folder / 'survey.bif'
@@ -0,0 +1,94 @@
+import multiprocessing
+
+import pytest
+
+import tests.utilities as testutil
+from mbtk.structures.SharedJHT import SharedJHT
+
+
+def test_storing_and_reading_entropy_terms():
+    folder = testutil.ensure_empty_tmp_subfolder('test_shared_jht__basic')
+    jht = SharedJHT(folder / 'jht.shm', capacity=16, key_width=4)
+
+    with pytest.raises(KeyError):
+        jht[frozenset([1, 2])]
+
+    jht[frozenset([1, 2])] = 0.5
+    jht[frozenset([3])] = 1.25
+    assert jht[frozenset([2, 1])] == 0.5
+    assert jht[frozenset([3])] == 1.25
+    assert frozenset([1, 2, 3]) not in jht
+    assert len(jht) == 2
+
+    # Keys wider than the key width are kept locally.
+    wide_key = frozenset([1, 2, 3, 4, 5])
+    jht[wide_key] = 2.0
+    assert jht[wide_key] == 2.0
+    assert len(jht.local_entries) == 1
+
+    assert jht.reads == 4
+    assert jht.hits == 3
+    assert jht.misses == 1
+    assert jht.publications == 2
+
+    expected_snapshot = {
+        frozenset([1, 2]): 0.5,
+        frozenset([3]): 1.25,
+        wide_key: 2.0,
+    }
+    assert jht.snapshot() == expected_snapshot
+    jht.close()
+
+    # Attaching to an existing table adopts its layout and contents.
+    jht = SharedJHT(folder / 'jht.shm', capacity=1024, key_width=8)
+    assert jht.capacity == 16
+    assert jht.key_width == 4
+    assert jht[frozenset([1, 2])] == 0.5
+    assert wide_key not in jht
+    jht.close()
+
+
+
+def test_full_table_overflows_locally():
+    folder = testutil.ensure_empty_tmp_subfolder('test_shared_jht__full')
+    jht = SharedJHT(folder / 'jht.shm', capacity=4, key_width=2)
+
+    for i in range(6):
+        jht[frozenset([i])] = float(i)
+
+    assert jht.publications == 4
+    assert len(jht.local_entries) == 2
+    for i in range(6):
+        assert jht[frozenset([i])] == float(i)
+    jht.close()
+
+
+
+def test_sharing_entropy_terms_across_processes():
+    folder = testutil.ensure_empty_tmp_subfolder('test_shared_jht__processes')
+    path = folder / 'jht.shm'
+
+    workers = [
+        multiprocessing.Process(target=publish_entropy_terms, args=(path, worker))
+        for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    jht = SharedJHT(path)
+    assert len(jht) == 4 * 50
+    for worker in range(4):
+        for i in range(50):
+            assert jht[frozenset([worker, 100 + i])] == worker + i / 100
+    assert jht.misses == 0
+    jht.close()
+
+
+
+def publish_entropy_terms(path, worker):
+    jht = SharedJHT(path, capacity=1024)
+    for i in range(50):
+        jht[frozenset([worker, 100 + i])] = worker + i / 100
+    jht.close()
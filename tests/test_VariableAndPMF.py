@@ -1,11 +1,12 @@
 import math
 import numpy
+from collections import Counter
 
 import tests.utilities as testutil
 import pytest
 
 from mbtk.math.Variable import Variable, JointVariables
-from mbtk.math.PMF import PMF, CPMF, process_pmf_key
+from mbtk.math.PMF import PMF, CPMF, ArrayPMF, ArrayCPMF, process_pmf_key, canonical_key
 from mbtk.structures.BayesianNetwork import BayesianNetwork
 from mbtk.math.Exceptions import VariableInstancesOfUnequalCount
 from mbtk.dataset.sources.SampledBayesianNetworkDatasetSource import SampledBayesianNetworkDatasetSource
@@ -91,6 +92,63 @@ def test_joint_variables_pmf():
 
 
 
+def test_joint_variables_encoded_instances():
+    V0 = Variable(numpy.array([5, 7, 7, 5, 9, 9]))
+    V1 = Variable(numpy.array([1, 0, 1, 1, 0, 0]))
+    V0.ID = 0
+    V1.ID = 1
+
+    assert V0.encoded_instances().tolist() == [0, 1, 1, 0, 2, 2]
+    assert [values.tolist() for values in V0.encoding_values()] == [[5, 7, 9]]
+
+    V01 = JointVariables(V0, V1)
+    encoded_instances = V01.encoded_instances()
+    assert encoded_instances.dtype == numpy.int64
+    assert encoded_instances.tolist() == [1, 2, 3, 1, 4, 4]
+    value_arrays = V01.encoding_values()
+    decoded_instances = [
+        tuple(values[index] for (values, index) in zip(value_arrays, indices))
+        for indices in zip(*numpy.unravel_index(encoded_instances, (3, 2)))]
+    assert decoded_instances == list(V01.instances())
+
+    # The joint PMF is counted from the encoded instances, and its keys are
+    # decoded only when needed.
+    PrV01 = PMF(V01)
+    assert PrV01.encoded_counts is not None
+    assert len(PrV01) == 4
+    assert PrV01.encoded_counts is None
+    assert PrV01.value_counts == Counter(V01.instances())
+    assert PrV01.p(5, 1) == 2 / 6
+    assert PrV01.p(9, 0) == 2 / 6
+    assert PrV01.p(9, 1) == 0
+
+
+
+def test_joint_pmf_too_wide_to_encode():
+    # 70 variables are more than numpy.ravel_multi_index() accepts, and 30
+    # variables of 5 values have more than 2**63 possible joint values, so
+    # their PMFs are counted from the tuples of their instances instead.
+    for (variable_count, value_count) in [(70, 2), (30, 5)]:
+        variables = []
+        for i in range(variable_count):
+            variable = Variable(numpy.arange(value_count * 2) % value_count)
+            variable.ID = i
+            variables.append(variable)
+
+        joint = JointVariables(*variables)
+        assert joint.has_array_instances()
+        assert not joint.has_encodable_instances()
+
+        PrJoint = PMF(joint)
+        assert len(PrJoint) == value_count
+        assert PrJoint.value_counts == Counter(joint.instances())
+        assert PrJoint.p(tuple([1] * variable_count)) == 2 / (value_count * 2)
+
+        with pytest.raises(ValueError):
+            ArrayPMF(joint)
+
+
+
 def test_pmf_expected_values():
     animals = Variable(['cat', 'dog', 'cat', 'mouse', 'dog', 'cat', 'cat', 'dog'])
     PrAnimals = PMF(animals)
@@ -398,6 +456,37 @@ def test_pmf_key_processing():
     assert expected == process_pmf_key(key)
 
 
+    assert () == process_pmf_key(())
+    assert () == process_pmf_key(((),))
+    assert 3 == process_pmf_key(((3,),))
+    assert (0, 1) == process_pmf_key(((0, 1),))
+
+
+
+def test_pmf_lookups_of_canonical_keys():
+    V0 = Variable([0, 1, 1, 1, 0, 1, 0, 1])
+    V1 = Variable([0, 0, 1, 1, 0, 1, 1, 1])
+    V2 = Variable([0, 0, 0, 0, 1, 0, 1, 1])
+    V0.ID, V1.ID, V2.ID = (0, 1, 2)
+
+    for (pmf_class, cpmf_class) in [(PMF, CPMF), (ArrayPMF, ArrayCPMF)]:
+        Pr = pmf_class(JointVariables(V0, V1, V2))
+        for key in Pr.keys():
+            assert Pr.p_key(key) == Pr.p(key)
+        assert Pr.p_key(canonical_key(1, (1, 0))) == Pr.p(1, 1, 0) == 3 / 8
+        assert Pr.p_key(canonical_key([(0, 1), 1])) == Pr.p(0, 1, 1) == 1 / 8
+        assert Pr.p_key((1, 0, 1)) == 0
+
+        PrV0 = pmf_class(V0)
+        assert PrV0.p_key(canonical_key((1,))) == PrV0.p(1) == 5 / 8
+
+        PrV0cV12 = cpmf_class(V0, JointVariables(V1, V2))
+        for key in PrV0cV12.keys():
+            assert PrV0cV12.given_key(key) == PrV0cV12.given(key)
+        assert PrV0cV12.given_key(canonical_key(1, 0)).p_key(1) == 1.0
+        assert len(PrV0cV12.given_key((0, 2))) == 0
+
+
 
 def test_joint_variables__unequal_numbers_of_instances():
     # Variable animals has 6 instances.
@@ -0,0 +1,86 @@
+import itertools
+
+import numpy
+
+from mbtk.math.VariableElimination import Factor, VariableElimination
+
+
+delta = 1e-12
+
+
+def test_marginals_equal_summed_joint__lc_repaired(bn_lc_repaired):
+    bn = bn_lc_repaired
+    full_joint_pmf = bn.create_joint_pmf()
+
+    for size in [1, 2, 3]:
+        for variables in itertools.combinations(bn.variable_IDs, size):
+            expected_pmf = full_joint_pmf
+            for variable in set(bn.variable_IDs) - set(variables):
+                expected_pmf = expected_pmf.sum_over(variable)
+
+            marginal_pmf = bn.create_partial_joint_pmf(variables)
+            assert marginal_pmf.IDs() == variables
+            assert set(marginal_pmf.keys()) == set(expected_pmf.keys())
+            for key, p in marginal_pmf.items():
+                assert abs(expected_pmf.p(key) - p) < delta
+
+
+
+def test_marginals__alarm(bn_alarm):
+    bn = bn_alarm
+    CO = bn.variable_nodes_index('CO')
+    PCWP = bn.variable_nodes_index('PCWP')
+    HR = bn.variable_nodes_index('HR')
+
+    # The ancestral subnetwork of CO and PCWP has 25 variables, too many to
+    # enumerate its full joint PMF.
+    engine = VariableElimination(bn)
+    joint = engine.marginal((PCWP, CO))
+    assert joint.table.shape == (3, 3)
+    assert abs(joint.table.sum() - 1) < delta
+    assert engine.factor_cache.misses > 0
+    assert engine.factor_cache.hits == 0
+
+    marginal_CO = engine.marginal((CO,))
+    assert numpy.allclose(joint.aligned_table((CO, PCWP)).sum(axis=1), marginal_CO.table, rtol=0, atol=delta)
+
+    # Querying CO and HR eliminates the same ancestors of CO and HR as
+    # before, from the same factors, so the cached factors are reused.
+    misses = engine.factor_cache.misses
+    engine.marginal((CO, HR))
+    assert engine.factor_cache.hits > 0
+    assert engine.factor_cache.misses == misses
+
+
+
+def test_factor_product_and_sum_out():
+    A = Factor((3,), numpy.array([0.4, 0.6]))
+    BgA = Factor((5, 3), numpy.array([[0.1, 0.2], [0.9, 0.8]]))
+
+    AB = A.product(BgA)
+    assert AB.variables == (3, 5)
+    assert numpy.allclose(AB.table, [[0.04, 0.36], [0.12, 0.48]])
+
+    B = AB.sum_out(3)
+    assert B.variables == (5,)
+    assert numpy.allclose(B.table, [0.16, 0.84])
+
+    pmf = AB.as_pmf()
+    assert pmf.IDs() == (3, 5)
+    assert abs(pmf.p((1, 0)) - 0.12) < delta
+    assert abs(B.as_pmf().p(1) - 0.84) < delta
+
+
+
+def test_elimination_order__min_fill(bn_survey):
+    engine = VariableElimination(bn_survey)
+
+    # A star: eliminating the centre first would connect all its neighbours,
+    # while eliminating the leaves adds no edges.
+    factors = [
+        Factor((0, 1), numpy.ones((2, 2))),
+        Factor((0, 2), numpy.ones((2, 2))),
+        Factor((0, 3), numpy.ones((2, 2))),
+    ]
+    order = engine.elimination_order(factors, {0, 1, 2})
+    assert order == [1, 2, 0]